@@ -1,15 +1,49 @@
 from __future__ import annotations
+import asyncio
+import heapq
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
-from queue import Queue
-from typing import List
+from collections import OrderedDict
+from concurrent.futures import Future
+from queue import Empty, Queue
+from typing import Callable, List, Optional
 
 import gnmi_pb2
 
 log = logging.getLogger('confd_gnmi_adapter')
 
+# ChangeBuffer overflow policies
+# drop the oldest buffered change
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+# drop all buffered changes and send new sample
+OVERFLOW_RESYNC = "resync"
+# drop all buffered changes and finish subscription
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = [OVERFLOW_DROP_OLDEST, OVERFLOW_RESYNC,
+                     OVERFLOW_DISCONNECT]
+# max. number of (coalesced) changes buffered for one subscriber
+CHANGE_BUFFER_SIZE = 10000
+CHANGE_BUFFER_OVERFLOW = OVERFLOW_RESYNC
+# max. time (in seconds) changes wait for more changes to be sent together
+# (0 - changes are sent immediately)
+BATCH_MAX_LATENCY = 0.0
+# max. number of changes sent together (batch is sent without waiting
+# for `BATCH_MAX_LATENCY`)
+BATCH_MAX_SIZE = 1000
+# min. sample interval (in seconds) of SAMPLE subscriptions, also used
+# if subscription does not set `sample_interval`
+MIN_SAMPLE_INTERVAL = 1.0
+# max. number of updates (and deletes) in one subscription notification
+# (bigger sample is split, 0 - no limit)
+MAX_NOTIFICATION_UPDATES = 10000
+# max. size (in bytes) of updates in one subscription notification
+# (keep below gRPC max. message size 4MB, 0 - no limit)
+MAX_NOTIFICATION_BYTES = 1024 * 1024
+
 
 class GnmiServerAdapter(ABC):
     @dataclass
@@ -19,6 +53,19 @@ class GnmiServerAdapter(ABC):
         version: str
         schema: str = ""
 
+    def is_healthy(self) -> bool:
+        """
+        Check if adapter can still be used (e.g. connection is alive).
+        Used by AdapterPool before adapter is reused.
+        """
+        return True
+
+    def close(self):
+        """
+        Release resources held by adapter (e.g. when evicted from AdapterPool).
+        """
+        pass
+
     @abstractmethod
     def capabilities(self):
         """
@@ -34,14 +81,25 @@ class GnmiServerAdapter(ABC):
         """
         pass
 
+    def capabilities_version(self):
+        """
+        Return version of `capabilities()` and `encodings()` - it must change
+        whenever they change. Servicer reuses CapabilityResponse while
+        the version is the same.
+        :return: hashable version or None (response is not cached)
+        """
+        return None
+
     @abstractmethod
-    def get(self, prefix, paths, data_type, use_models):
+    def get(self, prefix, paths, data_type, use_models,
+            encoding=gnmi_pb2.Encoding.JSON_IETF):
         """
         Invoke get operation on adapter and return list of notifications
         :param prefix:  gnmi_pb2.Path with prefix for all paths
         :param paths: list of gnmi_pb2.Path elements to get data subtrees
         :param data_type: gnmi_pb2.DataType (ALL, CONFIG, STATE, OPERATIONAL)
         :param use_models: list of gnmi_pb2.ModelData  elements to use
+        :param encoding: gnmi_pb2.Encoding of values (one of `encodings()`)
         :return: list of gnmi_pb2.Notification were
                   prefix - is prefix
                   updated - list of gnmi_pb2.Update elements (one for each path)
@@ -76,19 +134,119 @@ class GnmiServerAdapter(ABC):
         """
         pass
 
+    def set_request(self, prefix, delete, replace, update):
+        """
+        Apply all operations of one gNMI SetRequest - deletes, then replaces,
+        then updates (gNMI Specification Section 3.4.3).
+        Adapters should override this to apply all operations in one
+        transaction; this default implementation uses `delete` and `set`
+        (replace is processed as update).
+        :param prefix: gNMI path prefix
+        :param delete: list of gNMI paths to delete
+        :param replace: gNMI updates (with path and val) to be replaced
+        :param update: gNMI updates (with path and val) to be set
+        :return: list of (path, gNMI UpdateResult operation)
+        """
+        ops = self.delete(prefix, delete) if delete else []
+        if replace:
+            ops += [(path, gnmi_pb2.UpdateResult.REPLACE)
+                    for path, _op in self.set(prefix, replace)]
+        if update:
+            ops += self.set(prefix, update)
+        return ops
+
     class SubscriptionHandler(ABC):
 
         class SubscriptionEvent(Enum):
             SAMPLE = 0
             SEND_CHANGES = 1
+            TIMEOUT = 2
+            SAMPLE_DUE = 3
             FINISH = 10
 
+        @dataclass
+        class EventWait:
+            """
+            Yielded by the read loop (see `_read_loop`) when it needs next
+            event from `read_queue`.
+            """
+            timeout: Optional[float] = None
+
+        class AsyncEventQueue:
+            """
+            Event queue used by `read_async`.
+            Events can be put from any thread, `get` must be awaited
+            in the event loop the queue belongs to.
+            """
+
+            def __init__(self, loop):
+                self.loop = loop
+                self.queue = asyncio.Queue()
+
+            def put(self, event):
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+            async def get(self):
+                return await self.queue.get()
+
+        change_buffer_size: int = CHANGE_BUFFER_SIZE
+        change_buffer_overflow: str = CHANGE_BUFFER_OVERFLOW
+        batch_max_latency: float = BATCH_MAX_LATENCY
+        batch_max_size: int = BATCH_MAX_SIZE
+        min_sample_interval: float = MIN_SAMPLE_INTERVAL
+        max_notification_updates: int = MAX_NOTIFICATION_UPDATES
+        max_notification_bytes: int = MAX_NOTIFICATION_BYTES
+
+        @staticmethod
+        def set_change_buffer_size(size):
+            GnmiServerAdapter.SubscriptionHandler.change_buffer_size = size
+
+        @staticmethod
+        def set_change_buffer_overflow(policy):
+            assert policy in OVERFLOW_POLICIES
+            GnmiServerAdapter.SubscriptionHandler.change_buffer_overflow = \
+                policy
+
+        @staticmethod
+        def set_batch_max_latency(latency):
+            GnmiServerAdapter.SubscriptionHandler.batch_max_latency = latency
+
+        @staticmethod
+        def set_batch_max_size(size):
+            GnmiServerAdapter.SubscriptionHandler.batch_max_size = size
+
+        @staticmethod
+        def set_min_sample_interval(interval):
+            GnmiServerAdapter.SubscriptionHandler.min_sample_interval = \
+                interval
+
+        @staticmethod
+        def set_max_notification_updates(count):
+            GnmiServerAdapter.SubscriptionHandler.max_notification_updates = \
+                count
+
+        @staticmethod
+        def set_max_notification_bytes(size):
+            GnmiServerAdapter.SubscriptionHandler.max_notification_bytes = \
+                size
+
         def __init__(self, adapter, subscription_list):
             self.adapter = adapter
             self.subscription_list = subscription_list
             self.read_queue = None
+            self.change_buffer = None
+            # (SampleGroup, subscription index) of sampled subscriptions
+            self.sample_groups = []
+            # subscription index -> UpdateSnapshot of last sent values
+            # (subscriptions with `suppress_redundant` or `updates_only` POLL)
+            self.snapshots = {}
+            # SampleGroup objects with due sample (dict keeps order)
+            self.due_groups = {}
+            self.due_groups_lock = threading.Lock()
             if not self.is_once():
                 self.read_queue = Queue()
+                self.change_buffer = ChangeBuffer(self.change_buffer_size,
+                                                  self.change_buffer_overflow)
 
         @abstractmethod
         def get_sample(self, path, prefix) -> List:
@@ -97,7 +255,8 @@ class GnmiServerAdapter(ABC):
             :param path: gNMI path for updates
             :param prefix: gNMI prefix
             #TODO do we need to return array or would just one Update be enough?
-            :return: gNMI update array
+            :return: gNMI update array (or other iterable of updates, e.g.
+            generator reading the path incrementally)
             """
             pass
 
@@ -113,9 +272,10 @@ class GnmiServerAdapter(ABC):
             pass
 
         @abstractmethod
-        def get_monitored_changes(self) -> List:
+        def get_monitored_changes(self, changes) -> List:
             """
             Get gNMI subscription updates for changed values
+            :param changes: changes taken from `change_buffer`
             :return: gNMI update array
             #TODO should we also return delete array
             """
@@ -155,6 +315,24 @@ class GnmiServerAdapter(ABC):
             """
             return self.subscription_list.mode == gnmi_pb2.SubscriptionList.POLL
 
+        def is_overflowed(self):
+            """
+            Return True if subscription read was finished because of change
+            buffer overflow (OVERFLOW_DISCONNECT policy).
+            """
+            return self.change_buffer is not None and \
+                self.change_buffer.overflowed
+
+        def counters(self):
+            """
+            Get change buffer counters of the subscription.
+            :return: dict counter name -> value (see `ChangeBuffer.counters`),
+                     empty for ONCE subscription
+            """
+            if self.change_buffer is None:
+                return {}
+            return self.change_buffer.counters()
+
         def is_monitor_changes(self):
             """
             Return True if subscription is of such type that we should monitor
@@ -163,6 +341,122 @@ class GnmiServerAdapter(ABC):
             """
             return self.subscription_list.mode == gnmi_pb2.SubscriptionList.STREAM
 
+        def is_sampled(self, subscription):
+            """
+            Return True if `subscription` of STREAM subscription list should
+            be sampled (SAMPLE mode), not monitored for changes.
+            """
+            return self.is_monitor_changes() and \
+                subscription.mode == gnmi_pb2.SubscriptionMode.SAMPLE
+
+        def has_monitored_paths(self):
+            """
+            Return True if some paths of STREAM subscription list are monitored
+            for changes (ON_CHANGE or TARGET_DEFINED mode).
+            """
+            return self.is_monitor_changes() and \
+                any(not self.is_sampled(s)
+                    for s in self.subscription_list.subscription)
+
+        def sample_interval(self, subscription):
+            """
+            :return: sample interval of `subscription` in seconds
+            """
+            return max(subscription.sample_interval / 1e9,
+                       self.min_sample_interval)
+
+        def start_sampling(self):
+            """
+            Start sampling of sampled subscriptions with shared
+            SampleScheduler. Subscriptions of the same path, prefix,
+            encoding and interval (of the same adapter) share one read.
+            """
+            log.debug("==>")
+            scheduler = SampleScheduler.get_scheduler()
+            prefix = self.subscription_list.prefix
+            prefix_key = prefix.SerializeToString(deterministic=True)
+            for i, s in enumerate(self.subscription_list.subscription):
+                if self.is_sampled(s):
+                    key = (self.adapter, prefix_key,
+                           s.path.SerializeToString(deterministic=True),
+                           self.subscription_list.encoding)
+                    group = scheduler.subscribe(self, key,
+                                                self.sample_interval(s))
+                    self.sample_groups.append((group, i))
+            log.debug("<== sample_groups=%s", len(self.sample_groups))
+
+        def stop_sampling(self):
+            log.debug("==>")
+            scheduler = SampleScheduler.get_scheduler()
+            for group, _i in self.sample_groups:
+                scheduler.unsubscribe(self, group)
+            self.sample_groups = []
+            log.debug("<==")
+
+        def sample_due(self, groups):
+            """
+            Called (from SampleScheduler thread) when samples of `groups`
+            are due. SubscriptionEvent.SAMPLE_DUE is put to `read_queue`
+            only if it is not already waiting there.
+            """
+            with self.due_groups_lock:
+                notify = not self.due_groups
+                self.due_groups.update(dict.fromkeys(groups, True))
+            if notify:
+                self.put_event(self.SubscriptionEvent.SAMPLE_DUE)
+
+        def due_samples(self):
+            """
+            Get subscription responses with samples of due sample groups.
+            This is generator function (see `make_responses`), nothing is
+            yielded if there is no due sample.
+            :return: nothing
+            """
+            log.debug("==>")
+            with self.due_groups_lock:
+                groups = self.due_groups
+                self.due_groups = {}
+            prefix = self.subscription_list.prefix
+            update = []
+            delete = []
+            for group, i in self.sample_groups:
+                if group in groups:
+                    s = self.subscription_list.subscription[i]
+                    sample = group.read(
+                        lambda: self.get_sample(path=s.path, prefix=prefix))
+                    if s.suppress_redundant:
+                        sample, deleted = self.suppress_redundant(i, sample)
+                        delete.extend(deleted)
+                    update.extend(sample)
+            if update or delete:
+                yield from self.make_responses(update, delete)
+            log.debug("<== updates=%s deletes=%s", len(update), len(delete))
+
+        def suppress_redundant(self, index, updates):
+            """
+            Remove updates with values not changed since they were last sent
+            (gNMI `suppress_redundant`). Unchanged value is sent again, if it
+            was not sent for `heartbeat_interval` (checked on sample ticks,
+            so the value is sent on the tick nearest to the heartbeat).
+            Last sent values are kept (hashed) per subscription.
+            :param index: index of sampled subscription
+            :param updates: sample of the subscription
+            :return: tuple (updates to send, paths of deleted values)
+            """
+            s = self.subscription_list.subscription[index]
+            heartbeat = s.heartbeat_interval / 1e9
+            if heartbeat:
+                heartbeat -= self.sample_interval(s) / 2
+            snapshot = self.snapshots.setdefault(index, UpdateSnapshot())
+            return snapshot.diff(updates, heartbeat)
+
+        def is_delta_poll(self):
+            """
+            Return True if POLL responses should contain only changes since
+            previous poll (POLL subscription with `updates_only`).
+            """
+            return self.is_poll() and self.subscription_list.updates_only
+
         def put_event(self, event):
             """
             Put event to queue of `read` function.
@@ -175,6 +469,19 @@ class GnmiServerAdapter(ABC):
             self.read_queue.put(event)
             log.info("<== ")
 
+        def notify_changes(self):
+            """
+            Notify `read` function about changes added to `change_buffer`.
+            SubscriptionEvent.SEND_CHANGES is put to `read_queue` only if it is
+            not already waiting there (or if `batch_max_size` changes are
+            waiting for batching window), so the queue does not grow with
+            number of changes.
+            """
+            notify_size = self.batch_max_size \
+                if self.batch_max_latency > 0 else None
+            if self.change_buffer.mark_pending(notify_size):
+                self.put_event(self.SubscriptionEvent.SEND_CHANGES)
+
         def stop(self):
             """
             Stop processing of subscriptions.
@@ -184,34 +491,101 @@ class GnmiServerAdapter(ABC):
             self.put_event(self.SubscriptionEvent.FINISH)
             log.info("<==")
 
+        def make_responses(self, updates, deletes=()):
+            """
+            Make subscription responses with `updates` and `deletes`.
+            Notifications are split, so that none has more than
+            `max_notification_updates` updates and deletes or more than
+            `max_notification_bytes` bytes (0 - no limit). At least one
+            response is made.
+            This is generator function, `updates` (iterable) are consumed
+            lazily and `deletes` are read after all `updates`.
+            TODO timestamp is 0
+            :param updates: iterable of gNMI updates
+            :param deletes: iterable of gNMI paths
+            :return: nothing
+            """
+            update = []
+            delete = []
+            size = 0
+            sent = False
+
+            def response():
+                notif = gnmi_pb2.Notification(timestamp=0,
+                                              prefix=self.subscription_list.prefix,
+                                              update=update,
+                                              delete=delete,
+                                              atomic=False)
+                return gnmi_pb2.SubscribeResponse(update=notif)
+
+            def items():
+                for u in updates:
+                    yield u, update
+                for d in deletes:
+                    yield d, delete
+
+            max_updates = self.max_notification_updates
+            max_bytes = self.max_notification_bytes
+            for item, target in items():
+                item_size = item.ByteSize()
+                count = len(update) + len(delete)
+                full = max_updates and count >= max_updates
+                too_big = max_bytes and size + item_size > max_bytes
+                if count and (full or too_big):
+                    yield response()
+                    sent = True
+                    update.clear()
+                    delete.clear()
+                    size = 0
+                target.append(item)
+                size += item_size
+            if update or delete or not sent:
+                yield response()
+
+        def _sample_updates(self, start_monitoring, deletes):
+            """
+            Read sample of subscribed paths (one path at a time).
+            This is generator function, it yields gNMI updates. Deleted paths
+            (for POLL with `updates_only`) are appended to `deletes`.
+            """
+            for i, s in enumerate(self.subscription_list.subscription):
+                sample = self.get_sample(path=s.path,
+                                         prefix=self.subscription_list.prefix)
+                if self.is_sampled(s) and s.suppress_redundant:
+                    # remember sent values
+                    sample = list(sample)
+                    self.suppress_redundant(i, sample)
+                elif self.is_delta_poll():
+                    snapshot = self.snapshots.setdefault(i, UpdateSnapshot())
+                    sample, deleted = snapshot.diff(sample)
+                    deletes.extend(deleted)
+                yield from sample
+                if start_monitoring and not self.is_sampled(s):
+                    self.add_path_for_monitoring(s.path,
+                                                 self.subscription_list.prefix)
+
         def sample(self, start_monitoring=False):
             """
             Get current sample of subscribed paths according to
             `self.subscription_list`.
+            This is generator function, subscribed paths are read one by one
+            and the sample is split into more responses (see `make_responses`),
+            so big sample is not kept in memory.
             :param: start_monitoring: if True, the paths will be monitored
-            for future changes
-            TODO `delete` is processed and `delete` array is empty
-            TODO timestamp is 0
-            :return: SubscribeResponse with sample
+            for future changes (paths of sampled subscriptions are not
+            monitored, see `start_sampling`)
+            For POLL with `updates_only`, only changes since previous sample
+            are returned (`delete` contains removed paths).
+            :return: nothing
             """
             log.debug("==> start_monitoring=%s", start_monitoring)
-            update = []
-            for s in self.subscription_list.subscription:
-                update.extend(self.get_sample(path=s.path,
-                                              prefix=self.subscription_list.prefix))
-                if start_monitoring:
-                    self.add_path_for_monitoring(s.path,
-                                                 self.subscription_list.prefix)
-            notif = gnmi_pb2.Notification(timestamp=0,
-                                          prefix=self.subscription_list.prefix,
-                                          update=update,
-                                          delete=[],
-                                          atomic=False)
-            response = gnmi_pb2.SubscribeResponse(update=notif)
+            start_monitoring = start_monitoring and self.has_monitored_paths()
+            deletes = []
+            yield from self.make_responses(
+                self._sample_updates(start_monitoring, deletes), deletes)
             if start_monitoring:
                 self.start_monitoring()
-            log.debug("<== response=%s", response)
-            return response
+            log.debug("<==")
 
         def sync_response(self):
             """
@@ -224,23 +598,23 @@ class GnmiServerAdapter(ABC):
             return response
 
 
-        def changes(self):
+        def changes(self, changes):
             """
             Get subscription responses for changes (subscribed values).
             `update` arrays contain changes
-            TODO `delete` is processed and `delete` array is empty
             TODO timestamp is 0
+            :param changes: changes taken from `change_buffer`
             :return: SubscribeResponse with changes
             """
             log.debug("==>")
-            notifications = self.get_subscription_notifications()
+            notifications = self.get_subscription_notifications(changes)
             responses = [gnmi_pb2.SubscribeResponse(update=notif)
                          for notif in notifications]
             log.debug("<== responses=%s", responses)
             return responses
 
-        def get_subscription_notifications(self):
-            update = self.get_monitored_changes()
+        def get_subscription_notifications(self, changes):
+            update = self.get_monitored_changes(changes)
             notif = gnmi_pb2.Notification(timestamp=0,
                                           prefix=self.subscription_list.prefix,
                                           update=update,
@@ -248,16 +622,34 @@ class GnmiServerAdapter(ABC):
                                           atomic=False)
             return [notif]
 
-        def read(self):
+        def _wait_batch(self):
             """
-            Read (get) subscription response(s) (in stream) for added
-            subscription requests.
-            This is generator function. For streaming subscription it contains
-            event loop driven by self.read_queue (Queue object) and
-            SubscriptionEvent messages.
+            Batching window - wait for more changes until `batch_max_latency`
+            elapses or `batch_max_size` changes are buffered.
+            This is generator function used by `_read_loop`, it yields
+            EventWait object.
+            :return: event received in the window, which is not related to
+            changes and must be processed by caller (or None)
+            """
+            deadline = time.monotonic() + self.batch_max_latency
+            while len(self.change_buffer) < self.batch_max_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                event = yield self.EventWait(timeout)
+                if event not in (self.SubscriptionEvent.TIMEOUT,
+                                 self.SubscriptionEvent.SEND_CHANGES):
+                    return event
+            return None
+
+        def _read_loop(self):
+            """
+            Subscription event loop shared by `read` and `read_async`.
+            This is generator function, it yields SubscribeResponse(s) and
+            EventWait object when next event is needed. The event is passed
+            back with generator `send` function.
             Response contains `notification` or `sync_response`.
             :return: nothing
-            #TODO POLL mode with updates_only (send sync_response)
             :see: SubscriptionHandler.SubscriptionEvent
             """
             log.info("==>")
@@ -267,41 +659,160 @@ class GnmiServerAdapter(ABC):
                 assert self.read_queue is not None
             event = None
             first_sample = True
-            while True:
-                log.debug("Processing event type %s", event)
-                # SAMPLE is handled in the same way as "first_sample"
-                if first_sample or event == self.SubscriptionEvent.SAMPLE:
-                    response = self.sample(
-                        start_monitoring=self.is_monitor_changes() and first_sample)
-                    yield response
-                    if first_sample:
-                        yield self.sync_response()
-                    first_sample = False
-                    if self.is_once():
+            try:
+                while True:
+                    log.debug("Processing event type %s", event)
+                    # SAMPLE is handled in the same way as "first_sample"
+                    if first_sample or event == self.SubscriptionEvent.SAMPLE:
+                        responses = self.sample(
+                            start_monitoring=self.is_monitor_changes() and first_sample)
+                        if first_sample and self.subscription_list.updates_only:
+                            # with `updates_only`, initial state is not sent
+                            for _response in responses:
+                                pass
+                        else:
+                            yield from responses
+                        if first_sample:
+                            if self.is_monitor_changes():
+                                self.start_sampling()
+                            yield self.sync_response()
+                        first_sample = False
+                        if self.is_once():
+                            break
+                    elif event == self.SubscriptionEvent.FINISH:
+                        log.debug("finishing subscription read")
                         break
-                elif event == self.SubscriptionEvent.FINISH:
-                    log.debug("finishing subscription read")
-                    break
-                elif event == self.SubscriptionEvent.SEND_CHANGES:
-                    response = self.changes()
-                    log.debug("Sending changes")
-                    yield from response
-                elif event is None:
-                    log.warning("**** event is None ! ****")
-                    # TODO error
-                    break
-                else:
-                    log.warning("**** event=%s not processed ! ****", event)
-                    # TODO error
-                    break
-                log.debug("Waiting for event")
-                event = self.read_queue.get()
-                log.debug("Woke up event=%s", event)
-            if self.is_monitor_changes():
-                self.stop_monitoring()
-
+                    elif event == self.SubscriptionEvent.SEND_CHANGES:
+                        next_event = None
+                        if self.batch_max_latency > 0:
+                            next_event = yield from self._wait_batch()
+                        changes, resync = self.change_buffer.drain()
+                        if self.change_buffer.overflowed:
+                            log.warning("change buffer overflow, finishing "
+                                        "subscription read")
+                            break
+                        if resync:
+                            log.info("change buffer overflow, sending new "
+                                     "sample")
+                            yield from self.sample()
+                            yield self.sync_response()
+                        elif changes:
+                            log.debug("Sending changes")
+                            yield from self.changes(changes)
+                        if next_event is not None:
+                            event = next_event
+                            continue
+                    elif event == self.SubscriptionEvent.SAMPLE_DUE:
+                        yield from self.due_samples()
+                    elif event == self.SubscriptionEvent.TIMEOUT:
+                        pass
+                    elif event is None:
+                        log.warning("**** event is None ! ****")
+                        # TODO error
+                        break
+                    else:
+                        log.warning("**** event=%s not processed ! ****", event)
+                        # TODO error
+                        break
+                    log.debug("Waiting for event")
+                    event = yield self.EventWait()
+                    log.debug("Woke up event=%s", event)
+            finally:
+                self.stop_sampling()
+                if self.has_monitored_paths():
+                    self.stop_monitoring()
+                    log.info("change buffer counters=%s",
+                             self.change_buffer.counters())
             log.info("<==")
 
+        @staticmethod
+        def _read_step(reader, value):
+            """
+            Resume `reader` (see `_read_loop`) with `value`.
+            :return: next yielded item or None, if `reader` is finished
+            """
+            try:
+                return reader.send(value)
+            except StopIteration:
+                return None
+
+        def read(self):
+            """
+            Read (get) subscription response(s) (in stream) for added
+            subscription requests.
+            This is generator function. For streaming subscription it contains
+            event loop driven by self.read_queue (Queue object) and
+            SubscriptionEvent messages.
+            Response contains `notification` or `sync_response`.
+            :return: nothing
+            :see: SubscriptionHandler.SubscriptionEvent
+            """
+            reader = self._read_loop()
+            try:
+                item = self._read_step(reader, None)
+                while item is not None:
+                    if isinstance(item, self.EventWait):
+                        try:
+                            event = self.read_queue.get(timeout=item.timeout)
+                        except Empty:
+                            event = self.SubscriptionEvent.TIMEOUT
+                        item = self._read_step(reader, event)
+                    else:
+                        yield item
+                        item = self._read_step(reader, None)
+            finally:
+                reader.close()
+
+        def attach_event_loop(self, loop):
+            """
+            Make `read_queue` usable from `read_async` running in `loop`.
+            Must be called before any event is put to the queue.
+            """
+            if not self.is_once():
+                self.read_queue = self.AsyncEventQueue(loop)
+
+        async def read_async(self, executor):
+            """
+            asyncio variant of `read`.
+            This is async generator function. Subscription processing
+            (`sample`, `changes` ...) may block, so it is run in `executor`,
+            waiting for events does not occupy any `executor` thread.
+            :param executor: concurrent.futures.Executor for blocking calls
+            :return: nothing
+            :see: attach_event_loop
+            """
+            assert self.is_once() or \
+                   isinstance(self.read_queue, self.AsyncEventQueue)
+            loop = asyncio.get_running_loop()
+            reader = self._read_loop()
+            step = None
+            try:
+                value = None
+                while True:
+                    step = loop.run_in_executor(executor, self._read_step,
+                                                reader, value)
+                    # shield, so we can wait for unfinished step on cancel
+                    item = await asyncio.shield(step)
+                    step = None
+                    if item is None:
+                        break
+                    if isinstance(item, self.EventWait):
+                        try:
+                            value = await asyncio.wait_for(
+                                self.read_queue.get(), item.timeout)
+                        except asyncio.TimeoutError:
+                            value = self.SubscriptionEvent.TIMEOUT
+                    else:
+                        yield item
+                        value = None
+            finally:
+                if step is not None:
+                    try:
+                        await step
+                    except Exception as e:
+                        log.exception(e)
+                await loop.run_in_executor(executor, reader.close)
+
         def poll(self):
             """
             Poll (invoke SubscriptionEvent.SAMPLE in read) current state
@@ -326,3 +837,543 @@ class GnmiServerAdapter(ABC):
         :return: adapter instance
         """
         pass
+
+
+@dataclass
+class AdapterPoolEntry:
+    """ AdapterPool entry. """
+    key: tuple
+    adapter: GnmiServerAdapter
+    password: str
+    last_used: float
+    # number of RPCs (incl. subscriptions) using the adapter
+    leases: int = 0
+    # removed from pool, closed when last lease is released
+    retired: bool = False
+
+
+class AdapterPool:
+    """
+    Pool of connected adapters keyed by (username, source address).
+    Adapters are reused between RPCs of the same client, so adapter setup
+    (e.g. schema loading) is not done for every RPC.
+    Adapter returned by `get` is leased until `release` is called
+    (e.g. when RPC or subscription ends).
+    Adapters not used for `idle_timeout` seconds are evicted, the pool
+    holds at most `max_size` adapters (least recently used are evicted).
+    Unhealthy adapters (see GnmiServerAdapter.is_healthy) are replaced.
+    Leased adapters are not idle; if they are evicted or replaced, they are
+    closed when the last lease is released.
+    """
+
+    def __init__(self, max_size=100, idle_timeout=300.0):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # key -> AdapterPoolEntry, LRU is first
+        self._adapters = OrderedDict()
+        # id(adapter) -> AdapterPoolEntry of leased adapters
+        self._leased = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._adapters)
+
+    @staticmethod
+    def _retire(entry, to_close):
+        entry.retired = True
+        if entry.leases == 0:
+            to_close.append(entry.adapter)
+
+    def _remove(self, entry, to_close):
+        if self._adapters.get(entry.key) is entry:
+            del self._adapters[entry.key]
+        self._retire(entry, to_close)
+
+    def _evict_idle(self, now, to_close):
+        for entry in list(self._adapters.values()):
+            if entry.leases:
+                continue
+            if now - entry.last_used <= self.idle_timeout:
+                # rest of adapters were used later
+                break
+            log.debug("evicting idle adapter key=%s", entry.key)
+            self._remove(entry, to_close)
+
+    def _evict_lru(self, to_close):
+        while len(self._adapters) > self.max_size:
+            entries = list(self._adapters.values())
+            entry = next((e for e in entries if not e.leases), entries[0])
+            log.debug("evicting adapter key=%s leases=%d", entry.key,
+                      entry.leases)
+            self._remove(entry, to_close)
+
+    def _lease(self, entry, now):
+        entry.leases += 1
+        entry.last_used = now
+        self._leased[id(entry.adapter)] = entry
+        if not entry.retired:
+            self._adapters.move_to_end(entry.key)
+
+    @staticmethod
+    def _close(adapters):
+        for adapter in adapters:
+            log.debug("closing adapter=%s", adapter)
+            adapter.close()
+
+    def get(self, username, address, password,
+            factory: Callable[[], GnmiServerAdapter]) -> GnmiServerAdapter:
+        """
+        Get (lease) adapter for `username` and `address`. If there is no
+        (healthy) adapter in the pool, new one is created with `factory`
+        (`factory` should return connected adapter).
+        Caller must `release` the adapter when it is not used any more.
+        """
+        log.debug("==> username=%s address=%s", username, address)
+        key = (username, address)
+        to_close = []
+        with self._lock:
+            self._evict_idle(time.monotonic(), to_close)
+            entry = self._adapters.get(key)
+            if entry is not None and entry.password != password:
+                log.debug("not reusing adapter key=%s", key)
+                self._remove(entry, to_close)
+                entry = None
+            if entry is not None:
+                self._lease(entry, time.monotonic())
+        self._close(to_close)
+        if entry is not None:
+            # check outside of the lock (health check may contact server)
+            if entry.adapter.is_healthy():
+                log.debug("<== reused adapter=%s", entry.adapter)
+                return entry.adapter
+            log.debug("not reusing unhealthy adapter key=%s", key)
+            with self._lock:
+                self._remove(entry, to_close)
+            self.release(entry.adapter)
+        # new adapter is created (connected) without holding the lock
+        adapter = factory()
+        to_close = []
+        with self._lock:
+            entry = AdapterPoolEntry(key, adapter, password, time.monotonic())
+            previous = self._adapters.get(key)
+            if previous is not None:
+                # created concurrently for the same key, the latest wins
+                self._remove(previous, to_close)
+            self._adapters[key] = entry
+            self._lease(entry, entry.last_used)
+            self._evict_lru(to_close)
+        self._close(to_close)
+        log.debug("<== adapter=%s", adapter)
+        return adapter
+
+    def release(self, adapter):
+        """
+        Release lease of `adapter` returned by `get`. Adapters not got from
+        the pool are ignored.
+        """
+        to_close = []
+        with self._lock:
+            entry = self._leased.get(id(adapter))
+            if entry is None:
+                return
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if entry.leases == 0:
+                del self._leased[id(adapter)]
+                if entry.retired:
+                    to_close.append(adapter)
+                else:
+                    self._adapters.move_to_end(entry.key)
+        self._close(to_close)
+
+    def clear(self):
+        to_close = []
+        with self._lock:
+            for entry in list(self._adapters.values()):
+                self._remove(entry, to_close)
+        self._close(to_close)
+
+
+class ChangeBuffer:
+    """
+    Bounded buffer of subscription changes of one subscriber.
+    Changes are coalesced by key (tuple, e.g. path elements) - latest change
+    of a key wins and delete of a key supersedes all buffered changes
+    of keys it is prefix of.
+    When the buffer is full, `overflow_policy` is applied:
+    OVERFLOW_DROP_OLDEST - oldest change is dropped,
+    OVERFLOW_RESYNC - all changes are dropped and `drain` reports resync
+    (subscriber should get new sample instead),
+    OVERFLOW_DISCONNECT - all changes are dropped and `overflowed` is set
+    (subscriber should be disconnected).
+    Buffered keys are also indexed in a prefix tree, so delete finds
+    the changes it supersedes without scanning the whole buffer.
+    """
+    # prefix tree node entry marking a buffered key
+    _KEY = object()
+
+    def __init__(self, max_size=CHANGE_BUFFER_SIZE,
+                 overflow_policy=CHANGE_BUFFER_OVERFLOW):
+        assert overflow_policy in OVERFLOW_POLICIES
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        # key -> change, oldest first
+        self._changes = OrderedDict()
+        # prefix tree of `_changes` keys - key element -> node,
+        # `_KEY` -> True if the node is a buffered key
+        self._index = {}
+        self._lock = threading.Lock()
+        self.pending = False
+        self._size_notified = False
+        self.resync = False
+        self.overflowed = False
+        self.coalesced = 0
+        self.dropped = 0
+        self.resyncs = 0
+
+    def __len__(self):
+        return len(self._changes)
+
+    def _index_add(self, key):
+        node = self._index
+        for elem in key:
+            node = node.setdefault(elem, {})
+        node[self._KEY] = True
+
+    def _index_nodes(self, key):
+        """
+        :return: list of index nodes on path of `key` (root first),
+                 None if there is no such node
+        """
+        nodes = [self._index]
+        for elem in key:
+            node = nodes[-1].get(elem)
+            if node is None:
+                return None
+            nodes.append(node)
+        return nodes
+
+    def _index_prune(self, key, nodes):
+        """ Remove empty nodes on path of `key` (`_index_nodes`). """
+        for i in reversed(range(len(key))):
+            if nodes[i + 1]:
+                break
+            del nodes[i][key[i]]
+
+    def _index_remove(self, key):
+        nodes = self._index_nodes(key)
+        del nodes[-1][self._KEY]
+        self._index_prune(key, nodes)
+
+    def _index_pop(self, key):
+        """
+        Remove `key` and all keys it is prefix of from the index.
+        :return: list of removed keys
+        """
+        nodes = self._index_nodes(key)
+        if nodes is None:
+            return []
+        keys = []
+        stack = [(key, nodes[-1])]
+        while stack:
+            prefix, node = stack.pop()
+            for elem, child in node.items():
+                if elem is self._KEY:
+                    keys.append(prefix)
+                else:
+                    stack.append((prefix + (elem,), child))
+        nodes[-1].clear()
+        self._index_prune(key, nodes)
+        return keys
+
+    def _clear(self):
+        self._changes.clear()
+        self._index = {}
+
+    def _overflow(self):
+        if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+            key, _change = self._changes.popitem(last=False)
+            self._index_remove(key)
+            self.dropped += 1
+            return
+        self.dropped += len(self._changes)
+        self._clear()
+        if self.overflow_policy == OVERFLOW_RESYNC:
+            self.resync = True
+            self.resyncs += 1
+        else:
+            self.overflowed = True
+
+    def add(self, key, change, delete=False):
+        """
+        Add change of `key`.
+        :param key: tuple identifying changed node
+        :param change: change object (returned by `drain`)
+        :param delete: if True, `change` deletes `key` and all its
+        descendants (keys `key` is prefix of)
+        """
+        with self._lock:
+            if self.resync or self.overflowed:
+                # all changes are replaced with new sample (or dropped)
+                self.dropped += 1
+                return
+            if delete:
+                superseded = self._index_pop(key)
+                for k in superseded:
+                    del self._changes[k]
+                self.coalesced += len(superseded)
+            elif key in self._changes:
+                del self._changes[key]
+                self.coalesced += 1
+            self._changes[key] = change
+            self._index_add(key)
+            if len(self._changes) > self.max_size:
+                self._overflow()
+
+    def mark_pending(self, notify_size=None):
+        """
+        Mark buffer as waiting for `drain`.
+        :param notify_size: if set, subscriber is notified (once) also when
+        buffer is already pending and has at least `notify_size` changes
+        :return: True if the subscriber should be notified
+        """
+        with self._lock:
+            notify = not self.pending
+            if not notify and notify_size is not None and \
+                    not self._size_notified and \
+                    len(self._changes) >= notify_size:
+                notify = self._size_notified = True
+            self.pending = True
+            return notify
+
+    def drain(self):
+        """
+        Take all buffered changes.
+        :return: tuple (list of changes - oldest first, resync flag)
+        """
+        with self._lock:
+            changes = list(self._changes.values())
+            resync = self.resync
+            self._clear()
+            self.resync = False
+            self.pending = False
+            self._size_notified = False
+            return changes, resync
+
+    def counters(self):
+        """
+        :return: dict with numbers of currently buffered, coalesced
+                 and dropped changes, number of resyncs and overflow flag
+        """
+        with self._lock:
+            return {"buffered": len(self._changes),
+                    "coalesced": self.coalesced, "dropped": self.dropped,
+                    "resyncs": self.resyncs,
+                    "overflowed": self.overflowed}
+
+
+class UpdateSnapshot:
+    """
+    Compact (hashed) snapshot of sent updates - for every path its value
+    hash and time it was sent.
+    Used to send only changed values (`diff`).
+    """
+
+    def __init__(self):
+        # serialized path -> (value hash, time sent)
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def diff(self, updates, heartbeat=0.0):
+        """
+        Compare `updates` with the snapshot and replace the snapshot
+        with `updates`.
+        :param updates: gNMI updates (new state of all snapshot paths)
+        :param heartbeat: if > 0, unchanged values not sent for `heartbeat`
+        seconds are returned too
+        :return: tuple (changed updates, paths missing in `updates`)
+        """
+        now = time.monotonic()
+        values = {}
+        changed = []
+        for u in updates:
+            key = u.path.SerializeToString(deterministic=True)
+            val_hash = hash(u.val.SerializeToString(deterministic=True))
+            prev = self.values.get(key)
+            if prev is None or prev[0] != val_hash or \
+                    (heartbeat and now - prev[1] >= heartbeat):
+                changed.append(u)
+                values[key] = (val_hash, now)
+            else:
+                values[key] = prev
+        deleted = [gnmi_pb2.Path.FromString(key)
+                   for key in self.values if key not in values]
+        self.values = values
+        return changed, deleted
+
+
+class SampleGroup:
+    """
+    Sampled subscriptions (listeners) of the same path with the same
+    sample interval (see SampleScheduler).
+    On every tick all listeners are notified (`sample_due`), the first
+    listener reading the tick sample reads it (`read`), others wait for
+    the same (cached) sample.
+    The sample is read outside of the group lock, so a slow read does not
+    block ticks (`next_tick`) nor subscribe/unsubscribe.
+    """
+
+    def __init__(self, key, interval):
+        self.key = key
+        self.interval = interval
+        self.listeners = []
+        self.tick = 0
+        # Future with sample of `_sample_tick`
+        self._sample = None
+        self._sample_tick = -1
+        self._readers = 0
+        self._lock = threading.Lock()
+
+    def read(self, read_fun):
+        """
+        Get sample of current tick.
+        :param read_fun: function reading the sample (called only if
+        sample of current tick was not read or is not being read yet)
+        :return: sample (list of items of iterable returned by `read_fun`)
+        """
+        with self._lock:
+            first = self._sample_tick != self.tick
+            if first:
+                self._sample = Future()
+                self._sample_tick = self.tick
+                self._readers = 0
+            sample = self._sample
+        if first:
+            try:
+                sample.set_result(list(read_fun()))
+            except Exception as e:
+                sample.set_exception(e)
+        try:
+            return sample.result()
+        finally:
+            with self._lock:
+                if self._sample is sample:
+                    self._readers += 1
+                    if self._readers >= len(self.listeners) or \
+                            sample.exception() is not None:
+                        # all listeners have the sample (or it failed),
+                        # do not keep it in memory
+                        self._sample = None
+                        self._sample_tick = -1
+
+    def add_listener(self, listener):
+        with self._lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        :return: number of remaining listeners
+        """
+        with self._lock:
+            self.listeners.remove(listener)
+            return len(self.listeners)
+
+    def next_tick(self):
+        with self._lock:
+            self.tick += 1
+            return list(self.listeners)
+
+
+class SampleScheduler:
+    """
+    Timer heap driving all sampled subscriptions of the process
+    with one thread.
+    Subscriptions with the same key (e.g. adapter, prefix and path) and
+    the same interval share one SampleGroup, so the path is read once
+    per interval.
+    Ticks are aligned to multiples of interval, so groups with the same
+    interval are due together and every listener is notified once
+    with all its due groups (`listener.sample_due(groups)`).
+    """
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+
+    def __init__(self):
+        # (due time, sequence number, group)
+        self._heap = []
+        self._seq = 0
+        self._groups = {}
+        self._cond = threading.Condition()
+        self.thread = threading.Thread(target=self._loop, daemon=True,
+                                       name="sample-scheduler")
+        self.thread.start()
+
+    @staticmethod
+    def get_scheduler():
+        with SampleScheduler._scheduler_lock:
+            if SampleScheduler._scheduler is None:
+                SampleScheduler._scheduler = SampleScheduler()
+            return SampleScheduler._scheduler
+
+    def __len__(self):
+        return len(self._groups)
+
+    def _push(self, now, group):
+        self._seq += 1
+        due = (now // group.interval + 1) * group.interval
+        heapq.heappush(self._heap, (due, self._seq, group))
+
+    def subscribe(self, listener, key, interval):
+        """
+        Notify `listener` every `interval` seconds.
+        :return: SampleGroup of the subscription (pass to `unsubscribe`)
+        """
+        log.debug("==> key=%s interval=%s", key, interval)
+        with self._cond:
+            group = self._groups.get((key, interval))
+            if group is None:
+                group = SampleGroup(key, interval)
+                self._groups[(key, interval)] = group
+                self._push(time.monotonic(), group)
+                self._cond.notify()
+            group.add_listener(listener)
+        log.debug("<== group=%s", group)
+        return group
+
+    def unsubscribe(self, listener, group):
+        log.debug("==> key=%s interval=%s", group.key, group.interval)
+        with self._cond:
+            if group.remove_listener(listener) == 0:
+                # group stays in heap until it is due, it is dropped then
+                del self._groups[(group.key, group.interval)]
+        log.debug("<==")
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap or \
+                        self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() \
+                        if self._heap else None
+                    self._cond.wait(timeout)
+                now = time.monotonic()
+                due_groups = []
+                while self._heap and self._heap[0][0] <= now:
+                    _due, _seq, group = heapq.heappop(self._heap)
+                    if self._groups.get((group.key, group.interval)) \
+                            is group:
+                        # missed ticks (if we are late) are skipped
+                        self._push(now, group)
+                        due_groups.append(group)
+            # listener -> its due groups (dict keeps order)
+            listeners = {}
+            for group in due_groups:
+                for listener in group.next_tick():
+                    listeners.setdefault(listener, []).append(group)
+            for listener, groups in listeners.items():
+                try:
+                    listener.sample_due(groups)
+                except Exception as e:
+                    log.exception(e)
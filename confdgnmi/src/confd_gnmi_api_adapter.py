@@ -1,10 +1,8 @@
 import logging
-import os
-import re
-import select
 import sys
 import threading
 import json
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from socket import socket
 
@@ -14,24 +12,59 @@ from confd.cdb import cdb
 
 import gnmi_pb2
 from confd_gnmi_adapter import GnmiServerAdapter
-from confd_gnmi_api_adapter_defaults import ApiAdapterDefaults
+from confd_gnmi_api_adapter_defaults import ApiAdapterDefaults, \
+    GET_MODES, GET_MODE_PARALLEL
+from confd_gnmi_api_adapter_changes import ChangeOp, CdbSubscriptionHub, \
+    ExternalChangeServer
+from confd_gnmi_api_adapter_schema import LeafEncoders, SchemaCache, \
+    SchemaSnapshot
+from confd_gnmi_api_adapter_session import MaapiSessionPool
 from confd_gnmi_common import make_xpath_path, make_formatted_path, \
-    add_path_prefix, remove_path_prefix, make_gnmi_path
+    add_path_prefix, remove_path_prefix, PathTranslator, decode_typed_value
 
 log = logging.getLogger('confd_gnmi_api_adapter')
 
 
 INT_VALS = {_confd.C_INT8, _confd.C_INT16, _confd.C_INT32,
             _confd.C_UINT8, _confd.C_UINT16, _confd.C_UINT32}
+# integer types for PROTO encoding (int_val, uint_val)
+SIGNED_INT_VALS = {_confd.C_INT8, _confd.C_INT16, _confd.C_INT32,
+                   _confd.C_INT64}
+UNSIGNED_INT_VALS = {_confd.C_UINT8, _confd.C_UINT16, _confd.C_UINT32,
+                     _confd.C_UINT64}
 
 EXT_SPOINT = -1  # no subscription point for external changes
 
+SAVE_RECV_SIZE = 64 * 1024  # recv buffer size for save_config stream
+
+# TypedValue fields which can be set with set_elem
+PROTO_SCALAR_VALS = {"string_val", "int_val", "uint_val", "bool_val",
+                     "decimal_val", "double_val", "float_val"}
+
+
+class ReadMethod(Enum):
+    GET_ELEM = "get_elem"
+    GET_VALUES = "get_values"
+    SAVE_CONFIG = "save_config"
+
 
 class GnmiConfDApiServerAdapter(GnmiServerAdapter):
     confd_addr: str = ApiAdapterDefaults.CONFD_ADDR
     confd_port: int = ApiAdapterDefaults.CONFD_PORT if ApiAdapterDefaults.CONFD_PORT else _confd.CONFD_PORT
     monitor_external_changes: bool = ApiAdapterDefaults.MONITOR_EXTERNAL_CHANGES
     external_port: int = ApiAdapterDefaults.EXTERNAL_PORT
+    max_sessions: int = ApiAdapterDefaults.MAX_SESSIONS
+    read_trans_max_staleness: float = ApiAdapterDefaults.READ_TRANS_MAX_STALENESS
+    bulk_get: bool = ApiAdapterDefaults.BULK_GET
+    schema_cache_size: int = ApiAdapterDefaults.SCHEMA_CACHE_SIZE
+    get_mode: str = ApiAdapterDefaults.GET_MODE
+    schema_snapshot_path: str = ApiAdapterDefaults.SCHEMA_SNAPSHOT
+    # schema snapshot shared by all adapters of the process
+    _schema_snapshot = None
+    _schema_lock = threading.Lock()
+    # not connected adapter for schema lookups (see `get_schema_adapter`)
+    _schema_adapter = None
+    _schema_adapter_lock = threading.Lock()
 
     def __init__(self):
         self.addr: str = ""
@@ -39,13 +72,147 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
         self.username: str = ""
         self.password: str = ""
         self.mp_inst = None
-        # make sure schemas are loaded
-        with maapi.Maapi():
-            pass
-        nslist = _confd.get_nslist()
+        self.sessions = None
+        self.get_executor = None
+        self.get_executor_lock = threading.Lock()
+        self.json_encoders, self.proto_encoders = self.make_value_encoders()
+        # makes sure schemas are loaded
+        self.use_schema_snapshot(
+            GnmiConfDApiServerAdapter.get_schema_snapshot())
+
+    def use_schema_snapshot(self, snapshot):
+        """
+        Set namespace maps and schema cache of the adapter from `snapshot`.
+        :param snapshot: SchemaSnapshot
+        """
+        nslist = snapshot.namespaces
+        self.schema_snapshot = snapshot
         self.module_to_pfx = {nsentry[-1]: nsentry[1] for nsentry in nslist}
         self.pfx_to_module = {nsentry[1]: nsentry[-1] for nsentry in nslist}
         self.ns_to_module = {nsentry[0]: nsentry[-1] for nsentry in nslist}
+        self.module_to_pfx_translator = PathTranslator(self.module_to_pfx)
+        self.pfx_to_module_translator = PathTranslator(self.pfx_to_module)
+        self.schema = SchemaCache(self.ns_to_module,
+                                  GnmiConfDApiServerAdapter.schema_cache_size,
+                                  self.make_leaf_encoders)
+
+    @staticmethod
+    def load_schemas(reload=False):
+        """
+        Load schemas from ConfD over MAAPI.
+        :param reload: load schemas even if already loaded
+        :return: tuple (namespaces, schema file) - schema file is empty
+                 if ConfD shared memory schema is not used
+        """
+        log.debug("==> reload=%s", reload)
+        with maapi.Maapi(ip=GnmiConfDApiServerAdapter.confd_addr,
+                         port=GnmiConfDApiServerAdapter.confd_port) as m:
+            if reload:
+                _confd.maapi.load_schemas(m.msock)
+            try:
+                schema_file = _confd.maapi.get_schema_file_path(m.msock)
+            except (_confd.error.Error, AttributeError):
+                schema_file = ""
+        namespaces = [tuple(nsentry) for nsentry in _confd.get_nslist()]
+        log.debug("<== len(namespaces)=%d schema_file=%s", len(namespaces),
+                  schema_file)
+        return namespaces, schema_file
+
+    @staticmethod
+    def get_schema_snapshot():
+        """
+        Get schema snapshot of the process. First call reads it from
+        snapshot file (and maps ConfD shared memory schema) or loads schemas
+        from ConfD if there is no (valid) file.
+        :return: SchemaSnapshot
+        """
+        cls = GnmiConfDApiServerAdapter
+        with cls._schema_lock:
+            if cls._schema_snapshot is not None:
+                return cls._schema_snapshot
+            log.debug("==> path=%s", cls.schema_snapshot_path)
+            snapshot = None
+            if cls.schema_snapshot_path:
+                snapshot = SchemaSnapshot.load(cls.schema_snapshot_path)
+            if snapshot is not None:
+                try:
+                    if snapshot.schema_file:
+                        _confd.mmap_schemas(snapshot.schema_file)
+                    else:
+                        cls.load_schemas()
+                except _confd.error.Error as e:
+                    log.warning("cannot use schema snapshot e=%s", e)
+                    snapshot = None
+            if snapshot is None:
+                namespaces, schema_file = cls.load_schemas()
+                # module_set_id and modules are read on connect
+                snapshot = SchemaSnapshot("", namespaces, [], schema_file)
+            cls._schema_snapshot = snapshot
+            log.debug("<== module_set_id=%s", snapshot.module_set_id)
+            return snapshot
+
+    @staticmethod
+    def get_schema_adapter():
+        """
+        Get process wide adapter without ConfD session, used for schema
+        lookups and value encoding by shared change sources
+        (CdbSubscriptionHub, ExternalChangeServer), so they do not keep
+        (pooled) adapters of subscribers. It follows process schema
+        snapshot (see `check_schema_snapshot`).
+        :return: GnmiConfDApiServerAdapter
+        """
+        cls = GnmiConfDApiServerAdapter
+        with cls._schema_adapter_lock:
+            if cls._schema_adapter is None:
+                cls._schema_adapter = cls()
+            return cls._schema_adapter
+
+    def update_schema_snapshot(self):
+        """
+        Check ConfD module set id and update schema snapshot (and snapshot
+        file) if it differs. Schemas are reloaded if ConfD modules changed.
+        """
+        log.debug("==>")
+        cls = GnmiConfDApiServerAdapter
+        try:
+            with self.sessions.read_trans() as t:
+                modules_state = maagic.get_root(t).modules_state
+                module_set_id = str(modules_state.module_set_id)
+                with cls._schema_lock:
+                    snapshot = cls._schema_snapshot
+                    if snapshot.module_set_id != module_set_id:
+                        log.info("module_set_id changed %s -> %s",
+                                 snapshot.module_set_id, module_set_id)
+                        if snapshot.module_set_id:
+                            namespaces, schema_file = \
+                                cls.load_schemas(reload=True)
+                        else:
+                            namespaces = snapshot.namespaces
+                            schema_file = snapshot.schema_file
+                        modules = [(module.namespace, module.name,
+                                    module.revision)
+                                   for module in modules_state.module]
+                        snapshot = SchemaSnapshot(module_set_id, namespaces,
+                                                  modules, schema_file)
+                        cls._schema_snapshot = snapshot
+                        if cls.schema_snapshot_path:
+                            snapshot.save(cls.schema_snapshot_path)
+        except Exception as e:
+            log.exception(e)
+        self.check_schema_snapshot()
+        log.debug("<== module_set_id=%s", self.schema_snapshot.module_set_id)
+
+    def check_schema_snapshot(self):
+        """
+        Start using schema snapshot of the process, if it was updated
+        (e.g. by other adapter). Schema nodes of the previous snapshot
+        must not be used after schemas are reloaded.
+        """
+        snapshot = GnmiConfDApiServerAdapter._schema_snapshot
+        if snapshot is not None and snapshot is not self.schema_snapshot:
+            log.info("using new schema snapshot module_set_id=%s",
+                     snapshot.module_set_id)
+            self.use_schema_snapshot(snapshot)
 
     # call only once!
     @staticmethod
@@ -81,6 +248,31 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
     def set_monitor_external_changes(val=True):
         GnmiConfDApiServerAdapter.monitor_external_changes = val
 
+    @staticmethod
+    def set_max_sessions(max_sessions):
+        GnmiConfDApiServerAdapter.max_sessions = max_sessions
+
+    @staticmethod
+    def set_read_trans_max_staleness(max_staleness):
+        GnmiConfDApiServerAdapter.read_trans_max_staleness = max_staleness
+
+    @staticmethod
+    def set_bulk_get(val=True):
+        GnmiConfDApiServerAdapter.bulk_get = val
+
+    @staticmethod
+    def set_schema_cache_size(size):
+        GnmiConfDApiServerAdapter.schema_cache_size = size
+
+    @staticmethod
+    def set_schema_snapshot_path(path):
+        GnmiConfDApiServerAdapter.schema_snapshot_path = path
+
+    @staticmethod
+    def set_get_mode(mode):
+        assert mode in GET_MODES
+        GnmiConfDApiServerAdapter.get_mode = mode
+
     @classmethod
     def get_adapter(cls) -> GnmiServerAdapter:
         """
@@ -94,46 +286,68 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
             super().__init__(adapter, subscription_list)
             # TODO reuse with demo adapter?
             self.monitored_paths = []
-            self.change_db = []
-            self.change_db_lock = threading.Lock()
-            self.change_thread = None
-            self.stop_pipe = None
             self.subpoint_paths = {}
 
-        def get_subscription_notifications(self):
+        def get_subscription_notifications(self, changes):
             return [gnmi_pb2.Notification(timestamp=0,
                                           prefix=prefix,
                                           update=updates,
-                                          delete=[],
+                                          delete=deletes,
                                           atomic=False)
-                    for prefix, updates in self._get_subscription_notifications()]
-
-        def _get_subscription_notifications(self):
-            with self.change_db_lock:
-                log.debug("self.change_db=%s", self.change_db)
-                assert len(self.change_db) > 0
-                for sub_point, changes in self.change_db:
-                    prefix = self.subpoint_paths[sub_point]
-                    updates = [gnmi_pb2.Update(path=remove_path_prefix(path, prefix),
-                                               val=value)
-                               for _op, path, value in changes]
-                    log.debug("update=%s", updates)
-                    yield prefix, updates
-                self.change_db = []
-
-        def get_monitored_changes(self):
+                    for prefix, updates, deletes
+                    in self._get_subscription_notifications(changes)]
+
+        def _get_subscription_notifications(self, changes):
+            """
+            :param changes: list of (sub_point, ChangeOp, gNMI path,
+            LeafValue) taken from `change_buffer`
+            :return: (prefix, updates, deletes) for every sub_point
+            """
+            log.debug("changes=%s", changes)
+            sub_point_changes = {}
+            for sub_point, op, path, value in changes:
+                sub_point_changes.setdefault(sub_point, []).append(
+                    (op, path, value))
+            for sub_point, changes in sub_point_changes.items():
+                prefix = self.subpoint_paths[sub_point]
+                # values are encoded when sent, coalesced changes are
+                # never encoded
+                updates = [
+                    gnmi_pb2.Update(
+                        path=remove_path_prefix(path, prefix),
+                        val=self.adapter.make_gnmi_value(
+                            value.value, value.node,
+                            self.subscription_list.encoding))
+                    for op, path, value in changes
+                    if op != self.ChangeOp.DELETED]
+                deletes = [remove_path_prefix(path, prefix)
+                           for op, path, _value in changes
+                           if op == self.ChangeOp.DELETED]
+                log.debug("update=%s deletes=%s", updates, deletes)
+                yield prefix, updates, deletes
+
+        def get_monitored_changes(self, changes):
             raise NotImplementedError
 
         def get_sample(self, path, prefix,
                        start_change_processing=False):
             log.debug("==>")
-            pathstr = make_xpath_path(path, prefix, quote_val=True)
             datatype = gnmi_pb2.GetRequest.DataType.ALL
-            updates = self.adapter.get_updates_with_maapi_save(pathstr, datatype)
-            sample = [gnmi_pb2.Update(path=remove_path_prefix(u.path, prefix),
+            updates = self.adapter.get_updates_with_maapi_save(
+                add_path_prefix(path, prefix), datatype,
+                self.subscription_list.encoding)
+            max_size = self.max_notification_bytes
+            if max_size:
+                # JSON data of a container can be one big update,
+                # split it so it fits into notifications
+                updates = (split for u in updates
+                           for split in self.adapter.split_json_update(
+                               u, max_size))
+            # updates are converted when sample is sent (see `make_responses`)
+            sample = (gnmi_pb2.Update(path=remove_path_prefix(u.path, prefix),
                                       val=u.val)
-                      for u in updates]
-            log.debug("<== sample=%s", sample)
+                      for u in updates)
+            log.debug("<==")
             return sample
 
         def add_path_for_monitoring(self, path, prefix):
@@ -157,232 +371,111 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
             log.debug("<== xpath=%s", xpath)
             return xpath
 
-        class ChangeOp(Enum):
-            MODIFIED = "mod"
+        ChangeOp = ChangeOp
+
+        @staticmethod
+        def _change_key(sub_point, path):
+            return (sub_point,) + tuple(
+                (e.name, tuple(sorted(e.key.items()))) for e in path.elem)
 
         def _append_changes(self, sub_point, changes):
             """
+            Add changes to `change_buffer` (changes of the same path
+            are coalesced).
             :param sub_point:
-            :param change_tuple: 3 elem tuple (o, gnmi path, val)
+            :param changes: list of 3 elem tuples (op, gnmi path, val)
             :return:
             """
-            log.debug("==> change_tuple=%s", changes)
-            with self.change_db_lock:
-                self.change_db.append((sub_point, changes))
+            log.debug("==> changes=%s", changes)
+            for op, path, value in changes:
+                self.change_buffer.add(self._change_key(sub_point, path),
+                                       (sub_point, op, path, value),
+                                       delete=op == self.ChangeOp.DELETED)
             log.debug("<==")
 
-        def process_subscription(self, sub_sock, sub_point):
-            log.debug("==>")
-
-            def cdb_iter(kp, op, oldv, newv, changes):
-                log.debug("==> kp=%s, op=%r, oldv=%s, newv=%s, state=%r", kp,
-                          op, oldv, newv, changes)
-                csnode = _confd.cs_node_cd(None, _confd.pp_kpath(kp))
-                if op == _confd.MOP_CREATED:
-                    log.debug("_confd.MOP_CREATED")
-                    # TODO CREATE not handled for now
-                if op == _confd.MOP_VALUE_SET:
-                    log.debug("_confd.MOP_VALUE_SET")
-                    changes.append((self.ChangeOp.MODIFIED,
-                                    self.adapter.make_gnmi_keypath(kp, csnode),
-                                    self.adapter.make_gnmi_json_value(newv, csnode)))
-                    # TODO MOP_VALUE_SET implement
-                elif op == _confd.MOP_DELETED:
-                    log.debug("_confd.MOP_DELETED")
-                    # TODO DELETE not handled for now
-                elif op == _confd.MOP_MODIFIED:
-                    log.debug("_confd.MOP_MODIFIED")
-                    # TODO MODIFIED not handled for now
-                else:
-                    log.warning(
-                        "Operation op=%d is not expected, kp=%s. Skipping!",
-                        op, kp)
-                return _confd.ITER_RECURSE
-
-            changes = []
-            cdb.diff_iterate(sub_sock, sub_point, cdb_iter, 0, changes)
+        def hub_changes(self, sub_point, changes):
+            """
+            Called (from CdbSubscriptionHub thread) with changes of
+            monitored path.
+            :param sub_point: index of monitored path
+            :param changes: list of (ChangeOp, gNMI path, value)
+            """
             self._append_changes(sub_point, changes)
-            self.put_event(self.SubscriptionEvent.SEND_CHANGES)
-            log.debug("self.change_db=%s", self.change_db)
-            log.debug("<==")
+            self.notify_changes()
+
+        def hub_error(self, sub_point, error):
+            log.warning("CDB subscription failed sub_point=%s error=%s",
+                        sub_point, error)
+            self.stop()
 
-        def _external_changes(self, data):
-            data_iter = iter(data)
-            for op, xpath, value in zip(data_iter, data_iter, data_iter):
-                fxpath = self.adapter.fix_path_prefixes(xpath)
-                csnode = _confd.cs_node_cd(None, fxpath)
-                path = make_gnmi_path(xpath)
-                cval = _confd.Value.str2val(value, csnode.info().type())
-                json_value = self.adapter.make_gnmi_json_value(cval, csnode)
-                yield op, path, json_value
-
-        def process_external_change(self, ext_sock):
-            log.info("==>")
-            connection, client_address = ext_sock.accept()
-            with connection:
-                # TODO make const
-                msg = connection.recv(1024)
-                log.debug("msg=%s", msg)
-                # simple protocol (just for illustration, real implementation
-                # should be more robust as not everything may come at once)
-                # the msg string should contain N strings separated by \n
-                # op1\nxpath1\nval1\nop2\nxpath2\nval2 .....
-                # op1 .. first operation1, xpath1 .... first xpath, ...
-                # op is string used in ChangeOp Enum class
-                # currently operation can be only "modified"
-                # the size must be smaller then size in recv
-                data = msg.decode().split('\n')
-                assert len(data) % 3 == 0
-                self._append_changes(EXT_SPOINT, list(self._external_changes(data)))
-                self.put_event(self.SubscriptionEvent.SEND_CHANGES)
-                log.debug("data=%s", data)
-            log.info("<==")
-
-        def subscribe_monitored_paths_cdb(self, sub_sock):
+        def monitored_base_path(self, path, schema_node):
+            """
+            Nearest container of monitored `path` (the path itself, if it is
+            container). Changes are read relative to it (a leaf has no
+            children and changes relative to list entry cannot express its
+            delete) and passed to listener only if they are in `path`
+            (see fan_out). It is also notification prefix of the changes.
+            :return: gNMI path, empty for top level list or leaf
+            """
+            elems = list(path.elem)
+            node = schema_node
+            while elems and (node.is_list or node.csnode.children() is None):
+                elems.pop()
+                if elems:
+                    node = self.adapter.get_schema_node(
+                        gnmi_pb2.Path(elem=elems))
+            return gnmi_pb2.Path(elem=elems, origin=path.origin,
+                                 target=path.target)
+
+        def subscribe_monitored_paths(self):
             """
-            Subscribe to monitored paths
-            :param sub_sock:
-            :return: True, if some path is not in CDB
+            Subscribe to monitored paths - CDB paths with shared
+            CdbSubscriptionHub, other paths with shared ExternalChangeServer
+            (if external changes are monitored).
             """
-            log.debug("==> sub_sock=%s", sub_sock)
-            prio = 10
-            subscribed = has_non_cdb = False
+            log.debug("==>")
+            hub = CdbSubscriptionHub.get_hub(self.adapter.addr,
+                                             self.adapter.port)
             # make subscription for all self.monitored_paths in CDB
-            for path in self.monitored_paths:
+            for sub_point, path in enumerate(self.monitored_paths):
                 log.debug("subscribing config path=%s", path)
-                # TODO hash - breaks generic usage
                 # TODO for now we subscribe path for both, config and oper,
                 # TODO subscribe only for paths that exist
                 # it may be more efficient to find out type of path and subscribe
                 # only for one type
-                path_str = self.adapter.fix_path_prefixes(make_formatted_path(path))
-                cs_node = _confd.cs_node_cd(None, path_str)
-                if cs_node.info().flags() & _confd.CS_NODE_IS_LIST != 0 \
-                   and not path.elem[-1].key:
-                    subpoint_path = gnmi_pb2.Path(elem=path.elem[:-1],
-                                                  origin=path.origin,
-                                                  target=path.target)
-                else:
-                    subpoint_path = path
-                flags = cs_node.info().flags()
+                schema_node = self.adapter.get_schema_node(path)
+                base_path = self.monitored_base_path(path, schema_node)
+                flags = schema_node.flags
                 is_cdb = flags & _confd.CS_NODE_IS_CDB
                 if is_cdb:
-                    subscribed = True
                     cdb_type = cdb.SUB_RUNNING if flags & _confd.CS_NODE_IS_WRITE \
                         else cdb.SUB_OPERATIONAL
-                    spoint = cdb.subscribe2(sub_sock, cdb_type, 0, prio, 0, path_str)
-                    self.subpoint_paths[spoint] = subpoint_path
-                else:
-                    has_non_cdb = True
-            if subscribed:
-                cdb.subscribe_done(sub_sock)
-            log.debug("<== has_non_cdb=%s", has_non_cdb)
-            return has_non_cdb
-
-        def start_external_change_server(self):
-            """
-            Start external change server
-            :return: socket to listen for changes
-            """
-            log.debug("==>")
-            log.info("Starting external change server!")
-            ext_server_sock = socket()
-            # TODO port (host) as const or command line option
-            ext_server_sock.bind(("localhost",
-                                  GnmiConfDApiServerAdapter.external_port))
-            ext_server_sock.listen(5)
-            log.debug("<== ext_server_sock=%s", ext_server_sock)
-            return ext_server_sock
-
-        def socket_loop(self, sub_sock, ext_server_sock=None):
-            log.debug("==> sub_sock=%s ext_server_sock=%s", sub_sock,
-                      ext_server_sock)
-            rlist = [sub_sock, self.stop_pipe[0]]
-            if ext_server_sock is not None:
-                rlist.append(ext_server_sock)
-            wlist = elist = []
-            while True:
-                log.debug("rlist=%s", rlist)
-                r, w, e = select.select(rlist, wlist, elist)
-                log.debug("r=%s", r)
-                if ext_server_sock is not None and ext_server_sock in r:
-                    self.process_external_change(ext_server_sock)
-                if sub_sock in r:
-                    try:
-                        sub_info = cdb.read_subscription_socket2(
-                            sub_sock)
-                        for s in sub_info[2]:
-                            self.process_subscription(sub_sock, s)
-                        cdb.sync_subscription_socket(sub_sock,
-                                                     cdb.DONE_PRIORITY)
-                    except _confd.error.Error as e:
-                        # Callback error
-                        if e.confd_errno is _confd.ERR_EXTERNAL:
-                            log.exception(e)
-                        else:
-                            raise e
-                if self.stop_pipe[0] in r:
-                    v = os.read(self.stop_pipe[0], 1)
-                    assert v == b'x'
-                    log.debug("Stopping ConfD loop")
-                    break
-            log.debug("<==")
-
-        def process_changes(self, external_changes=False):
-            log.debug("==> external_changes=%s", external_changes)
-            with socket() as sub_sock:
-                cdb.connect(sub_sock, cdb.SUBSCRIPTION_SOCKET, '127.0.0.1',
-                            _confd.CONFD_PORT)
-                has_non_cdb = self.subscribe_monitored_paths_cdb(sub_sock)
-                log.debug("subscribe_done")
-                assert self.stop_pipe is not None
-                try:
-                    if external_changes and has_non_cdb:
-                        ext_server_sock = self.start_external_change_server()
-                        self.subpoint_paths[EXT_SPOINT] = gnmi_pb2.Path()
-                        with ext_server_sock:
-                            self.socket_loop(sub_sock, ext_server_sock)
-                    else:
-                        self.socket_loop(sub_sock)
-                except Exception as e:
-                    log.exception(e)
-                    self.stop()
+                    self.subpoint_paths[sub_point] = base_path
+                    hub.subscribe(self.adapter, self, sub_point, path,
+                                  base_path, cdb_type)
+                elif GnmiConfDApiServerAdapter.monitor_external_changes:
+                    self.subpoint_paths[EXT_SPOINT] = gnmi_pb2.Path()
+                    ExternalChangeServer.get_server(
+                        GnmiConfDApiServerAdapter.external_port).subscribe(
+                        self.adapter, self, EXT_SPOINT, path, gnmi_pb2.Path())
             log.debug("<==")
 
         def start_monitoring(self):
             log.debug("==>")
-            assert self.change_thread is None
-            assert self.stop_pipe is None
-            log.debug("** creating change_thread")
-            self.stop_pipe = os.pipe()
-            # TODO external change server always started,
-            # make optional by passing False
-            self.change_thread = \
-                threading.Thread(target=self.process_changes,
-                                 args=(
-                                     GnmiConfDApiServerAdapter.monitor_external_changes,))
-            log.debug("** starting change_thread")
-            self.change_thread.start()
-            log.debug("** change_thread started")
+            try:
+                self.subscribe_monitored_paths()
+            except Exception as e:
+                log.exception(e)
+                self.stop()
             log.debug("<==")
 
         def stop_monitoring(self):
             log.debug("==>")
-            # if there is an error during fetch of first subs. sample,
-            # we do not start change thread
-            if self.change_thread is None:
-                log.warning("Cannot stop change thread! Not started?")
-            else:
-                assert self.stop_pipe is not None
-                log.debug("** stopping change_thread")
-                # https://stackoverflow.com/a/4661284
-                os.write(self.stop_pipe[1], b'x')
-                self.change_thread.join()
-                log.debug("** change_thread joined")
-                self.change_thread = None
-                os.close(self.stop_pipe[0])
-                os.close(self.stop_pipe[1])
-                self.stop_pipe = None
+            CdbSubscriptionHub.get_hub(self.adapter.addr,
+                                       self.adapter.port).unsubscribe(self)
+            if GnmiConfDApiServerAdapter.monitor_external_changes:
+                ExternalChangeServer.get_server(
+                    GnmiConfDApiServerAdapter.external_port).unsubscribe(self)
             self.monitored_paths = []
             log.debug("<==")
 
@@ -405,37 +498,64 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
         self.port = port
         # TODO we are connecting low level maapi always, even though we  use
         # high level maapi only in some cases
-        # TODO parallel processing
         self.username = username
         self.password = password
+        if self.sessions is not None:
+            self.sessions.release()
+        # session pool is shared by all adapters of the user
+        self.sessions = MaapiSessionPool.get_pool(
+            self.addr, self.port, self.username, [self.username],
+            context="netconf", src_ip=self.addr,
+            max_sessions=GnmiConfDApiServerAdapter.max_sessions,
+            max_staleness=GnmiConfDApiServerAdapter.read_trans_max_staleness)
+        self.update_schema_snapshot()
         log.info(
             "<==  self.addr=%s self.port=%i self.username=%s self.password=:-)",
             self.addr, self.port, self.username)
 
+    def is_healthy(self):
+        # called when pooled adapter is leased
+        self.check_schema_snapshot()
+        return self.sessions is not None and self.sessions.probe()
+
+    def close(self):
+        with self.get_executor_lock:
+            if self.get_executor is not None:
+                self.get_executor.shutdown(wait=False)
+                self.get_executor = None
+        if self.sessions is not None:
+            self.sessions.release()
+            self.sessions = None
+
     # https://tools.ietf.org/html/rfc6022#page-8
-    # TODO pass username from request context
     def get_netconf_capabilities(self):
         log.info("==>")
-        context = "netconf"
-        groups = [self.username]
+        if not self.schema_snapshot.modules:
+            self.update_schema_snapshot()
+        values = [(namespace, f'{namespace}:{name}', "", revision)
+                  for namespace, name, revision
+                  in self.schema_snapshot.modules]
+        log.debug("values=%s", values)
+        log.info("<==")
+        return values
+
+    def capabilities_version(self):
+        """
+        ConfD module set id (one get_elem). Schema snapshot is updated
+        if the module set changed.
+        """
+        log.debug("==>")
         try:
-            with maapi.single_read_trans(self.username, context, groups,
-                                         src_ip=self.addr) as t:
-                root = maagic.get_root(t)
-                values = []
-                count = 0
-                for module in root.modules_state.module:
-                    log.debug("val=%s", module.name)
-                    name = f'{module.namespace}:{module.name}'
-                    values.append((module.namespace, name, "", module.revision))
-                    count += 1
-                    log.debug("Value element count=%d" % count)
-            log.debug("values=%s", values)
+            with self.sessions.read_trans() as t:
+                module_set_id = str(
+                    t.get_elem("/modules-state/module-set-id"))
         except Exception as e:
             log.exception(e)
-
-        log.info("<==")
-        return values
+            return None
+        if module_set_id != self.schema_snapshot.module_set_id:
+            self.update_schema_snapshot()
+        log.debug("<== module_set_id=%s", self.schema_snapshot.module_set_id)
+        return self.schema_snapshot.module_set_id
 
     def capabilities(self):
         log.info("==>")
@@ -451,98 +571,585 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
         return models
 
     def encodings(self):
-        return [gnmi_pb2.Encoding.JSON, gnmi_pb2.Encoding.JSON_IETF]
-
-    def make_gnmi_keypath_elems(self, keypath, csnode):
-        i = len(keypath) - 1
-        ns = 0
-
-        def csnode_list():
-            node = csnode
-            while node is not None:
-                yield node
-                node = node.parent()
-
-        for node in reversed(list(csnode_list())):
-            assert i >= 0
-            keys = {}
-            name = _confd.hash2str(keypath[i].tag)
-            if keypath[i].ns != ns:
-                ns = keypath[i].ns
-                name = f'{self.ns_to_module[ns]}:{name}'
-            i -= 1
-            if node.info().flags() & _confd.CS_NODE_IS_LIST != 0:
-                assert i >= 0 and isinstance(keypath[i], tuple)
-                keys = {_confd.hash2str(key): str(val)
-                        for (key, val) in zip(node.info().keys(), keypath[i])}
-                i -= 1
-            yield gnmi_pb2.PathElem(name=name, key=keys)
-
-    def make_gnmi_keypath(self, keypath, csnode=None):
-        if csnode is None:
-            csnode = _confd.cs_node_cd(None, _confd.pp_kpath(keypath))
-        return gnmi_pb2.Path(elem=list(self.make_gnmi_keypath_elems(keypath, csnode)))
-
-    def make_gnmi_json_value(self, value, csnode):
-        if value.confd_type() in INT_VALS:
-            json_value = int(value)
-        elif value.confd_type() == _confd.C_BOOL:
-            json_value = bool(value)
-        elif value.confd_type() == _confd.C_IDENTITYREF:
+        return [gnmi_pb2.Encoding.JSON, gnmi_pb2.Encoding.JSON_IETF,
+                gnmi_pb2.Encoding.PROTO]
+
+    def get_schema_node(self, path):
+        """
+        Get (cached) schema metadata of gNMI `path` (keys are ignored).
+        :return: SchemaNode or None if not found
+        """
+        self.check_schema_snapshot()
+        names = tuple(e.name for e in path.elem)
+        path_str = self.fix_path_prefixes("/" + "/".join(names))
+        return self.schema.get_by_path_str(names, path_str)
+
+    def make_gnmi_keypath(self, keypath, schema_node=None):
+        if schema_node is None:
+            self.check_schema_snapshot()
+            schema_node = self.schema.get_by_keypath(keypath)
+        return gnmi_pb2.Path(elem=schema_node.make_gnmi_path_elems(keypath))
+
+    def make_value_encoders(self):
+        """
+        Create dispatch tables of value encoders by ConfD value type
+        (`confd_type()`). Encoders are called with (ConfD value, ConfD
+        schema type), types without encoder use `val2str`.
+        :return: (JSON encoders, PROTO encoders)
+        """
+        def identityref(value, cs_type):
             # JSON formatting is different than what ConfD does by default
-            [prefix,idref] = value.val2str(csnode.info().type()).split(":")
-            json_value = f"{self.pfx_to_module[prefix]}:{idref}"
-        # empty, leaf-lists...
+            return self.fix_path_modules(value.val2str(cs_type))
+
+        def leaf_list(value, _cs_type):
+            return gnmi_pb2.TypedValue(leaflist_val=gnmi_pb2.ScalarArray(
+                element=[proto_encoders.get(v.confd_type(), proto_element)(
+                    v, None) for v in value.as_list()]))
+
+        def proto_element(value, _cs_type):
+            return gnmi_pb2.TypedValue(string_val=str(value))
+
+        json_encoders = {t: lambda v, _t: int(v) for t in INT_VALS}
+        json_encoders[_confd.C_BOOL] = lambda v, _t: bool(v)
+        json_encoders[_confd.C_IDENTITYREF] = identityref
+        # type empty
+        json_encoders[_confd.C_XMLTAG] = lambda v, _t: [None]
+
+        proto_encoders = {
+            t: lambda v, _t: gnmi_pb2.TypedValue(int_val=int(v))
+            for t in SIGNED_INT_VALS}
+        proto_encoders.update({
+            t: lambda v, _t: gnmi_pb2.TypedValue(uint_val=int(v))
+            for t in UNSIGNED_INT_VALS})
+        proto_encoders[_confd.C_BOOL] = \
+            lambda v, _t: gnmi_pb2.TypedValue(bool_val=bool(v))
+        proto_encoders[_confd.C_DECIMAL64] = \
+            lambda v, t: gnmi_pb2.TypedValue(
+                decimal_val=self.make_decimal64(
+                    v.val2str(t) if t is not None else str(v)))
+        proto_encoders[_confd.C_DOUBLE] = \
+            lambda v, _t: gnmi_pb2.TypedValue(double_val=float(str(v)))
+        proto_encoders[_confd.C_IDENTITYREF] = \
+            lambda v, t: gnmi_pb2.TypedValue(string_val=identityref(v, t))
+        # type empty
+        proto_encoders[_confd.C_XMLTAG] = \
+            lambda v, _t: gnmi_pb2.TypedValue(bool_val=True)
+        proto_encoders[_confd.C_LIST] = leaf_list
+        return json_encoders, proto_encoders
+
+    @staticmethod
+    def _val2str_json(value, cs_type):
+        return value.val2str(cs_type)
+
+    @staticmethod
+    def _val2str_proto(value, cs_type):
+        return gnmi_pb2.TypedValue(string_val=value.val2str(cs_type))
+
+    def make_leaf_encoders(self, csnode):
+        """
+        Create value encoders of leaf (leaf-list) `csnode`. Called once
+        for every schema node (see SchemaCache), so schema type lookups
+        are not repeated for every value.
+        :return: LeafEncoders
+        """
+        cs_type = csnode.info().type()
+        ctype = csnode.info().shallowtype()
+        json_encoders, proto_encoders = self.json_encoders, self.proto_encoders
+        val2str_json, val2str_proto = self._val2str_json, self._val2str_proto
+
+        def to_json(value):
+            return json_encoders.get(value.confd_type(), val2str_json)(
+                value, cs_type)
+
+        def to_gnmi_json(value):
+            return gnmi_pb2.TypedValue(
+                json_ietf_val=json.dumps(to_json(value)).encode())
+
+        def to_proto(value):
+            return proto_encoders.get(value.confd_type(), val2str_proto)(
+                value, cs_type)
+
+        if ctype == _confd.C_LIST:
+            def proto_json(json_value):
+                return gnmi_pb2.TypedValue(leaflist_val=gnmi_pb2.ScalarArray(
+                    element=[self.make_proto_element(v) for v in json_value]))
         else:
-            json_value = value.val2str(csnode.info().type())
-        gnmi_value = gnmi_pb2.TypedValue(json_ietf_val=json.dumps(json_value).encode())
-        return gnmi_value
+            def proto_json(json_value):
+                return self.make_proto_scalar(ctype, json_value)
 
-    def get_updates(self, trans, path_str, save_flags):
+        return LeafEncoders(json=to_json, gnmi_json=to_gnmi_json,
+                            proto=to_proto, proto_json=proto_json)
+
+    def make_json_value(self, value, csnode):
+        """
+        Convert ConfD value to JSON (RFC 7951) compatible Python value.
+        Values of schema nodes should be converted with their encoders
+        (`SchemaNode.encoders`).
+        """
+        return self.json_encoders.get(value.confd_type(), self._val2str_json)(
+            value, csnode.info().type())
+
+    @staticmethod
+    def make_decimal64(value_str):
+        """ Convert decimal string (e.g. "-1.50") to gnmi_pb2.Decimal64. """
+        whole, _sep, fraction = value_str.partition(".")
+        return gnmi_pb2.Decimal64(digits=int(whole + fraction),
+                                  precision=len(fraction))
+
+    @staticmethod
+    def make_proto_scalar(ctype, json_value):
+        """
+        Make PROTO (scalar) encoded value of leaf of ConfD type `ctype`.
+        :param ctype: ConfD value type (C_INT8, C_BOOL ...)
+        :param json_value: JSON value of the leaf (see `make_json_value`,
+                           64 bit numbers may be strings)
+        :return: gnmi_pb2.TypedValue (`string_val` if `json_value` does not
+                 match `ctype`, e.g. with union types)
+        """
+        try:
+            if ctype in SIGNED_INT_VALS:
+                return gnmi_pb2.TypedValue(int_val=int(json_value))
+            if ctype in UNSIGNED_INT_VALS:
+                return gnmi_pb2.TypedValue(uint_val=int(json_value))
+            if ctype == _confd.C_BOOL and isinstance(json_value, bool):
+                return gnmi_pb2.TypedValue(bool_val=json_value)
+            if ctype == _confd.C_DECIMAL64:
+                return gnmi_pb2.TypedValue(
+                    decimal_val=GnmiConfDApiServerAdapter.make_decimal64(
+                        str(json_value)))
+            if ctype == _confd.C_DOUBLE:
+                return gnmi_pb2.TypedValue(double_val=float(json_value))
+        except ValueError:
+            pass
+        if ctype == _confd.C_XMLTAG:
+            # type empty (JSON [null])
+            return gnmi_pb2.TypedValue(bool_val=True)
+        return gnmi_pb2.TypedValue(string_val=str(json_value))
+
+    @staticmethod
+    def make_proto_element(json_value):
+        """ Make PROTO encoded leaf-list element (type from JSON value). """
+        if isinstance(json_value, bool):
+            return gnmi_pb2.TypedValue(bool_val=json_value)
+        if isinstance(json_value, int):
+            return gnmi_pb2.TypedValue(int_val=json_value)
+        return gnmi_pb2.TypedValue(string_val=str(json_value))
+
+    @staticmethod
+    def make_gnmi_value(value, node, encoding=gnmi_pb2.Encoding.JSON_IETF):
+        """
+        Convert ConfD value of leaf `node` (SchemaNode) to gNMI value
+        of `encoding` (PROTO or JSON_IETF - used also for JSON).
+        """
+        if encoding == gnmi_pb2.Encoding.PROTO:
+            return node.encoders.proto(value)
+        return node.encoders.gnmi_json(value)
+
+    def _proto_updates(self, elems, data, node):
+        """
+        Split JSON `data` of `node` (SchemaNode) into updates of leaves
+        (and leaf-lists) with PROTO encoded values.
+        :param elems: list of gnmi_pb2.PathElem of `node`
+        :return: generator of gnmi_pb2.Update
+        """
+        if not isinstance(data, dict):
+            yield gnmi_pb2.Update(path=gnmi_pb2.Path(elem=elems),
+                                  val=node.encoders.proto_json(data))
+            return
+        for name, member in data.items():
+            child = self.schema.get_child(node, name)
+            if child is None:
+                log.warning("cannot find schema node of name=%s", name)
+                continue
+            if child.is_list:
+                key_names = child.elems[-1][1]
+                for entry in member:
+                    keys = {k: self._json_key_str(entry.get(k))
+                            for k in key_names}
+                    yield from self._proto_updates(
+                        elems + [gnmi_pb2.PathElem(name=name, key=keys)],
+                        entry, child)
+            else:
+                yield from self._proto_updates(
+                    elems + [gnmi_pb2.PathElem(name=name)], member, child)
+
+    def _json_updates(self, elems, data, node, max_size):
+        """
+        Make JSON updates of `data` of `node` (SchemaNode). If the update
+        is bigger than `max_size`, it is split into updates of child nodes
+        (list entries), recursively, so only updates of leaves (and of
+        nodes without children in `data`) may stay bigger.
+        :param elems: list of gnmi_pb2.PathElem of `node`
+        :return: generator of gnmi_pb2.Update
+        """
+        update = gnmi_pb2.Update(
+            path=gnmi_pb2.Path(elem=elems),
+            val=gnmi_pb2.TypedValue(json_ietf_val=json.dumps(data).encode()))
+        if update.ByteSize() <= max_size or not isinstance(data, dict) or \
+                not data:
+            yield update
+            return
+        for name, member in data.items():
+            child = self.schema.get_child(node, name)
+            if child is None:
+                log.warning("cannot find schema node of name=%s", name)
+                continue
+            if child.is_list:
+                key_names = child.elems[-1][1]
+                for entry in member:
+                    keys = {k: self._json_key_str(entry.get(k))
+                            for k in key_names}
+                    yield from self._json_updates(
+                        elems + [gnmi_pb2.PathElem(name=name, key=keys)],
+                        entry, child, max_size)
+            else:
+                yield from self._json_updates(
+                    elems + [gnmi_pb2.PathElem(name=name)], member, child,
+                    max_size)
+
+    def split_json_update(self, update, max_size):
+        """
+        Split JSON (`json_ietf_val`) update bigger than `max_size` bytes
+        into updates of child nodes (see `_json_updates`).
+        :param update: update with full path (with prefix)
+        :return: generator of gnmi_pb2.Update
+        """
+        if update.val.WhichOneof("value") != "json_ietf_val" or \
+                update.ByteSize() <= max_size:
+            yield update
+            return
+        node = self.get_schema_node(update.path)
+        if node is None or len(node.elems) != len(update.path.elem):
+            yield update
+            return
+        yield from self._json_updates(list(update.path.elem),
+                                      json.loads(update.val.json_ietf_val),
+                                      node, max_size)
+
+    def make_updates(self, path, data, node,
+                     encoding=gnmi_pb2.Encoding.JSON_IETF):
+        """
+        Make updates of JSON `data` of node `path`.
+        JSON encoded data is sent in one update, PROTO encoded data
+        is split into leaf updates (PROTO has only scalar values).
+        :param path: gNMI path of `data`
+        :param node: SchemaNode of `path`
+        :return: list of gnmi_pb2.Update
+        """
+        if encoding == gnmi_pb2.Encoding.PROTO:
+            return list(self._proto_updates(list(path.elem), data, node))
+        gnmi_value = gnmi_pb2.TypedValue(json_ietf_val=json.dumps(data).encode())
+        return [gnmi_pb2.Update(path=path, val=gnmi_value)]
+
+    def save_config_json(self, trans, save_flags, path_str):
+        """
+        Save data of `path_str` as JSON and return it parsed.
+        :param trans: transaction
+        :param save_flags: maapi save flags (CONFIG_JSON must be set)
+        :param path_str: formatted (keypath) path with module prefixes
+        :return: parsed JSON (`{"node": data}`) or None if there is no data
+        """
         log.debug("==> path_str=%s", path_str)
-        csnode = _confd.cs_node_cd(None, path_str)
+        save_id = trans.save_config(save_flags, path_str)
+        with socket() as save_sock:
+            _confd.stream_connect(sock=save_sock, id=save_id, flags=0,
+                                  ip=self.addr, port=self.port)
+            save_str = b''.join(iter(lambda: save_sock.recv(SAVE_RECV_SIZE), b''))
+        save_result = trans.maapi.save_config_result(save_id)
+        log.debug("save_result=%s", save_result)
+        assert save_result == 0
+        saved_data = json.loads(save_str) if save_str else None
+        log.debug("<== saved_data=%s", saved_data)
+        return saved_data
+
+    @staticmethod
+    def _json_key_str(value):
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+
+    @staticmethod
+    def _wildcard_indexes(path, schema_node):
+        """ Indexes of list elements of `path` without (all) keys. """
+        return [i for i, (elem, (_name, key_names))
+                in enumerate(zip(path.elem, schema_node.elems))
+                if key_names and len(elem.key) < len(key_names)]
+
+    def _has_wildcard(self, path, schema_node):
+        return len(self._wildcard_indexes(path, schema_node)) > 0
+
+    def _bulk_wildcard_index(self, path, schema_node):
+        """
+        Find index of the first list element of `path` without (all) keys.
+        Data of all such list entries can be read with one save of
+        the common ancestor.
+        :return: index or None, if `path` cannot be read in bulk
+        """
+        if len(schema_node.elems) != len(path.elem):
+            return None
+        wildcards = self._wildcard_indexes(path, schema_node)
+        # top level list has no ancestor to save (would be whole db)
+        if wildcards and wildcards[0] > 0:
+            return wildcards[0]
+        return None
+
+    def _json_member(self, data, node):
+        name = _confd.hash2str(node.tag())
+        if name in data:
+            return data[name]
+        return data.get(f'{self.ns_to_module[node.ns()]}:{name}')
+
+    def _split_bulk_data(self, data, path, schema_node, start):
+        """
+        Descend from ancestor `data` along `path` (from `start` element)
+        and split list entries into separate (PathElem list, data) items.
+        :param data: JSON data of ancestor (element `start` - 1)
+        :param path: requested gNMI path (keys may be missing)
+        :param schema_node: SchemaNode of `path`
+        :param start: index of first path element under ancestor
+        :return: generator of (PathElem list, data) for each matching node
+        """
+        items = [([], data)]
+        for i in range(start, len(path.elem)):
+            elem, node = path.elem[i], schema_node.nodes[i]
+            key_names = schema_node.elems[i][1]
+            next_items = []
+            for elems, value in items:
+                if not isinstance(value, dict):
+                    continue
+                member = self._json_member(value, node)
+                if member is None:
+                    continue
+                if key_names:
+                    for entry in member:
+                        keys = {k: self._json_key_str(entry.get(k))
+                                for k in key_names}
+                        if all(keys.get(k) == v for k, v in elem.key.items()):
+                            next_items.append(
+                                (elems + [(elem.name, keys)], entry))
+                else:
+                    next_items.append((elems + [(elem.name, {})], member))
+            items = next_items
+        for elems, value in items:
+            yield elems, value
+
+    def get_updates_bulk(self, trans, path, schema_node, wildcard,
+                         save_flags, encoding=gnmi_pb2.Encoding.JSON_IETF):
+        """
+        Read all list entries matching `path` with one save_config
+        of common ancestor (instead of saving every entry separately).
+        :param trans: transaction
+        :param path: gNMI path (with prefix)
+        :param schema_node: SchemaNode of `path`
+        :param wildcard: index of first list element without keys
+        :param save_flags: maapi save flags
+        :param encoding: gNMI encoding of values
+        :return: list of updates
+        """
+        log.debug("==> path=%s wildcard=%s", path, wildcard)
+        ancestor = gnmi_pb2.Path(elem=path.elem[:wildcard])
+        ancestor_str = self.fix_path_prefixes(make_formatted_path(ancestor))
+        saved_data = self.save_config_json(trans, save_flags, ancestor_str)
         updates = []
+        if saved_data:
+            assert len(saved_data) == 1
+            [data] = saved_data.values()
+            # list entry may be saved as array with one element
+            if isinstance(data, list):
+                assert len(data) == 1
+                data = data[0]
+            for elems, value in self._split_bulk_data(data, path, schema_node,
+                                                      wildcard):
+                gnmi_path = gnmi_pb2.Path(
+                    elem=list(ancestor.elem) + [
+                        gnmi_pb2.PathElem(name=name, key=keys)
+                        for name, keys in elems])
+                updates.extend(self.make_updates(
+                    gnmi_path, value, schema_node, encoding))
+        log.debug("<== len(updates)=%s", len(updates))
+        return updates
 
-        def add_update_json(keypath, _value):
-            save_id = trans.save_config(save_flags, _confd.pp_kpath(keypath))
-            with socket() as save_sock:
-                _confd.stream_connect(sock=save_sock, id=save_id, flags=0,
-                                      ip=self.addr, port=self.port)
-                max_msg_size = 1024
-                save_str = b''.join(iter(lambda: save_sock.recv(max_msg_size), b''))
-                if not save_str:
-                    return
-                saved_data = json.loads(save_str)
-                log.debug("data=%s", saved_data)
-                save_result = trans.maapi.save_config_result(save_id)
-                log.debug("save_result=%s", save_result)
-                assert save_result == 0
-                gnmi_path = self.make_gnmi_keypath(keypath, csnode)
+    @staticmethod
+    def _csnode_children(csnode):
+        child = csnode.children()
+        while child is not None:
+            yield child
+            child = child.next()
+
+    @staticmethod
+    def _is_leaf(node):
+        return node.children() is None and \
+            node.info().flags() & _confd.CS_NODE_IS_LEAF_LIST == 0
+
+    @staticmethod
+    def _is_data_type_node(node, save_flags):
+        """
+        Check if (leaf) `node` is part of data selected by `save_flags`
+        (config, state or both).
+        """
+        is_config = node.info().flags() & _confd.CS_NODE_IS_WRITE != 0
+        if save_flags & _confd.maapi.CONFIG_OPER_ONLY:
+            return not is_config
+        if save_flags & _confd.maapi.CONFIG_WITH_OPER:
+            return True
+        return is_config
+
+    def get_read_method(self, csnode):
+        """
+        Select cheapest ConfD read call for data of `csnode`.
+        :return: ReadMethod
+        """
+        if self._is_leaf(csnode):
+            return ReadMethod.GET_ELEM
+        if csnode.children() is not None and \
+                all(self._is_leaf(c) for c in self._csnode_children(csnode)):
+            return ReadMethod.GET_VALUES
+        return ReadMethod.SAVE_CONFIG
+
+    def _json_name(self, node, parent):
+        name = _confd.hash2str(node.tag())
+        if parent is None or node.ns() != parent.ns():
+            name = f'{self.ns_to_module[node.ns()]}:{name}'
+        return name
+
+    def read_leaf(self, trans, path_str, node, save_flags):
+        """
+        Read leaf value with get_elem.
+        :param node: SchemaNode of the leaf
+        :return: JSON value or None if leaf does not exist
+        """
+        if not self._is_data_type_node(node.csnode, save_flags):
+            return None
+        return node.encoders.json(trans.get_elem(path_str))
+
+    def read_values(self, trans, path_str, node, save_flags):
+        """
+        Read all leaves of container or list entry with one get_values.
+        :param node: SchemaNode of the container or list
+        :return: JSON object (dict) or None if no value exists
+        """
+        children = [c for c in self.schema.get_children(node)
+                    if self._is_data_type_node(c.csnode, save_flags)]
+        if not children:
+            return None
+        tag_values = [_confd.TagValue(_confd.XmlTag(c.csnode.ns(),
+                                                    c.csnode.tag()),
+                                      _confd.Value(None, _confd.C_NOEXISTS))
+                      for c in children]
+        tag_values = trans.get_values(tag_values, path_str)
+        data = {self._json_name(c.csnode, node.csnode): c.encoders.json(tv.v)
+                for c, tv in zip(children, tag_values)
+                if tv.v.confd_type() != _confd.C_NOEXISTS}
+        return data if data else None
+
+    def get_updates_direct(self, trans, path, schema_node, save_flags,
+                           encoding=gnmi_pb2.Encoding.JSON_IETF):
+        """
+        Read data of `path` (no list wildcards) selecting read call based on
+        schema node type (see `get_read_method`).
+        :param trans: transaction
+        :param path: gNMI path (with prefix, all list keys)
+        :param schema_node: SchemaNode of `path`
+        :param save_flags: maapi save flags
+        :param encoding: gNMI encoding of values
+        :return: list of updates
+        """
+        csnode = schema_node.csnode
+        method = self.get_read_method(csnode)
+        log.debug("==> path=%s method=%s", path, method)
+        path_str = self.fix_path_prefixes(make_formatted_path(path))
+        if method == ReadMethod.SAVE_CONFIG:
+            saved_data = self.save_config_json(trans, save_flags, path_str)
+            data = None
+            if saved_data:
                 # the format of saved_data is {"node": {data}}
-                # we need only the data part
                 assert len(saved_data) == 1
                 [data] = saved_data.values()
-                gnmi_value = gnmi_pb2.TypedValue(json_ietf_val=json.dumps(data).encode())
-                updates.append(gnmi_pb2.Update(path=gnmi_path, val=gnmi_value))
+        else:
+            read_fun = self.read_leaf if method == ReadMethod.GET_ELEM \
+                else self.read_values
+            try:
+                data = read_fun(trans, path_str, schema_node, save_flags)
+            except _confd.error.Error as e:
+                if e.confd_errno not in (_confd.ERR_NOEXISTS,
+                                         _confd.ERR_BADPATH):
+                    raise
+                data = None
+        updates = []
+        if data is not None:
+            updates = self.make_updates(gnmi_pb2.Path(elem=path.elem), data,
+                                        schema_node, encoding)
+        log.debug("<== updates=%s", updates)
+        return updates
 
-        if csnode is None:
+    def get_updates(self, trans, path, save_flags,
+                    encoding=gnmi_pb2.Encoding.JSON_IETF):
+        """
+        Get updates for gNMI `path`.
+        Paths without list wildcards are read with get_elem (leaves),
+        get_values (containers and list entries with leaves only) or
+        save_config (other nodes).
+        Paths with list wildcards are read with one save_config of their
+        common ancestor (see `bulk_get`), otherwise each matching node is
+        saved separately.
+        :param trans: transaction
+        :param path: gNMI path (with prefix)
+        :param save_flags: maapi save flags
+        :param encoding: gNMI encoding of values
+        :return: list of updates
+        """
+        path_str = self.fix_path_prefixes(make_xpath_path(path, quote_val=True))
+        log.debug("==> path_str=%s", path_str)
+        schema_node = self.get_schema_node(path)
+        updates = []
+        if schema_node is None:
             log.warning('failed to find the cs-node')
-        else:
-            trans.xpath_eval(path_str, add_update_json, None, '/')
+            return updates
+        if len(schema_node.elems) == len(path.elem) and \
+                not self._has_wildcard(path, schema_node):
+            return self.get_updates_direct(trans, path, schema_node,
+                                           save_flags, encoding)
+        if GnmiConfDApiServerAdapter.bulk_get:
+            wildcard = self._bulk_wildcard_index(path, schema_node)
+            if wildcard is not None:
+                return self.get_updates_bulk(trans, path, schema_node,
+                                             wildcard, save_flags, encoding)
+
+        def add_update_json(keypath, _value):
+            saved_data = self.save_config_json(trans, save_flags,
+                                               _confd.pp_kpath(keypath))
+            if not saved_data:
+                return
+            gnmi_path = self.make_gnmi_keypath(keypath, schema_node)
+            # the format of saved_data is {"node": {data}}
+            # we need only the data part
+            assert len(saved_data) == 1
+            [data] = saved_data.values()
+            updates.extend(self.make_updates(gnmi_path, data, schema_node,
+                                             encoding))
+
+        trans.xpath_eval(path_str, add_update_json, None, '/')
         log.debug("<== save_str=%s", updates)
         return updates
 
     def fix_path_prefixes(self, path):
-        def module_to_prefix(match):
-            name = match.groups()[0]
-            return self.module_to_pfx.get(name, name) + ':'
-        return re.sub(r'([^/:]+):', module_to_prefix, path)
+        """ Replace module names in `path` with prefixes. """
+        return self.module_to_pfx_translator.translate(path)
 
-    def get_updates_with_maapi_save(self, path, data_type):
-        log.debug("==> path=%s data_type=%s", path, data_type)
+    def fix_path_modules(self, path):
+        """ Replace prefixes in `path` (or identityref) with module names. """
+        return self.pfx_to_module_translator.translate(path)
 
-        pfx_path = self.fix_path_prefixes(path)
-        save_flags = _confd.maapi.CONFIG_JSON | _confd.maapi.CONFIG_NO_PARENTS
+    @staticmethod
+    def get_db_and_save_flags(data_type):
+        """
+        :param data_type: gNMI GetRequest data type
+        :return: (db, save_flags) for reading of `data_type` data
+        """
+        # get_elem and get_values return default values, so save_config
+        # includes them as well (result does not depend on read method)
+        save_flags = _confd.maapi.CONFIG_JSON | _confd.maapi.CONFIG_NO_PARENTS | \
+            _confd.maapi.CONFIG_WITH_DEFAULTS
         db = _confd.OPERATIONAL
 
         if data_type == gnmi_pb2.GetRequest.DataType.ALL:
@@ -553,27 +1160,81 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
             save_flags |= _confd.maapi.CONFIG_OPER_ONLY
         elif data_type == gnmi_pb2.GetRequest.DataType.OPERATIONAL:
             save_flags |= _confd.maapi.CONFIG_OPER_ONLY
+        return db, save_flags
 
-        context = "netconf"
-        groups = [self.username]
+    def get_updates_with_maapi_save(self, path, data_type,
+                                    encoding=gnmi_pb2.Encoding.JSON_IETF):
+        log.debug("==> path=%s data_type=%s", path, data_type)
+        db, save_flags = self.get_db_and_save_flags(data_type)
         updates = []
         try:
-            with maapi.single_read_trans(self.username, context, groups, db=db,
-                                         src_ip=self.addr) as t:
-                updates = self.get_updates(t, pfx_path, save_flags)
+            with self.sessions.read_trans(db) as t:
+                updates = self.get_updates(t, path, save_flags, encoding)
         except Exception as e:
             log.exception(e)
 
         log.debug("<== up=%s", updates)
         return updates
 
-    def get(self, prefix, paths, data_type, use_models):
-        log.info("==> prefix=%s, paths=%s, data_type=%s, use_models=%s",
-                 prefix, paths, data_type, use_models)
+    def get_updates_snapshot(self, paths, data_type,
+                             encoding=gnmi_pb2.Encoding.JSON_IETF):
+        """
+        Read all `paths` in one read transaction (consistent snapshot).
+        :return: list of update lists (one for each path)
+        """
+        log.debug("==> paths=%s data_type=%s", paths, data_type)
+        db, save_flags = self.get_db_and_save_flags(data_type)
+        updates = [[] for _ in paths]
+        try:
+            with self.sessions.read_trans(db) as t:
+                for i, path in enumerate(paths):
+                    try:
+                        updates[i] = self.get_updates(t, path, save_flags,
+                                                      encoding)
+                    except _confd.error.Error as e:
+                        log.exception(e)
+        except Exception as e:
+            log.exception(e)
+        log.debug("<== updates=%s", updates)
+        return updates
+
+    def get_updates_parallel(self, paths, data_type,
+                             encoding=gnmi_pb2.Encoding.JSON_IETF):
+        """
+        Read `paths` concurrently, every path in own read transaction of
+        pooled MAAPI session (see `max_sessions`).
+        :return: list of update lists (one for each path)
+        """
+        log.debug("==> paths=%s data_type=%s", paths, data_type)
+        if len(paths) <= 1:
+            updates = [self.get_updates_with_maapi_save(path, data_type,
+                                                        encoding)
+                       for path in paths]
+        else:
+            with self.get_executor_lock:
+                if self.get_executor is None:
+                    self.get_executor = ThreadPoolExecutor(
+                        max_workers=GnmiConfDApiServerAdapter.max_sessions,
+                        thread_name_prefix="confd_get")
+            updates = list(self.get_executor.map(
+                lambda path: self.get_updates_with_maapi_save(path, data_type,
+                                                              encoding),
+                paths))
+        log.debug("<== updates=%s", updates)
+        return updates
+
+    def get(self, prefix, paths, data_type, use_models,
+            encoding=gnmi_pb2.Encoding.JSON_IETF):
+        log.info("==> prefix=%s, paths=%s, data_type=%s, use_models=%s "
+                 "encoding=%s", prefix, paths, data_type, use_models, encoding)
         notifications = []
-        updates2 = [self.get_updates_with_maapi_save(make_xpath_path(path, prefix, quote_val=True),
-                                                     data_type)
-                    for path in paths]
+        full_paths = [add_path_prefix(path, prefix) for path in paths]
+        if GnmiConfDApiServerAdapter.get_mode == GET_MODE_PARALLEL:
+            updates2 = self.get_updates_parallel(full_paths, data_type,
+                                                 encoding)
+        else:
+            updates2 = self.get_updates_snapshot(full_paths, data_type,
+                                                 encoding)
         updates = [gnmi_pb2.Update(path=remove_path_prefix(update.path, prefix), val=update.val)
                    for u_list in updates2
                    for update in u_list]
@@ -585,52 +1246,134 @@ class GnmiConfDApiServerAdapter(GnmiServerAdapter):
         log.info("<== notifications=%s", notifications)
         return notifications
 
+    def _json_key_values(self, list_node, keys):
+        """
+        Convert key values of gNMI path element to JSON values.
+        :param list_node: schema node of the list
+        :param keys: gNMI path element keys (name -> string value)
+        :return: dict key name -> JSON value
+        """
+        key_nodes = {_confd.hash2str(c.tag()): c
+                     for c in self._csnode_children(list_node)
+                     if c.tag() in list_node.info().keys()}
+        unknown = [name for name in keys if name not in key_nodes]
+        if unknown:
+            raise ValueError(f"Unknown key(s) {unknown} of list "
+                             f"{_confd.hash2str(list_node.tag())}, "
+                             f"expected {list(key_nodes)}")
+        values = {}
+        for name, val in keys.items():
+            key_node = key_nodes[name]
+            cval = _confd.Value.str2val(self.fix_path_prefixes(val),
+                                        key_node.info().type())
+            values[name] = self.make_json_value(cval, key_node)
+        return values
+
+    def make_load_json(self, path, json_value):
+        """
+        Wrap `json_value` of `path` into JSON data tree starting at the root
+        (as expected by load_config).
+        :param path: gNMI path (with prefix)
+        :param json_value: JSON (RFC 7951) value of the node
+        :return: JSON data tree
+        """
+        schema_node = self.get_schema_node(path)
+        if schema_node is None or len(schema_node.elems) != len(path.elem):
+            raise ValueError(f"Cannot find schema node for path {path}")
+        data = json_value
+        for i in reversed(range(len(path.elem))):
+            name, key_names = schema_node.elems[i]
+            elem = path.elem[i]
+            if key_names and elem.key:
+                entry = self._json_key_values(schema_node.nodes[i], elem.key)
+                if isinstance(data, dict):
+                    entry.update(data)
+                data = [entry]
+            data = {name: data}
+        return {"data": data}
+
+    def load_json(self, trans, data, flags=_confd.maapi.CONFIG_MERGE):
+        """
+        Load JSON `data` into transaction with one load_config_stream.
+        :param trans: write transaction
+        :param data: JSON data tree (see `make_load_json`)
+        :param flags: load flags (CONFIG_JSON is added)
+        """
+        log.debug("==> data=%s flags=%s", data, flags)
+        load_id = trans.load_config_stream(_confd.maapi.CONFIG_JSON | flags)
+        with socket() as load_sock:
+            _confd.stream_connect(sock=load_sock, id=load_id, flags=0,
+                                  ip=self.addr, port=self.port)
+            load_sock.sendall(json.dumps(data).encode())
+        load_result = trans.maapi.load_config_stream_result(load_id)
+        log.debug("<== load_result=%s", load_result)
+        if load_result != 0:
+            raise ValueError(f"load_config failed with result {load_result}")
+
+    @staticmethod
+    def proto_value_str(val):
+        """ String (ConfD) representation of PROTO scalar `val`. """
+        kind = val.WhichOneof("value")
+        if kind == "bool_val":
+            return "true" if val.bool_val else "false"
+        if kind == "decimal_val":
+            return str(decode_typed_value(val))
+        if kind == "float_val":
+            # single precision, do not show float32 -> float64 conversion
+            # digits (0.1 and not 0.10000000149011612)
+            return f"{val.float_val:.7g}"
+        return str(getattr(val, kind))
+
     def set_update(self, trans, prefix, path, val):
-        path_str = self.fix_path_prefixes(make_formatted_path(path, prefix))
-        if val.string_val:
-            trans.set_elem(val.string_val, path_str)
-        elif val.json_ietf_val:
+        """
+        Set (or load) value `val` of `path` in write transaction.
+        :raises NotImplementedError: if value type (e.g. leaflist_val)
+                                     is not supported
+        """
+        kind = val.WhichOneof("value")
+        if kind in PROTO_SCALAR_VALS:
+            path_str = self.fix_path_prefixes(make_formatted_path(path, prefix))
+            trans.set_elem(self.proto_value_str(val), path_str)
+        elif kind == "json_ietf_val":
             jval = json.loads(val.json_ietf_val)
-
-            def update_paths(path, val, parent_node):
-                # TODO: no support for list instances
-                csnode = _confd.cs_node_cd(parent_node, path)
-                if isinstance(val, dict):
-                    trans.pushd(path)
-                    for leaf, value in val.items():
-                        update_paths(self.fix_path_prefixes(leaf), value, csnode)
-                else:
-                    if csnode.info().shallow_type() == _confd.C_IDENTITYREF:
-                        # in JSON, identityrefs are prefixed by module name
-                        val = self.fix_path_prefixes(val)
-                    trans.set_elem(val, path)
-            update_paths(path_str, jval, None)
+            self.load_json(trans,
+                           self.make_load_json(add_path_prefix(path, prefix),
+                                               jval))
+        else:
+            raise NotImplementedError(
+                f"gNMI: unsupported Set value type {kind} "
+                f"(path {make_xpath_path(path, prefix)})")
         op = gnmi_pb2.UpdateResult.UPDATE
         return op
 
-    def set(self, prefix, updates):
-        log.info("==> prefix=%s, updates=%s", prefix, updates)
-        context = "netconf"
-        groups = [self.username]
-        with maapi.single_write_trans(self.username, context, groups,
-                                      src_ip=self.addr) as t:
-            ops = [(up.path, self.set_update(t, prefix, up.path, up.val))
-                   for up in updates]
-            t.apply()
-
-        log.info("==> ops=%s", ops)
-        return ops
-
-    def delete(self, prefix, paths):
-        log.info("==> prefix=%s, paths=%s", prefix, paths)
-        context = "netconf"
-        groups = [self.username]
-        with maapi.single_write_trans(self.username, context, groups, src_ip=self.addr) as t:
-            ops = []
-            for path in paths:
+    def set_request(self, prefix, delete, replace, update):
+        """
+        Apply deletes, replaces and updates in one write transaction
+        with single apply().
+        """
+        log.info("==> prefix=%s, delete=%s, replace=%s, update=%s",
+                 prefix, delete, replace, update)
+        ops = []
+        with self.sessions.write_trans() as t:
+            for path in delete:
                 t.delete(self.fix_path_prefixes(make_formatted_path(path, prefix)))
                 ops.append((path, gnmi_pb2.UpdateResult.DELETE))
+            for up in replace:
+                path_str = self.fix_path_prefixes(make_formatted_path(up.path, prefix))
+                if t.exists(path_str):
+                    t.delete(path_str)
+                self.set_update(t, prefix, up.path, up.val)
+                ops.append((up.path, gnmi_pb2.UpdateResult.REPLACE))
+            for up in update:
+                ops.append((up.path,
+                            self.set_update(t, prefix, up.path, up.val)))
             t.apply()
 
-        log.info("==> ops=%s", ops)
+        log.info("<== ops=%s", ops)
         return ops
+
+    def set(self, prefix, updates):
+        return self.set_request(prefix, [], [], updates)
+
+    def delete(self, prefix, paths):
+        return self.set_request(prefix, paths, [], [])
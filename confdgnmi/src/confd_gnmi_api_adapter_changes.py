@@ -0,0 +1,673 @@
+import json
+import logging
+import os
+import selectors
+import threading
+from collections import deque
+from enum import Enum
+from typing import Any, NamedTuple
+from socket import socket, SOL_SOCKET, SO_REUSEADDR
+
+import _confd
+from confd.cdb import cdb
+
+import gnmi_pb2
+from confd_gnmi_common import make_formatted_path, make_gnmi_path
+
+log = logging.getLogger('confd_gnmi_api_adapter_changes')
+
+
+class ChangeOp(Enum):
+    MODIFIED = "mod"
+    DELETED = "del"
+
+
+class LeafValue(NamedTuple):
+    """
+    ConfD value of changed leaf and its SchemaNode. It is encoded (see
+    GnmiConfDApiServerAdapter.make_gnmi_value) with encoding of every
+    subscription when the change is sent.
+    """
+    value: Any
+    node: Any
+
+
+def _elem_name(name):
+    """ Element name without module prefix. """
+    return name.split(':', 1)[-1]
+
+
+def path_contains(path, sub_path):
+    """
+    Check if `sub_path` is equal to or below `path`.
+    Missing keys of `path` elements match any value, module prefixes of
+    element names are ignored.
+    :param path: gNMI path
+    :param sub_path: gNMI path
+    :return: True if `path` contains `sub_path`
+    """
+    if len(path.elem) > len(sub_path.elem):
+        return False
+    for elem, sub_elem in zip(path.elem, sub_path.elem):
+        if _elem_name(elem.name) != _elem_name(sub_elem.name):
+            return False
+        if any(sub_elem.key.get(k) != v for k, v in elem.key.items()):
+            return False
+    return True
+
+
+def rebase_path(prefix, path):
+    """
+    Use element names of `prefix` for the leading elements of `path`
+    (e.g. to make element names same as in subscription request).
+    """
+    elems = [gnmi_pb2.PathElem(name=p.name, key=e.key)
+             for p, e in zip(prefix.elem, path.elem)]
+    return gnmi_pb2.Path(elem=elems + list(path.elem[len(elems):]))
+
+
+def fan_out(listeners, changes):
+    """
+    Pass changes to all listeners interested in them (change path is
+    in monitored path or deleted node contains monitored path).
+    :param listeners: list of (listener, key, monitored path,
+                      notification prefix)
+    :param changes: list of (ChangeOp, gNMI path, value)
+    """
+    def interested(path, op, change_path):
+        if path_contains(path, change_path):
+            return True
+        return op == ChangeOp.DELETED and path_contains(change_path, path)
+
+    for listener, key, path, prefix in list(listeners):
+        listener_changes = [
+            (op, rebase_path(prefix, change_path), value)
+            for op, change_path, value in changes
+            if interested(path, op, change_path)]
+        if listener_changes:
+            listener.hub_changes(key, listener_changes)
+
+
+class ChangeDecoder:
+    """
+    Convert CDB subscription changes to (ChangeOp, gNMI path, LeafValue)
+    tuples (value is None for ChangeOp.DELETED).
+    """
+
+    def __init__(self, adapter):
+        """
+        :param adapter: GnmiConfDApiServerAdapter (used for schema lookups
+                        and value encoding, no ConfD session is needed)
+        """
+        self.adapter = adapter
+        # tag path -> (tag path, child schema node, key tags, SchemaNode)
+        self.modified_nodes = {}
+        # schema snapshot of `modified_nodes`
+        self.schema_snapshot = None
+
+    def check_schema(self):
+        """
+        Drop cached schema nodes if schema snapshot changed (schema nodes
+        of previous snapshot are not valid after schemas are reloaded).
+        """
+        self.adapter.check_schema_snapshot()
+        if self.schema_snapshot is not self.adapter.schema_snapshot:
+            self.modified_nodes = {}
+            self.schema_snapshot = self.adapter.schema_snapshot
+
+    def _modified_node(self, parent_key, parent_csnode, ns, tag):
+        """
+        Find (cached) child schema node of modified data node.
+        :return: (tag path, schema node, key tags, SchemaNode with
+                 value encoders)
+        """
+        key = parent_key + ((ns, tag),)
+        node_info = self.modified_nodes.get(key)
+        if node_info is None:
+            child = parent_csnode.children()
+            while child is not None and \
+                    (child.tag() != tag or child.ns() != ns):
+                child = child.next()
+            if child is None:
+                raise ValueError(f"Cannot find schema node for tag "
+                                 f"{_confd.hash2str(tag)}")
+            key_tags = []
+            if child.info().flags() & _confd.CS_NODE_IS_LIST != 0:
+                key_tags = list(child.info().keys())
+            node_info = (key, child, key_tags,
+                         self.adapter.schema.make_schema_node(child))
+            self.modified_nodes[key] = node_info
+        return node_info
+
+    def decode_modifications(self, base_path, tag_values):
+        """
+        Decode tagged value array (from cdb.get_modifications) into
+        changes in one pass.
+        :param base_path: gNMI path the modifications are relative to
+        :param tag_values: list of TagValue
+        :return: list of (ChangeOp, gNMI path, LeafValue or None)
+        """
+        log.debug("==> base_path=%s len(tag_values)=%s", base_path,
+                  len(tag_values))
+        self.check_schema()
+        base_csnode = self.adapter.get_schema_node(base_path).csnode
+
+        def make_path(elems):
+            return gnmi_pb2.Path(elem=[gnmi_pb2.PathElem(name=n, key=k)
+                                       for n, k in elems])
+
+        # stack frame: [tag path, csnode, ns, path elems, pending key tags,
+        #               deleted]
+        base_elems = [(e.name, dict(e.key)) for e in base_path.elem]
+        stack = [[tuple(e.name for e in base_path.elem), base_csnode,
+                  base_csnode.ns(), base_elems, [], False]]
+        changes = []
+        for tv in tag_values:
+            vtype = tv.v.confd_type()
+            if vtype == _confd.C_XMLEND:
+                stack.pop()
+                continue
+            key, parent_csnode, parent_ns, elems, key_tags, deleted = \
+                stack[-1]
+            ns = tv.ns if tv.ns else parent_ns
+            node_key, csnode, node_key_tags, schema_node = \
+                self._modified_node(key, parent_csnode, ns, tv.tag)
+            name = _confd.hash2str(tv.tag)
+            if ns != parent_ns:
+                name = f'{self.adapter.ns_to_module[ns]}:{name}'
+            if vtype in (_confd.C_XMLBEGIN, _confd.C_XMLBEGINDEL):
+                is_deleted = deleted or vtype == _confd.C_XMLBEGINDEL
+                frame = [node_key, csnode, ns, elems + [(name, {})],
+                         list(node_key_tags), is_deleted]
+                stack.append(frame)
+                if not node_key_tags and vtype == _confd.C_XMLBEGINDEL \
+                        and not deleted:
+                    changes.append((ChangeOp.DELETED, make_path(frame[3]),
+                                    None))
+                continue
+            if key_tags and tv.tag == key_tags[0]:
+                # list entry keys are sent first
+                elems[-1][1][_confd.hash2str(tv.tag)] = str(tv.v)
+                key_tags.pop(0)
+                if not key_tags and deleted and \
+                        (len(stack) < 2 or not stack[-2][5]):
+                    changes.append((ChangeOp.DELETED, make_path(elems), None))
+                continue
+            if deleted:
+                continue
+            leaf_path = make_path(elems + [(name, {})])
+            if vtype == _confd.C_NOEXISTS:
+                changes.append((ChangeOp.DELETED, leaf_path, None))
+            else:
+                changes.append((ChangeOp.MODIFIED, leaf_path,
+                                LeafValue(tv.v, schema_node)))
+        log.debug("<== changes=%s", changes)
+        return changes
+
+    def get_modifications(self, sub_sock, sub_point, base_path):
+        """
+        Get all changes of subscription point with one
+        cdb.get_modifications call.
+        :return: list of (ChangeOp, gNMI path, LeafValue or None)
+        """
+        path_str = self.adapter.fix_path_prefixes(
+            make_formatted_path(base_path))
+        tag_values = cdb.get_modifications(sub_sock, sub_point,
+                                           cdb.GET_MODS_INCLUDE_LISTS,
+                                           path_str)
+        return self.decode_modifications(base_path, tag_values)
+
+    def diff_iterate(self, sub_sock, sub_point):
+        """
+        Get all changes of subscription point with cdb.diff_iterate
+        (used for top level lists, which have no common ancestor for
+        get_modifications).
+        :return: list of (ChangeOp, gNMI path, LeafValue or None)
+        """
+        log.debug("==>")
+        self.check_schema()
+        adapter = self.adapter
+
+        def cdb_iter(kp, op, oldv, newv, changes):
+            log.debug("==> kp=%s, op=%r, oldv=%s, newv=%s, state=%r", kp,
+                      op, oldv, newv, changes)
+            schema_node = adapter.schema.get_by_keypath(kp)
+            if op == _confd.MOP_CREATED:
+                log.debug("_confd.MOP_CREATED")
+                # list entry leaves are reported separately
+            if op == _confd.MOP_VALUE_SET:
+                log.debug("_confd.MOP_VALUE_SET")
+                changes.append((ChangeOp.MODIFIED,
+                                adapter.make_gnmi_keypath(kp, schema_node),
+                                LeafValue(newv, schema_node)))
+            elif op == _confd.MOP_DELETED:
+                log.debug("_confd.MOP_DELETED")
+                changes.append((ChangeOp.DELETED,
+                                adapter.make_gnmi_keypath(kp, schema_node),
+                                None))
+                return _confd.ITER_CONTINUE
+            elif op == _confd.MOP_MODIFIED:
+                log.debug("_confd.MOP_MODIFIED")
+                # modified leaves are reported separately
+            else:
+                log.warning(
+                    "Operation op=%d is not expected, kp=%s. Skipping!",
+                    op, kp)
+            return _confd.ITER_RECURSE
+
+        changes = []
+        cdb.diff_iterate(sub_sock, sub_point, cdb_iter, 0, changes)
+        log.debug("<== changes=%s", changes)
+        return changes
+
+
+class HubSubscription:
+    """
+    One CDB subscription (socket with one subscription point) shared by
+    all listeners with paths contained in `path`.
+    """
+
+    def __init__(self, path, base_path, cdb_type, sock, spoint):
+        self.path = path
+        # changes are read relative to base_path (see ChangeDecoder)
+        self.base_path = base_path
+        self.cdb_type = cdb_type
+        self.sock = sock
+        self.spoint = spoint
+        # (listener, key, monitored path, notification prefix)
+        self.listeners = []
+
+    def read_changes(self, decoder):
+        if len(self.base_path.elem) > 0:
+            return decoder.get_modifications(self.sock, self.spoint,
+                                             self.base_path)
+        return decoder.diff_iterate(self.sock, self.spoint)
+
+    def fan_out(self, changes):
+        """
+        Pass changes to all listeners interested in them.
+        """
+        fan_out(self.listeners, changes)
+
+
+class ChangeReactor:
+    """
+    Process wide event loop (one thread, `selectors`) for change
+    sources. Number of threads does not depend on the number
+    of subscriptions. CDB subscription sockets and external change
+    listeners and connections use separate reactors (see `get_reactor`),
+    so decoding of external changes does not delay CDB notifications
+    (and commits waiting for them).
+    """
+    CDB = "cdb_change_reactor"
+    EXTERNAL = "external_change_reactor"
+    _reactors = {}
+    _reactor_lock = threading.Lock()
+
+    @classmethod
+    def get_reactor(cls, name=CDB):
+        """
+        Get process wide reactor.
+        :param name: reactor (and its thread) name - `ChangeReactor.CDB`
+                     or `ChangeReactor.EXTERNAL`
+        """
+        with cls._reactor_lock:
+            reactor = cls._reactors.get(name)
+            if reactor is None:
+                reactor = cls(name)
+                cls._reactors[name] = reactor
+            return reactor
+
+    def __init__(self, name="change_reactor"):
+        self.selector = selectors.DefaultSelector()
+        self.wake_pipe = os.pipe()
+        self.selector.register(self.wake_pipe[0], selectors.EVENT_READ)
+        self.pending = deque()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True,
+                                       name=name)
+        self.thread.start()
+
+    def call_soon(self, fun):
+        """ Run `fun` in reactor thread. """
+        self.pending.append(fun)
+        os.write(self.wake_pipe[1], b'x')
+
+    def register(self, fileobj, callback):
+        """
+        Call `callback(fileobj)` (in reactor thread) when `fileobj`
+        is readable.
+        """
+        self.call_soon(lambda: self.selector.register(
+            fileobj, selectors.EVENT_READ, callback))
+
+    def unregister(self, fileobj, close=False):
+        """
+        Stop watching `fileobj` (immediately, if called from reactor
+        thread) and optionally close it.
+        """
+        def unregister():
+            try:
+                self.selector.unregister(fileobj)
+            except (KeyError, ValueError):
+                pass
+            if close:
+                fileobj.close()
+        if threading.current_thread() is self.thread:
+            unregister()
+        else:
+            self.call_soon(unregister)
+
+    def stop(self):
+        def stop():
+            self.running = False
+        self.call_soon(stop)
+
+    def _loop(self):
+        log.debug("==>")
+        while self.running:
+            for selector_key, _events in self.selector.select():
+                if selector_key.fileobj == self.wake_pipe[0]:
+                    os.read(self.wake_pipe[0], 1)
+                    try:
+                        self.pending.popleft()()
+                    except Exception as e:
+                        log.exception(e)
+                    continue
+                if self.selector.get_map().get(selector_key.fd) is not selector_key:
+                    # unregistered by previous callback
+                    continue
+                try:
+                    selector_key.data(selector_key.fileobj)
+                except Exception as e:
+                    log.exception(e)
+        log.debug("<==")
+
+
+class CdbSubscriptionHub:
+    """
+    Process wide CDB subscriptions shared by all subscription handlers.
+    Paths contained in already subscribed path (of the same type) reuse
+    its CDB subscription, so ConfD notifies (and waits for) one subscriber
+    regardless of the number of gNMI subscriptions.
+    Every change set is read and decoded once (in ChangeReactor thread)
+    and passed to all interested listeners (see `hub_changes`).
+    """
+    PRIORITY = 10
+    _hubs = {}
+    _hubs_lock = threading.Lock()
+
+    @classmethod
+    def get_hub(cls, addr, port):
+        with cls._hubs_lock:
+            hub = cls._hubs.get((addr, port))
+            if hub is None:
+                hub = cls(addr, port, ChangeReactor.get_reactor())
+                cls._hubs[(addr, port)] = hub
+            return hub
+
+    def __init__(self, addr, port, reactor):
+        self.addr = addr
+        self.port = port
+        self.reactor = reactor
+        self.decoder = None
+        self.subscriptions = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, adapter, listener, key, path, prefix, cdb_type):
+        """
+        Subscribe `listener` to changes of `path`.
+        :param adapter: adapter of the subscriber (changes are decoded
+                        with process wide schema adapter, see
+                        GnmiConfDApiServerAdapter.get_schema_adapter)
+        :param listener: object with `hub_changes(key, changes)` and
+                         `hub_error(key, error)` methods
+        :param key: value passed to `hub_changes`
+        :param path: monitored gNMI path
+        :param prefix: notification prefix of `path` (changes passed
+                       to listener use its element names)
+        :param cdb_type: cdb.SUB_RUNNING or cdb.SUB_OPERATIONAL
+        """
+        log.debug("==> key=%s path=%s cdb_type=%s", key, path, cdb_type)
+        with self.lock:
+            if self.decoder is None:
+                self.decoder = ChangeDecoder(adapter.get_schema_adapter())
+            for subscription in self.subscriptions:
+                if subscription.cdb_type == cdb_type and \
+                        path_contains(subscription.path, path):
+                    subscription.listeners.append((listener, key, path, prefix))
+                    log.debug("<== reusing subscription path=%s",
+                              subscription.path)
+                    return
+        path_str = adapter.fix_path_prefixes(make_formatted_path(path))
+        sock = socket()
+        try:
+            cdb.connect(sock, cdb.SUBSCRIPTION_SOCKET, self.addr, self.port)
+            spoint = cdb.subscribe2(sock, cdb_type, 0, self.PRIORITY, 0,
+                                    path_str)
+            cdb.subscribe_done(sock)
+        except Exception:
+            sock.close()
+            raise
+        subscription = HubSubscription(path, prefix, cdb_type, sock, spoint)
+        subscription.listeners.append((listener, key, path, prefix))
+        with self.lock:
+            self.subscriptions.append(subscription)
+        self.reactor.register(sock, lambda _sock: self._process(subscription))
+        log.debug("<== new subscription spoint=%s", spoint)
+
+    def unsubscribe(self, listener):
+        """
+        Remove all subscriptions of `listener`, CDB subscriptions without
+        listeners are closed.
+        """
+        log.debug("==> listener=%s", listener)
+        unused = []
+        with self.lock:
+            for subscription in self.subscriptions:
+                subscription.listeners = [s for s in subscription.listeners
+                                          if s[0] is not listener]
+                if not subscription.listeners:
+                    unused.append(subscription)
+            self.subscriptions = [s for s in self.subscriptions
+                                  if s not in unused]
+        for subscription in unused:
+            self.reactor.unregister(subscription.sock, close=True)
+        log.debug("<== closed=%s", len(unused))
+
+    def _remove_subscription(self, subscription, error):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+        self.reactor.unregister(subscription.sock, close=True)
+        for listener, key, _path, _prefix in subscription.listeners:
+            listener.hub_error(key, error)
+
+    def _process(self, subscription):
+        try:
+            sub_info = cdb.read_subscription_socket2(subscription.sock)
+        except _confd.error.Error as e:
+            log.exception(e)
+            self._remove_subscription(subscription, e)
+            return
+        try:
+            for _spoint in sub_info[2]:
+                subscription.fan_out(subscription.read_changes(self.decoder))
+        except Exception as e:
+            # do not block commit, changes of this subscription are lost
+            log.exception(e)
+        try:
+            cdb.sync_subscription_socket(subscription.sock, cdb.DONE_PRIORITY)
+        except _confd.error.Error as e:
+            log.exception(e)
+            self._remove_subscription(subscription, e)
+
+
+class ExternalChangeServer:
+    """
+    Server receiving changes of non CDB data (see route_status.py) on
+    `port`, shared by all subscription handlers. Connections are handled
+    in `ChangeReactor.EXTERNAL` reactor thread.
+    Producers keep connection open and stream changes as newline
+    delimited JSON - every line is one batch (JSON array) of changes
+    [{"op": "mod", "path": xpath1, "val": val1}, {"op": "del", "path": xpath2} ...]
+    (op is ChangeOp value, val is string or number, op "del" has no val).
+    Lines are parsed as they arrive, every batch is passed to listeners
+    at once. Back-pressure: at most `RECV_SIZE` bytes are read from
+    a connection at a time and processed before next read, so slow
+    processing fills TCP window and blocks producers (unprocessed data of
+    a connection is bounded by `MAX_LINE_SIZE`).
+    """
+    _servers = {}
+    _servers_lock = threading.Lock()
+    RECV_SIZE = 64 * 1024
+    MAX_LINE_SIZE = 16 * 1024 * 1024
+
+    @classmethod
+    def get_server(cls, port):
+        with cls._servers_lock:
+            server = cls._servers.get(port)
+            if server is None:
+                server = cls(port, ChangeReactor.get_reactor(
+                    ChangeReactor.EXTERNAL))
+                cls._servers[port] = server
+            return server
+
+    def __init__(self, port, reactor):
+        self.port = port
+        self.reactor = reactor
+        self.adapter = None
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.server_sock = None
+        self.connections = set()
+
+    def subscribe(self, adapter, listener, key, path, prefix):
+        """
+        Subscribe `listener` to external changes of `path`
+        (see CdbSubscriptionHub.subscribe).
+        Server socket is opened with the first subscription (or reused,
+        if it is not closed yet after the last unsubscribe).
+        """
+        log.debug("==> key=%s path=%s", key, path)
+        with self.lock:
+            if self.adapter is None:
+                self.adapter = adapter.get_schema_adapter()
+            self.listeners.append((listener, key, path, prefix))
+            if self.server_sock is None:
+                log.info("Starting external change server!")
+                server_sock = socket()
+                server_sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+                # TODO host as const or command line option
+                server_sock.bind(("localhost", self.port))
+                server_sock.listen(5)
+                server_sock.setblocking(False)
+                self.server_sock = server_sock
+                self.reactor.register(server_sock, self._accept)
+        log.debug("<==")
+
+    def unsubscribe(self, listener):
+        """
+        Unsubscribe `listener`. Server socket is closed (in reactor thread)
+        after the last subscription is removed, unless a new subscription
+        is added in the meantime - so the port stays bound for immediate
+        resubscribe.
+        """
+        with self.lock:
+            self.listeners = [s for s in self.listeners
+                              if s[0] is not listener]
+            if not self.listeners and self.server_sock is not None:
+                self.reactor.call_soon(self._stop_if_unused)
+
+    def _stop_if_unused(self):
+        with self.lock:
+            if self.listeners or self.server_sock is None:
+                return
+            log.info("Stopping external change server!")
+            self.reactor.unregister(self.server_sock, close=True)
+            self.server_sock = None
+            for connection in self.connections:
+                self.reactor.unregister(connection, close=True)
+            self.connections = set()
+
+    def _accept(self, server_sock):
+        try:
+            connection, client_address = server_sock.accept()
+        except BlockingIOError:
+            return
+        log.debug("connection from client_address=%s", client_address)
+        connection.setblocking(False)
+        with self.lock:
+            self.connections.add(connection)
+        # unprocessed data (incomplete line)
+        data = bytearray()
+        self.reactor.register(connection, lambda conn: self._read(conn, data))
+
+    def _close(self, connection):
+        with self.lock:
+            self.connections.discard(connection)
+        self.reactor.unregister(connection, close=True)
+
+    def _read(self, connection, data):
+        try:
+            msg = connection.recv(self.RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            log.warning("external change connection error e=%s", e)
+            msg = b''
+        if not msg:
+            self._close(connection)
+            # last line may be without newline
+            self.process_lines(bytes(data))
+            return
+        end = msg.rfind(b'\n')
+        if end == -1:
+            data += msg
+        else:
+            lines = bytes(data + msg[:end])
+            data[:] = msg[end + 1:]
+            self.process_lines(lines)
+        if len(data) > self.MAX_LINE_SIZE:
+            log.warning("external change batch bigger than %d bytes, "
+                        "closing connection", self.MAX_LINE_SIZE)
+            self._close(connection)
+
+    def decode_change(self, change):
+        op = ChangeOp(change["op"])
+        path = make_gnmi_path(change["path"])
+        if op == ChangeOp.DELETED:
+            return op, path, None
+        value = change["val"]
+        if isinstance(value, bool):
+            value = str(value).lower()
+        schema_node = self.adapter.get_schema_node(path)
+        cval = _confd.Value.str2val(str(value), schema_node.value_type)
+        return op, path, LeafValue(cval, schema_node)
+
+    def decode_batch(self, line):
+        """
+        :param line: one line (JSON array of changes) of change stream
+        :return: list of (ChangeOp, gNMI path, LeafValue or None)
+        """
+        return [self.decode_change(change) for change in json.loads(line)]
+
+    def process_lines(self, lines):
+        """
+        Decode change batches (lines) and pass them to listeners.
+        :param lines: complete lines received from producer
+        """
+        log.debug("==> lines=%s", len(lines))
+        with self.lock:
+            listeners = list(self.listeners)
+        for line in lines.split(b'\n'):
+            if not line.strip() or not listeners:
+                continue
+            try:
+                changes = self.decode_batch(line)
+            except Exception as e:
+                log.warning("cannot decode external change batch "
+                            "line=%s e=%s", line[:200], e)
+                continue
+            fan_out(listeners, changes)
+        log.debug("<==")
@@ -1,3 +1,10 @@
+# all paths of GetRequest are read in one read transaction
+GET_MODE_SNAPSHOT = "snapshot"
+# paths of GetRequest are read concurrently (pooled MAAPI sessions)
+GET_MODE_PARALLEL = "parallel"
+GET_MODES = [GET_MODE_SNAPSHOT, GET_MODE_PARALLEL]
+
+
 # dataclass
 class ApiAdapterDefaults:
     CONFD_ADDR = "127.0.0.1"
@@ -6,3 +13,16 @@ class ApiAdapterDefaults:
     CONFD_PORT = 4565
     MONITOR_EXTERNAL_CHANGES = False
     EXTERNAL_PORT = 5055
+    # max. number of concurrently used MAAPI sessions per user
+    MAX_SESSIONS = 4
+    # max. age (in seconds) of reused read transaction (0 - always new one)
+    READ_TRANS_MAX_STALENESS = 0.0
+    # read list entries matching path wildcard with one save of their ancestor
+    BULK_GET = True
+    # max. number of cached schema nodes (path templates)
+    SCHEMA_CACHE_SIZE = 10000
+    # file with schema snapshot (namespaces, modules) reused on next start
+    # (empty - do not use snapshot file)
+    SCHEMA_SNAPSHOT = "confd_gnmi_schema.json"
+    # how paths of one GetRequest are read (see GET_MODES)
+    GET_MODE = GET_MODE_SNAPSHOT
@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import _confd
+
+import gnmi_pb2
+
+log = logging.getLogger('confd_gnmi_api_adapter_schema')
+
+
+class LeafEncoders(NamedTuple):
+    """
+    Value encoders of one leaf (leaf-list) selected by its type
+    when the schema node is created.
+    `json` - ConfD value to JSON (RFC 7951) compatible Python value,
+    `gnmi_json` - ConfD value to JSON_IETF gNMI value,
+    `proto` - ConfD value to PROTO gNMI value,
+    `proto_json` - JSON value (e.g. from save_config) to PROTO gNMI value.
+    """
+    json: Callable
+    gnmi_json: Callable
+    proto: Callable
+    proto_json: Callable
+
+
+@dataclass(frozen=True)
+class SchemaNode:
+    """
+    Schema metadata of one data node (and of its path from the top node).
+    `elems` is the gNMI path template - for every path element its name
+    (with module prefix where the namespace changes) and key names
+    (empty for non-list elements).
+    `encoders` are set for leaves and leaf-lists, `children` caches child
+    nodes by name and list of all children under None (see
+    SchemaCache.get_child and SchemaCache.get_children).
+    """
+    csnode: Any
+    nodes: Tuple[Any, ...]
+    elems: Tuple[Tuple[str, Tuple[str, ...]], ...]
+    flags: int
+    value_type: Optional[Any]
+    encoders: Optional[LeafEncoders] = None
+    children: Dict[str, Any] = field(default_factory=dict, compare=False,
+                                     repr=False)
+
+    @property
+    def is_list(self):
+        return self.flags & _confd.CS_NODE_IS_LIST != 0
+
+    @property
+    def is_leaf(self):
+        return self.csnode.children() is None and \
+            self.flags & _confd.CS_NODE_IS_LEAF_LIST == 0
+
+    def make_gnmi_path_elems(self, keypath):
+        """
+        Fill key values of `keypath` into the path template.
+        :param keypath: ConfD keypath of this node
+        :return: list of gnmi_pb2.PathElem
+        """
+        elems = []
+        i = len(keypath) - 1
+        for name, key_names in self.elems:
+            i -= 1
+            keys = {}
+            if key_names:
+                keys = {key: str(val)
+                        for key, val in zip(key_names, keypath[i])}
+                i -= 1
+            elems.append(gnmi_pb2.PathElem(name=name, key=keys))
+        return elems
+
+
+class SchemaCache:
+    """
+    LRU cache of SchemaNode objects.
+    Nodes are looked up by ConfD keypath or by gNMI path; the cache key is
+    the tag path (path without keys), so all instances of a list share
+    one entry.
+    Value encoders of leaves are created with `make_encoders(csnode)`.
+    """
+
+    def __init__(self, ns_to_module, max_size=10000, make_encoders=None):
+        self.ns_to_module = ns_to_module
+        self.max_size = max_size
+        self.make_encoders = make_encoders
+        self._nodes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            node = self._nodes.get(key)
+            if node is not None:
+                self._nodes.move_to_end(key)
+            return node
+
+    def _put(self, key, node):
+        with self._lock:
+            self._nodes[key] = node
+            self._nodes.move_to_end(key)
+            while len(self._nodes) > self.max_size:
+                self._nodes.popitem(last=False)
+
+    def make_schema_node(self, csnode):
+        nodes = []
+        node = csnode
+        while node is not None:
+            nodes.append(node)
+            node = node.parent()
+        nodes.reverse()
+        elems = []
+        ns = 0
+        for node in nodes:
+            name = _confd.hash2str(node.tag())
+            if node.ns() != ns:
+                ns = node.ns()
+                name = f'{self.ns_to_module[ns]}:{name}'
+            key_names = ()
+            if node.info().flags() & _confd.CS_NODE_IS_LIST != 0:
+                key_names = tuple(_confd.hash2str(k)
+                                  for k in node.info().keys())
+            elems.append((name, key_names))
+        flags = csnode.info().flags()
+        value_type = csnode.info().type() if csnode.children() is None \
+            else None
+        encoders = None
+        if value_type is not None and self.make_encoders is not None:
+            encoders = self.make_encoders(csnode)
+        return SchemaNode(csnode=csnode, nodes=tuple(nodes),
+                          elems=tuple(elems), flags=flags,
+                          value_type=value_type, encoders=encoders)
+
+    def get_child(self, node, name):
+        """
+        :param node: parent SchemaNode
+        :param name: child name (module prefix is ignored)
+        :return: child SchemaNode (cached in `node`) or None if not found
+        """
+        child = node.children.get(name)
+        if child is None:
+            try:
+                tag = _confd.str2hash(name.split(":")[-1])
+            except _confd.error.Error:
+                return None
+            csnode = node.csnode.children()
+            while csnode is not None and csnode.tag() != tag:
+                csnode = csnode.next()
+            if csnode is None:
+                return None
+            child = self.make_schema_node(csnode)
+            node.children[name] = child
+        return child
+
+    def get_children(self, node):
+        """
+        :param node: parent SchemaNode
+        :return: list of all child SchemaNodes (cached in `node`)
+        """
+        children = node.children.get(None)
+        if children is None:
+            children = []
+            csnode = node.csnode.children()
+            while csnode is not None:
+                children.append(self.make_schema_node(csnode))
+                csnode = csnode.next()
+            node.children[None] = children
+        return children
+
+    def get_by_keypath(self, keypath):
+        """
+        :param keypath: ConfD keypath (e.g. from diff_iterate)
+        :return: SchemaNode or None if not found
+        """
+        key = tuple((keypath[i].ns, keypath[i].tag)
+                    for i in range(len(keypath) - 1, -1, -1)
+                    if not isinstance(keypath[i], tuple))
+        node = self._get(key)
+        if node is None:
+            csnode = _confd.cs_node_cd(None, _confd.pp_kpath(keypath))
+            if csnode is None:
+                return None
+            node = self.make_schema_node(csnode)
+            self._put(key, node)
+        return node
+
+    def get_by_path_str(self, names, path_str):
+        """
+        :param names: tuple of element names (cache key)
+        :param path_str: path (with module prefixes) for cs_node_cd
+        :return: SchemaNode or None if not found
+        """
+        node = self._get(names)
+        if node is None:
+            try:
+                csnode = _confd.cs_node_cd(None, path_str)
+            except _confd.error.Error as e:
+                log.debug("cs_node_cd failed path_str=%s e=%s", path_str, e)
+                csnode = None
+            if csnode is None:
+                return None
+            node = self.make_schema_node(csnode)
+            self._put(names, node)
+        return node
+
+    def clear(self):
+        with self._lock:
+            self._nodes.clear()
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+@dataclass
+class SchemaSnapshot:
+    """
+    Schema data of ConfD which is expensive to get - namespaces
+    (as returned by _confd.get_nslist) and YANG modules (name, namespace,
+    revision) of Capabilities. The snapshot is stored to file (JSON) and
+    reused by later starts while ConfD `module_set_id` does not change.
+    `schema_file` is ConfD shared memory schema file (empty if shared
+    memory schema is not enabled), it is mapped with _confd.mmap_schemas
+    instead of loading schemas over MAAPI.
+    `module_set_id` and `modules` are empty until read with user session.
+    """
+    module_set_id: str
+    namespaces: List[Tuple]
+    modules: List[Tuple[str, str, str]]
+    schema_file: str = ""
+
+    @staticmethod
+    def load(path):
+        """
+        :return: SchemaSnapshot read from `path` or None (no or invalid file)
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return SchemaSnapshot(
+                module_set_id=data["module_set_id"],
+                namespaces=[tuple(ns) for ns in data["namespaces"]],
+                modules=[tuple(m) for m in data["modules"]],
+                schema_file=data.get("schema_file", ""))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("cannot read schema snapshot path=%s e=%s", path, e)
+            return None
+
+    def save(self, path):
+        """ Write snapshot to `path` (replaced atomically). """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(asdict(self), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("cannot write schema snapshot path=%s e=%s", path, e)
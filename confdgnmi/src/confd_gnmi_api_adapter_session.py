@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import _confd
+from confd import maapi
+
+log = logging.getLogger('confd_gnmi_api_adapter_session')
+
+# errors of broken connection to ConfD
+CONNECTION_ERRORS = (_confd.error.EOF, OSError)
+
+
+class MaapiSession:
+    """
+    MAAPI socket with started user session.
+    Read transactions can be kept open and reused (see `get_read_trans`).
+    Not thread safe, the session must be used by one thread at a time
+    (see MaapiSessionPool).
+    """
+
+    def __init__(self, addr, port, username, groups, context, src_ip):
+        log.debug("==> addr=%s port=%s username=%s", addr, port, username)
+        self.maapi = maapi.Maapi(ip=addr, port=port)
+        try:
+            self.maapi.start_user_session(username, context, groups,
+                                          src_ip=src_ip)
+        except Exception:
+            self.maapi.close()
+            raise
+        # db -> (transaction, start time)
+        self.read_transactions = {}
+        log.debug("<==")
+
+    def get_read_trans(self, db, max_staleness):
+        """
+        Get read transaction for `db`.
+        Open transaction is reused, if it was started less than
+        `max_staleness` seconds ago.
+        """
+        now = time.monotonic()
+        trans, started = self.read_transactions.get(db, (None, 0))
+        if trans is not None and now - started > max_staleness:
+            self.finish_read_trans(db)
+            trans = None
+        if trans is None:
+            trans = self.maapi.start_read_trans(db=db)
+            self.read_transactions[db] = (trans, now)
+        return trans
+
+    def finish_read_trans(self, db):
+        trans, _started = self.read_transactions.pop(db)
+        trans.finish()
+
+    def close(self):
+        log.debug("==>")
+        try:
+            for db in list(self.read_transactions):
+                self.finish_read_trans(db)
+            self.maapi.end_user_session()
+        except Exception as e:
+            log.debug("Error when closing session e=%s", e)
+        finally:
+            self.maapi.close()
+        log.debug("<==")
+
+
+class MaapiSessionPool:
+    """
+    Pool of MAAPI sessions of one user.
+    Sessions (sockets with started user sessions) are kept open and reused,
+    at most `max_sessions` are used concurrently (other callers wait).
+    Pools are shared by all adapters of the user (see `get_pool`).
+    """
+    # (addr, port, username) -> shared MaapiSessionPool
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, addr, port, username, groups, context="netconf",
+                 src_ip="127.0.0.1", max_sessions=4, max_staleness=0.0):
+        self.addr = addr
+        self.port = port
+        self.username = username
+        self.groups = groups
+        self.context = context
+        self.src_ip = src_ip
+        self.max_staleness = max_staleness
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self.closed = False
+        # number of adapters using shared pool
+        self.users = 0
+
+    @staticmethod
+    def get_pool(addr, port, username, groups, context="netconf",
+                 src_ip="127.0.0.1", max_sessions=4, max_staleness=0.0):
+        """
+        Get pool of `username` shared by all adapters (created on first use).
+        Every `get_pool` must be paired with `release`.
+        """
+        log.debug("==> addr=%s port=%s username=%s", addr, port, username)
+        key = (addr, port, username)
+        with MaapiSessionPool._pools_lock:
+            pool = MaapiSessionPool._pools.get(key)
+            if pool is None:
+                pool = MaapiSessionPool(addr, port, username, groups,
+                                        context=context, src_ip=src_ip,
+                                        max_sessions=max_sessions,
+                                        max_staleness=max_staleness)
+                MaapiSessionPool._pools[key] = pool
+            pool.users += 1
+        log.debug("<== pool=%s users=%d", pool, pool.users)
+        return pool
+
+    def release(self):
+        """
+        Release pool got with `get_pool`, it is closed when not used
+        by any adapter.
+        """
+        key = (self.addr, self.port, self.username)
+        with MaapiSessionPool._pools_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if MaapiSessionPool._pools.get(key) is self:
+                del MaapiSessionPool._pools[key]
+        self.close()
+
+    def _new_session(self):
+        return MaapiSession(self.addr, self.port, self.username, self.groups,
+                            self.context, self.src_ip)
+
+    @contextmanager
+    def session(self):
+        """
+        Get (reuse or create) session for exclusive use.
+        If the session is used with error, it is closed and not reused.
+        On connection error, all idle sessions are closed as well
+        (they are likely broken too, e.g. ConfD was restarted).
+        """
+        assert not self.closed
+        with self._slots:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                session = self._new_session()
+            try:
+                yield session
+            except BaseException as e:
+                session.close()
+                if isinstance(e, CONNECTION_ERRORS):
+                    log.warning("MAAPI connection error e=%s", e)
+                    self._close_idle()
+                raise
+            with self._lock:
+                if self.closed:
+                    session.close()
+                else:
+                    self._idle.append(session)
+
+    @contextmanager
+    def read_trans(self, db=_confd.RUNNING):
+        """
+        Get read transaction. The transaction may be reused (see
+        MaapiSession.get_read_trans), it must not be finished by caller.
+        """
+        with self.session() as session:
+            yield session.get_read_trans(db, self.max_staleness)
+
+    @contextmanager
+    def write_trans(self, db=_confd.RUNNING):
+        """
+        Start new write transaction, it is finished on exit
+        (caller is responsible for `apply()`).
+        """
+        with self.session() as session:
+            trans = session.maapi.start_write_trans(db=db)
+            try:
+                yield trans
+            finally:
+                trans.finish()
+
+    def _close_idle(self):
+        with self._lock:
+            sessions = self._idle
+            self._idle = []
+        for session in sessions:
+            session.close()
+
+    def probe(self):
+        """
+        Check connection to ConfD with cheap request on idle session.
+        If it fails, idle sessions are closed.
+        If there is no idle session (all are used or none was created yet),
+        nothing is checked.
+        :return: False if the pool is closed or the check failed
+        """
+        log.debug("==>")
+        if self.closed:
+            return False
+        if not self._slots.acquire(blocking=False):
+            log.debug("<== all sessions used")
+            return True
+        try:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                log.debug("<== no idle session")
+                return True
+            try:
+                _confd.maapi.get_my_user_session_id(session.maapi.msock)
+            except (_confd.error.Error,) + CONNECTION_ERRORS as e:
+                log.warning("MAAPI session probe failed e=%s", e)
+                session.close()
+                self._close_idle()
+                return False
+            with self._lock:
+                if self.closed:
+                    session.close()
+                else:
+                    self._idle.append(session)
+        finally:
+            self._slots.release()
+        log.debug("<==")
+        return True
+
+    def close(self):
+        log.debug("==>")
+        with self._lock:
+            self.closed = True
+        self._close_idle()
+        log.debug("<==")
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import argparse
-import json
 import logging
 import ssl
 import sys
@@ -14,7 +13,7 @@ from grpc import channel_ready_future, insecure_channel, secure_channel, \
 import gnmi_pb2
 from confd_gnmi_common import HOST, PORT, make_xpath_path, VERSION, \
     common_optparse_options, common_optparse_process, make_gnmi_path, \
-    get_data_type, get_sub_mode
+    get_data_type, get_sub_mode, decode_typed_value
 from gnmi_pb2_grpc import gNMIStub
 
 log = logging.getLogger('confd_gnmi_client')
@@ -61,12 +60,30 @@ class ConfDgNMIClient:
         return response
 
     @staticmethod
-    def make_subscription_list(prefix, paths, mode, encoding):
+    def make_subscription_list(prefix, paths, mode, encoding,
+                               sample_interval=0.0, suppress_redundant=False,
+                               heartbeat_interval=0.0, updates_only=False):
+        """
+        :param sample_interval: if > 0, STREAM subscriptions are in SAMPLE
+        mode with this interval (in seconds), otherwise in ON_CHANGE mode
+        :param suppress_redundant: do not send unchanged values of SAMPLE
+        subscriptions
+        :param heartbeat_interval: max. interval (in seconds) after which
+        unchanged value is sent (0 - no heartbeat)
+        :param updates_only: do not send initial state (for POLL
+        subscriptions, every poll returns only changes since previous poll)
+        """
         log.debug("==> mode=%s", mode)
         qos = gnmi_pb2.QOSMarking(marking=1)
         subscriptions = []
         for path in paths:
-            if mode == gnmi_pb2.SubscriptionList.STREAM:
+            if mode == gnmi_pb2.SubscriptionList.STREAM and sample_interval > 0:
+                sub = gnmi_pb2.Subscription(path=path,
+                                            mode=gnmi_pb2.SubscriptionMode.SAMPLE,
+                                            sample_interval=int(sample_interval * 1e9),
+                                            suppress_redundant=suppress_redundant,
+                                            heartbeat_interval=int(heartbeat_interval * 1e9))
+            elif mode == gnmi_pb2.SubscriptionList.STREAM:
                 sub = gnmi_pb2.Subscription(path=path,
                                             mode=gnmi_pb2.SubscriptionMode.ON_CHANGE)
             else:
@@ -80,7 +97,7 @@ class ConfDgNMIClient:
             allow_aggregation=False,
             use_models=[],
             encoding=encoding,
-            updates_only=False
+            updates_only=updates_only
         )
 
         log.debug("<== subscription_list=%s", subscription_list)
@@ -125,12 +142,10 @@ class ConfDgNMIClient:
                                                         n.atomic))
         print("Updates:")
         for u in n.update:
-            if u.val.json_val:
-                value = json.loads(u.val.json_val)
-            elif u.val.json_ietf_val:
-                value = json.loads(u.val.json_ietf_val)
-            else:
+            if u.val.WhichOneof("value") in ("bytes_val", "any_val"):
                 value = str(u.val)
+            else:
+                value = decode_typed_value(u.val)
             print("path: {} value {}".format(pfx_str + make_xpath_path(u.path),
                                              value))
 
@@ -255,6 +270,23 @@ def parse_args(args):
                         help="Time to wait (in seconds) to finish stream after all "
                              "subscription requests (default 0.0)",
                         default=0.0)
+    parser.add_argument("--sample-interval", action="store", dest="sampleinterval",
+                        type=float,
+                        help="Sample interval (in seconds) of STREAM subscription, "
+                             "0 means ON_CHANGE subscription (default 0.0)",
+                        default=0.0)
+    parser.add_argument("--suppress-redundant", action="store_true",
+                        dest="suppressredundant",
+                        help="Do not send unchanged values of sampled STREAM subscription")
+    parser.add_argument("--heartbeat-interval", action="store",
+                        dest="heartbeatinterval", type=float,
+                        help="Interval (in seconds) after which unchanged value of sampled "
+                             "STREAM subscription is sent (default 0.0 - never)",
+                        default=0.0)
+    parser.add_argument("--updates-only", action="store_true",
+                        dest="updatesonly",
+                        help="Do not send initial state, POLL returns only changes "
+                             "since previous poll")
     parser.add_argument("--read-count", action="store", dest="readcount",
                         type=int,
                         help="Number of read requests for STREAM subscription (default 4)",
@@ -268,7 +300,7 @@ def parse_args(args):
     parser.add_argument("--password", action="store", dest="password",
                         help="Password (default 'admin')",
                         default='admin')
-    parser.add_argument("--encoding", choices=["JSON", "JSON_IETF"],
+    parser.add_argument("--encoding", choices=["JSON", "JSON_IETF", "PROTO"],
                         help="Requested encoding for get and subscribe (default 'JSON_IETF')",
                         default="JSON_IETF")
     opt = parser.parse_args(args=args)
@@ -320,9 +352,14 @@ if __name__ == '__main__':
         read_count = -1;
 
     encoding = dict(JSON=gnmi_pb2.Encoding.JSON,
-                    JSON_IETF=gnmi_pb2.Encoding.JSON_IETF)[opt.encoding]
+                    JSON_IETF=gnmi_pb2.Encoding.JSON_IETF,
+                    PROTO=gnmi_pb2.Encoding.PROTO)[opt.encoding]
     subscription_list = ConfDgNMIClient.make_subscription_list(
-        prefix, paths, subscription_mode, encoding)
+        prefix, paths, subscription_mode, encoding,
+        sample_interval=opt.sampleinterval,
+        suppress_redundant=opt.suppressredundant,
+        heartbeat_interval=opt.heartbeatinterval,
+        updates_only=opt.updatesonly)
 
     with closing(ConfDgNMIClient(opt.host, opt.port, insecure=opt.insecure,
                                  server_crt_file=opt.servercrt,
@@ -333,9 +370,8 @@ if __name__ == '__main__':
             print("Capabilities:")
             print("  supported models:")
             for m in capabilities.supported_models:
-                print("name: {} organization: {} version: {}".format(m.name,
-                                                                   m.organization,
-                                                                   m.version))
+                print("name: {} organization: {} version: {}".format(
+                    m.name, m.organization, m.version))
             encodings = [encoding_int_to_str(encoding)
                          for encoding in capabilities.supported_encodings]
             print(f"  supported encodings: {encodings}")
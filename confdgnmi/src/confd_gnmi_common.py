@@ -1,5 +1,9 @@
 from enum import Enum
+import functools
+import json
 import logging
+import re
+from decimal import Decimal
 from typing import Tuple, Dict
 
 import gnmi_pb2
@@ -193,6 +197,55 @@ def remove_path_prefix(path, prefix):
                          target=path.target)
 
 
+class PathTranslator:
+    """
+    Translate names in paths (and values, e.g. identityrefs) according to
+    the `mapping`, e.g. module name to prefix ('ietf-interfaces:interfaces'
+    -> 'if:interfaces') or back.
+    Only complete names followed by ':' are translated.
+    All names are matched with one compiled regular expression and
+    translated paths are memoized (LRU cache of `cache_size` paths).
+    """
+
+    def __init__(self, mapping, cache_size=10000):
+        self.mapping = {name: new_name for name, new_name in mapping.items()
+                        if name != new_name}
+        self.pattern = None
+        if self.mapping:
+            names = sorted(self.mapping, key=len, reverse=True)
+            self.pattern = re.compile(
+                r'(?<![^/:])(' + '|'.join(map(re.escape, names)) + r'):')
+        self.translate = functools.lru_cache(maxsize=cache_size)(
+            self._translate)
+
+    def _replace(self, match):
+        return self.mapping[match.group(1)] + ':'
+
+    def _translate(self, path):
+        if self.pattern is None:
+            return path
+        return self.pattern.sub(self._replace, path)
+
+
+def decode_typed_value(val):
+    """
+    Convert gNMI TypedValue to Python value - JSON values are parsed,
+    PROTO (scalar) values are returned as they are (`decimal_val` as
+    Decimal, `leaflist_val` as list).
+    """
+    kind = val.WhichOneof("value")
+    if kind in ("json_val", "json_ietf_val"):
+        return json.loads(getattr(val, kind))
+    if kind == "decimal_val":
+        return Decimal(val.decimal_val.digits).scaleb(
+            -val.decimal_val.precision)
+    if kind == "leaflist_val":
+        return [decode_typed_value(e) for e in val.leaflist_val.element]
+    if kind is None:
+        return None
+    return getattr(val, kind)
+
+
 def get_data_type(datatype_str):
     datatype_map = {
         "ALL": gnmi_pb2.GetRequest.DataType.ALL,
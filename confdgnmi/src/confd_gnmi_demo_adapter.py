@@ -11,6 +11,7 @@ from random import randint
 import gnmi_pb2
 from confd_gnmi_adapter import GnmiServerAdapter
 from confd_gnmi_common import make_xpath_path, make_gnmi_path
+from confd_gnmi_demo_adapter_store import DemoList, DemoStore
 
 log = logging.getLogger('confd_gnmi_demo_adapter')
 
@@ -20,9 +21,9 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
     NS_IANA = "iana-if-type:"
 
     # simple demo database
-    # map with XPath, value - both strings
-    demo_db = {}
-    demo_state_db = {}
+    # tree store, also map with XPath, value - both strings
+    demo_db = DemoStore()
+    demo_state_db = DemoStore()
     # we use same lock for demo_db and demo_state_db
     db_lock = threading.Lock()
     num_of_ifs = 10
@@ -98,8 +99,8 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
                 self.demo_db["{}/type".format(path)] = "gigabitEthernet"
                 self.demo_state_db[
                     "{}/type".format(state_path)] = "gigabitEthernet"
-        log.debug("<== self.demo_db=%s self.demo_state_db=%s", self.demo_db,
-                  self.demo_state_db)
+        log.debug("<== len(self.demo_db)=%d len(self.demo_state_db)=%d",
+                  len(self.demo_db), len(self.demo_state_db))
 
     @staticmethod
     def _nsless_xpath(xpath: str):
@@ -136,6 +137,12 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
         log.debug("<== map_db={}".format(map_db))
         return map_db
 
+    @staticmethod
+    def _leaf_json_value(name, value):
+        if name == "type":
+            value = "{}{}".format(GnmiDemoServerAdapter.NS_IANA, value)
+        return value
+
     class SubscriptionHandler(GnmiServerAdapter.SubscriptionHandler):
 
         class ChangeEvent(Enum):
@@ -146,8 +153,6 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
         def __init__(self, adapter, subscription_list):
             super().__init__(adapter, subscription_list)
             self.monitored_paths = []
-            self.change_db = []
-            self.change_db_lock = threading.Lock()
             self.change_thread = None
             self.change_event_queue = None
 
@@ -165,23 +170,20 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
             log.debug("<== updates=%s", updates)
             return updates
 
-        def get_monitored_changes(self) -> []:
-            with self.change_db_lock:
-                log.debug("==> self.change_db=%s", self.change_db)
-                assert len(self.change_db) > 0
-                update = []
-                for c in self.change_db:
-                    prefix_str = self.adapter._nsless_xpath(make_xpath_path(
-                        gnmi_prefix=self.subscription_list.prefix))
-                    p = self.adapter._nsless_xpath(c[0])
-                    if p.startswith(prefix_str):
-                        p = p[len(prefix_str):]
-                    v = "{}{}".format(GnmiDemoServerAdapter.NS_IANA, c[1])
-                    json_val = gnmi_pb2.TypedValue(
-                        json_ietf_val=json.dumps(v).encode())
-                    update.append(gnmi_pb2.Update(path=make_gnmi_path(p),
-                                                  val=json_val))
-                self.change_db = []
+        def get_monitored_changes(self, changes) -> []:
+            log.debug("==> changes=%s", changes)
+            update = []
+            prefix_str = self.adapter._nsless_xpath(make_xpath_path(
+                gnmi_prefix=self.subscription_list.prefix))
+            for c in changes:
+                p = self.adapter._nsless_xpath(c[0])
+                if p.startswith(prefix_str):
+                    p = p[len(prefix_str):]
+                v = "{}{}".format(GnmiDemoServerAdapter.NS_IANA, c[1])
+                json_val = gnmi_pb2.TypedValue(
+                    json_ietf_val=json.dumps(v).encode())
+                update.append(gnmi_pb2.Update(path=make_gnmi_path(p),
+                                              val=json_val))
             log.debug("<== update=%s", update)
             return update
 
@@ -190,13 +192,11 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
             changes = []
             candidate_paths = set()
             for mp in self.monitored_paths:
-                for p, v in self.adapter.demo_db.items():
-                    if p.startswith(mp):
-                        # we only simulate changes on type leaf
-                        candidate_paths.add(
-                            p.replace("/name", "/type"))
-            log.debug("candidate_paths=%s", candidate_paths)
-            for path in random.sample(candidate_paths,
+                for p, v in self.adapter.demo_db.leaves(mp):
+                    # we only simulate changes on type leaf
+                    candidate_paths.add(p.replace("/name", "/type"))
+            log.debug("len(candidate_paths)=%d", len(candidate_paths))
+            for path in random.sample(sorted(candidate_paths),
                                       min(len(candidate_paths), 4)):
                 new_val = "gigabitEthernet"
                 if self.adapter.demo_db[path] == "gigabitEthernet":
@@ -233,9 +233,8 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
         def process_changes(self):
             log.debug("==>")
             add_count = 0
-            # there may be more changes to same path, we cannot use map
+            # more changes to same path are coalesced in change_buffer
             assert self.change_event_queue is not None
-            assert len(self.change_db) == 0
             while True:
                 try:
                     log.debug("getting event")
@@ -243,7 +242,7 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
                     log.debug("event=%s", event)
                     if event == self.ChangeEvent.ADD:
                         # generate modifications and add them
-                        with self.change_db_lock, self.adapter.db_lock:
+                        with self.adapter.db_lock:
                             if "changes" in GnmiDemoServerAdapter.config:
                                 changes = self._get_config_changes()
                             else:
@@ -264,8 +263,9 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
                                         path = '/' + path
                                     if any(path.startswith(elem) for elem in
                                            self.monitored_paths):
-                                        log.info("appending (path, val)=%s", (path, val))
-                                        self.change_db.append((path, val))
+                                        log.info("adding (path, val)=%s", (path, val))
+                                        self.change_buffer.add(
+                                            tuple(path.split("/")), (path, val))
                                         if path in self.adapter.demo_db:
                                             self.adapter.demo_db[path] = val
                                         elif path in self.adapter.demo_state_db:
@@ -274,12 +274,12 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
                                         else:
                                             assert False
                         if send:
-                            if len(self.change_db):
+                            if len(self.change_buffer):
                                 self.change_event_queue.put(
                                     self.ChangeEvent.SEND)
                     elif event == self.ChangeEvent.SEND:
                         # send all modified paths
-                        self.put_event(self.SubscriptionEvent.SEND_CHANGES)
+                        self.notify_changes()
                     elif event == self.ChangeEvent.FINISH:
                         break
                     else:
@@ -353,6 +353,10 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
     def encodings(self):
         return [gnmi_pb2.Encoding.JSON, gnmi_pb2.Encoding.JSON_IETF]
 
+    def capabilities_version(self):
+        # capability_list is static
+        return 0
+
     def get_db_updates_for_path(self, path, prefix, db):
         log.debug("==> path={} prefix={}".format(path, prefix))
 
@@ -364,32 +368,26 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
 
         updates = []
         path_val_list = []
-        map_db = self._demo_db_to_key_elem_map(db)
-        ifaces = self._nsless_xpath(path_with_prefix)
-        if ifaces == "/interfaces" or ifaces == "/interfaces-state":
-            if list(db.keys())[0].startswith(ifaces):
+        xpath = self._nsless_xpath(path_with_prefix)
+        node = db.get_node(xpath)
+        if node is None or node is db.root:
+            pass
+        elif isinstance(node, DemoList):
+            # one update per list entry
+            path_val_list = [
+                (xpath + keys, db.to_json(entry, self._leaf_json_value))
+                for keys, entry in node.items()]
+        elif isinstance(node, dict):
+            if xpath.endswith("]"):
+                path_val_list = [
+                    (xpath, db.to_json(node, self._leaf_json_value))]
+            else:
                 path_val_list = [
-                    (path_with_prefix, {"interface": list(map_db.values())})]
+                    (path_with_prefix,
+                     db.to_json(node, self._leaf_json_value))]
         else:
-            paths = []
-            for p, v in db.items():
-                if self._nsless_xpath(p).startswith(
-                        self._nsless_xpath(path_with_prefix)):
-                    paths.append(p)
-            keys_done = set()
-            for p in paths:
-                key = self._get_key_from_xpath(p)
-                if key in keys_done:
-                    continue
-                keys_done.add(key)
-                elem_val = map_db[key]
-                path_elem = self._get_elem_from_xpath(path_with_prefix)
-                path = p
-                if path_elem:
-                    elem_val = elem_val[path_elem]
-                else:
-                    path = p.replace("/type", "").replace("/name", "")
-                path_val_list.append((path, elem_val))
+            name = xpath[xpath.rfind("/") + 1:]
+            path_val_list = [(xpath, self._leaf_json_value(name, node))]
 
         if len(path_val_list):
             for pv in path_val_list:
@@ -417,7 +415,8 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
         log.debug("<== updates=%s", updates)
         return updates
 
-    def get(self, prefix, paths, data_type, use_models):
+    def get(self, prefix, paths, data_type, use_models,
+            encoding=gnmi_pb2.Encoding.JSON_IETF):
         log.debug("==> prefix=%s, paths=%s, data_type=%s, use_models=%s",
                   prefix, paths, data_type, use_models)
         notifications = []
@@ -448,7 +447,7 @@ class GnmiDemoServerAdapter(GnmiServerAdapter):
                 str_val = "{}".format(val)
             str_val = str_val.replace(self.NS_IANA, "")
             with self.db_lock:
-                self.demo_db[path_str] = str_val
+                self.demo_db[self._nsless_xpath(path_str)] = str_val
             op = gnmi_pb2.UpdateResult.UPDATE
 
         log.info("==> op=%s", op)
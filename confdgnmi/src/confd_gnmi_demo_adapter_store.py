@@ -0,0 +1,172 @@
+import logging
+from collections.abc import MutableMapping
+
+log = logging.getLogger('confd_gnmi_demo_adapter_store')
+
+
+class DemoList(dict):
+    """
+    List node of DemoStore - entries (container nodes) by key predicate
+    string (e.g. `[name=if_1]`) in insertion order.
+    """
+    pass
+
+
+def split_xpath(xpath):
+    """
+    Split XPath to elements, `/` inside key predicates is not a separator.
+    :param xpath: e.g. /interfaces/interface[name=eth0/1]/type
+    :return: list of (name, keys) tuples, keys is predicate string or ""
+             e.g. [("interfaces", ""), ("interface", "[name=eth0/1]"),
+                   ("type", "")]
+    """
+    elems = []
+    start = 0
+    depth = 0
+    for i, c in enumerate(xpath):
+        if c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+        elif c == "/" and depth == 0:
+            if i > start:
+                elems.append(xpath[start:i])
+            start = i + 1
+    if start < len(xpath):
+        elems.append(xpath[start:])
+    result = []
+    for elem in elems:
+        pos = elem.find("[")
+        if pos == -1:
+            result.append((elem, ""))
+        else:
+            result.append((elem[:pos], elem[pos:]))
+    return result
+
+
+class DemoStore(MutableMapping):
+    """
+    Demo database - leaf values (strings) by XPath, stored in a tree.
+    Containers and list entries are dicts (child name -> node), lists are
+    DemoList (key predicate -> entry), leaves are values.
+    Lookup of a path costs O(depth), reading a subtree O(depth + size of
+    the subtree), so it does not depend on number of stored values.
+    It is also a mapping (XPath -> value) of all leaves.
+    """
+
+    def __init__(self, values=None):
+        self.root = {}
+        self.count = 0
+        if values is not None:
+            self.update(values)
+
+    def get_node(self, xpath):
+        """
+        Get node of the tree.
+        :param xpath: path of container, list (without keys), list entry
+                      or leaf
+        :return: dict (container, list entry), DemoList, leaf value or None
+        """
+        node = self.root
+        for name, keys in split_xpath(xpath):
+            if not isinstance(node, dict) or name not in node:
+                return None
+            node = node[name]
+            if keys:
+                if not isinstance(node, DemoList) or keys not in node:
+                    return None
+                node = node[keys]
+        return node
+
+    def _leaf_parent(self, xpath, create=False):
+        elems = split_xpath(xpath)
+        if not elems or elems[-1][1]:
+            raise KeyError(xpath)
+        node = self.root
+        for name, keys in elems[:-1]:
+            if not isinstance(node, dict) or isinstance(node, DemoList):
+                raise KeyError(xpath)
+            if name not in node:
+                if not create:
+                    raise KeyError(xpath)
+                node[name] = DemoList() if keys else {}
+            node = node[name]
+            if keys:
+                if not isinstance(node, DemoList):
+                    raise KeyError(xpath)
+                if keys not in node:
+                    if not create:
+                        raise KeyError(xpath)
+                    node[keys] = {}
+                node = node[keys]
+        if not isinstance(node, dict) or isinstance(node, DemoList):
+            raise KeyError(xpath)
+        return node, elems[-1][0]
+
+    def __getitem__(self, xpath):
+        parent, name = self._leaf_parent(xpath)
+        value = parent[name]
+        if isinstance(value, dict):
+            raise KeyError(xpath)
+        return value
+
+    def __setitem__(self, xpath, value):
+        parent, name = self._leaf_parent(xpath, create=True)
+        if isinstance(parent.get(name), dict):
+            raise KeyError(xpath)
+        if name not in parent:
+            self.count += 1
+        parent[name] = value
+
+    def __delitem__(self, xpath):
+        parent, name = self._leaf_parent(xpath)
+        if name not in parent or isinstance(parent[name], dict):
+            raise KeyError(xpath)
+        del parent[name]
+        self.count -= 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for xpath, _ in self.leaves():
+            yield xpath
+
+    def leaves(self, xpath=""):
+        """
+        Iterate leaves of subtree.
+        :param xpath: path of subtree root ("" - whole store)
+        :return: generator of (XPath, value)
+        """
+        node = self.get_node(xpath)
+        if node is None:
+            return
+        stack = [(xpath.rstrip("/"), node)]
+        while stack:
+            path, node = stack.pop()
+            if isinstance(node, DemoList):
+                entries = [(path + keys, entry) for keys, entry in node.items()]
+                stack.extend(reversed(entries))
+            elif isinstance(node, dict):
+                children = [(f"{path}/{name}", child)
+                            for name, child in node.items()]
+                stack.extend(reversed(children))
+            else:
+                yield path, node
+
+    @staticmethod
+    def to_json(node, leaf_value=None):
+        """
+        Convert node to JSON value (lists are arrays of entry objects).
+        :param node: node returned by `get_node`
+        :param leaf_value: optional function (leaf name, value) -> JSON value
+        """
+        def convert(name, node):
+            if isinstance(node, DemoList):
+                return [convert(name, entry) for entry in node.values()]
+            if isinstance(node, dict):
+                return {child_name: convert(child_name, child)
+                        for child_name, child in node.items()}
+            return node if leaf_value is None else leaf_value(name, node)
+
+        return convert(None, node)
@@ -1,3 +1,4 @@
+import gnmi_pb2
 from confd_gnmi_adapter import GnmiServerAdapter
 
 
@@ -19,5 +20,6 @@ class GnmiNetconfServerAdapter(GnmiServerAdapter):
     def capabilities(self):
         return []
 
-    def get(self, prefix, paths, data_type, use_models):
+    def get(self, prefix, paths, data_type, use_models,
+            encoding=gnmi_pb2.Encoding.JSON_IETF):
         return []
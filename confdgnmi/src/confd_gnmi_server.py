@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import functools
 import logging
 import sys
 import threading
@@ -9,13 +11,21 @@ from enum import Enum
 import grpc
 
 import gnmi_pb2
-from confd_gnmi_api_adapter_defaults import ApiAdapterDefaults
+from confd_gnmi_adapter import AdapterPool, GnmiServerAdapter, \
+    CHANGE_BUFFER_SIZE, CHANGE_BUFFER_OVERFLOW, OVERFLOW_POLICIES, \
+    BATCH_MAX_LATENCY, BATCH_MAX_SIZE, MIN_SAMPLE_INTERVAL, \
+    MAX_NOTIFICATION_UPDATES, MAX_NOTIFICATION_BYTES
+from confd_gnmi_api_adapter_defaults import ApiAdapterDefaults, GET_MODES
 from confd_gnmi_common import PORT, common_optparse_options, \
     common_optparse_process, VERSION
 from gnmi_pb2_grpc import gNMIServicer, add_gNMIServicer_to_server
 
 log = logging.getLogger('confd_gnmi_server')
 
+MAX_WORKERS = 10
+ADAPTER_POOL_SIZE = 100
+ADAPTER_IDLE_TIMEOUT = 300.0
+
 
 class AdapterType(Enum):
     DEMO = 0
@@ -24,11 +34,26 @@ class AdapterType(Enum):
 
 
 class ConfDgNMIServicer(gNMIServicer):
+    adapter_pool_size: int = ADAPTER_POOL_SIZE
+    adapter_idle_timeout: float = ADAPTER_IDLE_TIMEOUT
 
     # parameterized constructor
     def __init__(self, adapter_type):
         self.adapter_type = adapter_type
         assert isinstance(self.adapter_type, AdapterType)
+        self.adapter_pool = AdapterPool(
+            max_size=ConfDgNMIServicer.adapter_pool_size,
+            idle_timeout=ConfDgNMIServicer.adapter_idle_timeout)
+        # (adapter capabilities version, CapabilityResponse)
+        self.capabilities_response = None
+
+    @staticmethod
+    def set_adapter_pool_size(size):
+        ConfDgNMIServicer.adapter_pool_size = size
+
+    @staticmethod
+    def set_adapter_idle_timeout(timeout):
+        ConfDgNMIServicer.adapter_idle_timeout = timeout
 
     @staticmethod
     def extract_user_metadata(context):
@@ -40,19 +65,37 @@ class ConfDgNMIServicer(gNMIServicer):
         log.debug("<= username=%s password=:-)", username)
         return username, password
 
-    def get_and_connect_adapter(self, username, password):
-        log.debug("==> self.adapter_type=%s username=%s password=:-)",
-                  self.adapter_type, username)
+    @staticmethod
+    def extract_peer_address(context):
+        """
+        Get client address (without port) from context.peer()
+        e.g. ipv4:127.0.0.1:4567 => 127.0.0.1, ipv6:[::1]:4567 => [::1]
+        """
+        peer = context.peer() or ""
+        address = peer.split(":", 1)[-1]
+        if address.rfind(":") > address.rfind("]"):
+            address = address.rsplit(":", 1)[0]
+        return address
+
+    def get_and_connect_adapter(self, username, password, address=""):
+        log.debug("==> self.adapter_type=%s username=%s password=:-) "
+                  "address=%s", self.adapter_type, username, address)
         adapter = None
         if self.adapter_type == AdapterType.DEMO:
             from confd_gnmi_demo_adapter import GnmiDemoServerAdapter
             adapter = GnmiDemoServerAdapter.get_adapter()
         elif self.adapter_type == AdapterType.API:
             from confd_gnmi_api_adapter import GnmiConfDApiServerAdapter
-            adapter = GnmiConfDApiServerAdapter.get_adapter()
-            adapter.connect(addr=GnmiConfDApiServerAdapter.confd_addr,
-                            port=GnmiConfDApiServerAdapter.confd_port,
-                            username=username, password=password)
+
+            def connected_adapter():
+                api_adapter = GnmiConfDApiServerAdapter.get_adapter()
+                api_adapter.connect(addr=GnmiConfDApiServerAdapter.confd_addr,
+                                    port=GnmiConfDApiServerAdapter.confd_port,
+                                    username=username, password=password)
+                return api_adapter
+
+            adapter = self.adapter_pool.get(username, address, password,
+                                            connected_adapter)
         log.debug("<== adapter=%s", adapter)
         return adapter
 
@@ -71,7 +114,8 @@ class ConfDgNMIServicer(gNMIServicer):
         else:
             if any(val.HasField(a) for a in
                    ["string_val", "int_val", "uint_val", "bool_val",
-                    "bytes_val", "float_val", "leaflist_val"]):
+                    "bytes_val", "float_val", "decimal_val", "double_val",
+                    "leaflist_val"]):
                 encoding = gnmi_pb2.Encoding.PROTO
         log.debug("<== encoding=%s", encoding)
         return encoding
@@ -104,18 +148,26 @@ class ConfDgNMIServicer(gNMIServicer):
     def get_connected_adapter(self, context):
         """
         Get adapter and connect it to ConfD if needed
-        Currently we always create new instance, later on
-        a pool of adapters can be maintained.
+        Connected adapters are reused from `adapter_pool`
+        (per username and client address).
         :param context:
         :return:
         """
         log.debug("==>")
         (username, password) = self.extract_user_metadata(context)
-        adapter = self.get_and_connect_adapter(username=username,
-                                               password=password)
+        adapter = self.get_and_connect_adapter(
+            username=username, password=password,
+            address=self.extract_peer_address(context))
         log.debug("<== adapter=%s", adapter)
         return adapter
 
+    def release_adapter(self, adapter):
+        """
+        Release adapter got with `get_connected_adapter` (at the end of RPC).
+        Pooled adapter is not closed while it is used by any RPC.
+        """
+        self.adapter_pool.release(adapter)
+
     def Capabilities(self, request, context):
         """Capabilities allows the client to retrieve the set of capabilities
         that is supported by the target. This allows the target to validate the
@@ -127,6 +179,17 @@ class ConfDgNMIServicer(gNMIServicer):
         log.info("==> request=%s context=%s", request, context)
 
         adapter = self.get_connected_adapter(context)
+        try:
+            return self._get_capabilities(adapter)
+        finally:
+            self.release_adapter(adapter)
+
+    def _get_capabilities(self, adapter):
+        version = adapter.capabilities_version()
+        cached = self.capabilities_response
+        if version is not None and cached is not None and cached[0] == version:
+            log.info("<== cached response version=%s", version)
+            return cached[1]
 
         supported_models = [
             gnmi_pb2.ModelData(
@@ -143,6 +206,8 @@ class ConfDgNMIServicer(gNMIServicer):
             supported_encodings=supported_encodings,
             gNMI_version="proto3",
             extension=[])
+        if version is not None:
+            self.capabilities_response = (version, response)
         # context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         # context.set_details('Method not implemented!')
         # raise NotImplementedError('Method not implemented!')
@@ -159,9 +224,13 @@ class ConfDgNMIServicer(gNMIServicer):
         """
         log.info("==> request=%s context=%s", request, context)
         adapter = self.get_connected_adapter(context)
-        self.verify_encoding_supported(request.encoding, adapter, context)
-        notifications = adapter.get(request.prefix, request.path,
-                                    request.type, request.use_models)
+        try:
+            self.verify_encoding_supported(request.encoding, adapter, context)
+            notifications = adapter.get(request.prefix, request.path,
+                                        request.type, request.use_models,
+                                        request.encoding)
+        finally:
+            self.release_adapter(adapter)
         response = gnmi_pb2.GetResponse(notification=notifications)
 
         log.info("<== response=%s", response)
@@ -175,11 +244,19 @@ class ConfDgNMIServicer(gNMIServicer):
         """
         log.info("==> request=%s context=%s", request, context)
         adapter = self.get_connected_adapter(context)
-        self.verify_updates_encoding_supported(request.update, adapter, context)
-        # TODO for now we do not process replace list
-        # TODO: changes should be part of one transaction (gNMI spec. 3.4.3)
-        ops = adapter.set(request.prefix, request.update)
-        ops += adapter.delete(request.prefix, request.delete)
+        try:
+            self.verify_updates_encoding_supported(request.replace, adapter,
+                                                   context)
+            self.verify_updates_encoding_supported(request.update, adapter,
+                                                   context)
+            ops = adapter.set_request(request.prefix, request.delete,
+                                      request.replace, request.update)
+        except NotImplementedError as e:
+            context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+            context.set_details(str(e))
+            raise
+        finally:
+            self.release_adapter(adapter)
 
         results = [gnmi_pb2.UpdateResult(timestamp=0, path=path, op=op)
                    for path, op in ops]
@@ -212,6 +289,25 @@ class ConfDgNMIServicer(gNMIServicer):
             handler.stop()
         log.debug("<==")
 
+    @staticmethod
+    def set_subscription_status(handler, context):
+        """
+        Set status of finished Subscribe RPC - change buffer counters
+        are sent in trailing metadata (`change-buffer-<counter>` keys),
+        change buffer overflow ends the RPC with RESOURCE_EXHAUSTED.
+        """
+        counters = handler.counters()
+        log.info("==> counters=%s", counters)
+        if counters:
+            context.set_trailing_metadata(tuple(
+                (f"change-buffer-{name}", str(value))
+                for name, value in counters.items()))
+        if handler.is_overflowed():
+            text = "gNMI: subscription change buffer overflow"
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details(text)
+        log.info("<==")
+
     def Subscribe(self, request_iterator, context):
         """Subscribe allows a client to request the target to send it values
         of particular paths within the data tree. These values may be streamed
@@ -229,52 +325,232 @@ class ConfDgNMIServicer(gNMIServicer):
             log.info("<==")
 
         request = next(request_iterator)
+        # adapter is leased (not closed by pool) while subscription is active
         adapter = self.get_connected_adapter(context)
-        self.verify_encoding_supported(request.subscribe.encoding, adapter,
-                                       context)
-        context.add_callback(subscribe_rpc_done)
-        # first request, should contain subscription list (`subscribe`)
-        assert hasattr(request, "subscribe")
-        handler = adapter.get_subscription_handler(request.subscribe)
-
-        thr = None
-        if not handler.is_once():
-            thr = threading.Thread(target=ConfDgNMIServicer._read_sub_request,
-                                   args=(request_iterator, handler,
-                                         handler.is_poll()))
-            thr.start()
-        # `yield from` can be used, but to allow altering (e.g. path conversion)
-        # response later on we use `for`
-        for response in handler.read():
-            log.debug("response received, calling yield")
-            yield response
-
-        if thr is not None:
-            thr.join()
+        try:
+            self.verify_encoding_supported(request.subscribe.encoding, adapter,
+                                           context)
+            context.add_callback(subscribe_rpc_done)
+            # first request, should contain subscription list (`subscribe`)
+            assert hasattr(request, "subscribe")
+            handler = adapter.get_subscription_handler(request.subscribe)
+
+            thr = None
+            if not handler.is_once():
+                thr = threading.Thread(
+                    target=ConfDgNMIServicer._read_sub_request,
+                    args=(request_iterator, handler, handler.is_poll()))
+                thr.start()
+            # `yield from` can be used, but to allow altering
+            # (e.g. path conversion) response later on we use `for`
+            for response in handler.read():
+                log.debug("response received, calling yield")
+                yield response
+            self.set_subscription_status(handler, context)
+
+            # on overflow, request reader ends when the RPC is finished
+            if thr is not None and not handler.is_overflowed():
+                thr.join()
+        finally:
+            self.release_adapter(adapter)
         log.info("")
         log.info("<==")
 
     @staticmethod
-    def serve(port=PORT, adapter_type=AdapterType.DEMO, insecure=False,
-              key_file=None, crt_file=None):
-        log.info("==> port=%s adapter_type=%s", port, adapter_type)
-
-        server = grpc.server(ThreadPoolExecutor(max_workers=10))
-        add_gNMIServicer_to_server(ConfDgNMIServicer(adapter_type), server)
+    def _add_port(server, port, insecure, key_file, crt_file):
         if insecure:
             server.add_insecure_port("[::]:{}".format(port))
         else:
-            assert key_file!= None and crt_file != None
+            assert key_file is not None and crt_file is not None
             with open(key_file, "rb") as k, open(crt_file, "rb") as c:
                 key = k.read()
                 crt = c.read()
             server.add_secure_port("[::]:{}".format(port),
-                           grpc.ssl_server_credentials([(key, crt)]))
+                                   grpc.ssl_server_credentials([(key, crt)]))
+
+    @staticmethod
+    def serve(port=PORT, adapter_type=AdapterType.DEMO, insecure=False,
+              key_file=None, crt_file=None, aio=False,
+              max_workers=MAX_WORKERS):
+        """
+        Start gNMI server.
+        :param aio: if True, grpc.aio based server is started
+                    (see ConfDgNMIAsyncServicer)
+        :param max_workers: max. number of worker threads (for aio server,
+                            max. number of threads for blocking adapter calls)
+        :return: started server (grpc.Server or AsyncServer)
+        """
+        log.info("==> port=%s adapter_type=%s aio=%s max_workers=%s",
+                 port, adapter_type, aio, max_workers)
+        if aio:
+            server = AsyncServer(port, adapter_type, insecure=insecure,
+                                 key_file=key_file, crt_file=crt_file,
+                                 max_workers=max_workers)
+        else:
+            server = grpc.server(ThreadPoolExecutor(max_workers=max_workers))
+            add_gNMIServicer_to_server(ConfDgNMIServicer(adapter_type), server)
+            ConfDgNMIServicer._add_port(server, port, insecure, key_file,
+                                        crt_file)
         server.start()
         log.info("<== server=%s", server)
         return server
 
 
+class ConfDgNMIAsyncServicer(ConfDgNMIServicer):
+    """
+    gNMI servicer for grpc.aio server.
+    RPCs are coroutines, blocking adapter calls are run in bounded `executor`.
+    Subscribe streams do not hold any thread while waiting for events,
+    so number of concurrent subscriptions is not limited by number of threads.
+    """
+
+    def __init__(self, adapter_type, executor):
+        super().__init__(adapter_type)
+        self.executor = executor
+
+    async def run_blocking(self, fun, *args):
+        """
+        Run blocking function `fun` in the `executor`.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(fun, *args))
+
+    async def Capabilities(self, request, context):
+        return await self.run_blocking(super().Capabilities, request, context)
+
+    async def Get(self, request, context):
+        return await self.run_blocking(super().Get, request, context)
+
+    async def Set(self, request, context):
+        return await self.run_blocking(super().Set, request, context)
+
+    @staticmethod
+    async def _read_sub_request_async(request_iterator, handler,
+                                      stop_on_end=False):
+        log.debug("==> stop_on_end=%s", stop_on_end)
+        try:
+            async for req in request_iterator:
+                # TODO check req mode is POLL
+                log.debug("req=%s", req)
+                if hasattr(req, "poll"):
+                    handler.poll()
+                else:
+                    # TODO exception, not expected other type of request
+                    assert False
+        except grpc.RpcError as e:
+            # check if this is end of Poll sending
+            if handler.is_poll():
+                log.exception(e)
+        log.debug("Request loop ended.")
+        if stop_on_end:
+            log.debug("stopping handler")
+            handler.stop()
+        log.debug("<==")
+
+    async def Subscribe(self, request_iterator, context):
+        log.info("==> request_iterator=%s context=%s", request_iterator,
+                 context)
+        # first request, should contain subscription list (`subscribe`)
+        request = await request_iterator.__anext__()
+        adapter = await self.run_blocking(self.get_connected_adapter, context)
+        reader = None
+        try:
+            self.verify_encoding_supported(request.subscribe.encoding, adapter,
+                                           context)
+            assert hasattr(request, "subscribe")
+            handler = adapter.get_subscription_handler(request.subscribe)
+            handler.attach_event_loop(asyncio.get_running_loop())
+
+            if not handler.is_once():
+                reader = asyncio.ensure_future(
+                    self._read_sub_request_async(request_iterator, handler,
+                                                 handler.is_poll()))
+            async for response in handler.read_async(self.executor):
+                log.debug("response received, calling yield")
+                yield response
+            self.set_subscription_status(handler, context)
+        finally:
+            if reader is not None:
+                reader.cancel()
+            self.release_adapter(adapter)
+        log.info("<==")
+
+
+class AsyncServer:
+    """
+    grpc.aio gNMI server running its own event loop in a separate thread.
+    It can be used in the same way as grpc.Server (`start`, `stop`,
+    `wait_for_termination`).
+    """
+
+    def __init__(self, port, adapter_type, insecure=False, key_file=None,
+                 crt_file=None, max_workers=MAX_WORKERS):
+        self.port = port
+        self.adapter_type = adapter_type
+        self.insecure = insecure
+        self.key_file = key_file
+        self.crt_file = crt_file
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.loop = None
+        self.thread = None
+        self.started = threading.Event()
+        self.start_error = None
+        self.stop_request = None
+        self.stop_grace = None
+
+    async def _serve(self):
+        log.info("==>")
+        self.stop_request = asyncio.Event()
+        try:
+            server = grpc.aio.server()
+            add_gNMIServicer_to_server(
+                ConfDgNMIAsyncServicer(self.adapter_type, self.executor),
+                server)
+            ConfDgNMIServicer._add_port(server, self.port, self.insecure,
+                                        self.key_file, self.crt_file)
+            await server.start()
+        except Exception as e:
+            self.start_error = e
+            raise
+        finally:
+            self.started.set()
+        await self.stop_request.wait()
+        await server.stop(self.stop_grace)
+        log.info("<==")
+
+    def _run(self):
+        # grpc.aio requires the loop to be current loop of this thread
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            log.exception(e)
+        finally:
+            self.loop.close()
+            self.executor.shutdown(wait=False)
+
+    def start(self):
+        log.info("==>")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.start_error is not None:
+            raise self.start_error
+        log.info("<==")
+
+    def stop(self, grace):
+        log.info("==> grace=%s", grace)
+        self.stop_grace = grace
+        self.loop.call_soon_threadsafe(self.stop_request.set)
+        log.info("<==")
+
+    def wait_for_termination(self, timeout=None):
+        self.thread.join(timeout)
+        return self.thread.is_alive()
+
+
 def parse_args(args, parser = None):
     log.debug("==> args=%s", args)
     if parser is None:
@@ -307,6 +583,34 @@ def parse_args(args, parser = None):
                         help="Port of external changes service (default is {})".format(
                             ApiAdapterDefaults.EXTERNAL_PORT),
                         default=ApiAdapterDefaults.EXTERNAL_PORT, type=int)
+    parser.add_argument("--max-sessions", action="store", dest="max_sessions",
+                        type=int,
+                        help="Max. number of concurrent ConfD MAAPI sessions per user (default is {})".format(
+                            ApiAdapterDefaults.MAX_SESSIONS),
+                        default=ApiAdapterDefaults.MAX_SESSIONS)
+    parser.add_argument("--read-trans-max-staleness", action="store",
+                        dest="read_trans_max_staleness", type=float,
+                        help="Max. age (in seconds) of reused ConfD read transaction (default is {})".format(
+                            ApiAdapterDefaults.READ_TRANS_MAX_STALENESS),
+                        default=ApiAdapterDefaults.READ_TRANS_MAX_STALENESS)
+    parser.add_argument("--no-bulk-get", action="store_false", dest="bulk_get",
+                        help="Read every list entry matching Get path separately (do not save common ancestor)",
+                        default=ApiAdapterDefaults.BULK_GET)
+    parser.add_argument("--schema-cache-size", action="store",
+                        dest="schema_cache_size", type=int,
+                        help="Max. number of cached schema nodes (default is {})".format(
+                            ApiAdapterDefaults.SCHEMA_CACHE_SIZE),
+                        default=ApiAdapterDefaults.SCHEMA_CACHE_SIZE)
+    parser.add_argument("--schema-snapshot", action="store",
+                        dest="schema_snapshot",
+                        help="File with schema snapshot reused on next start, empty disables it (default is {})".format(
+                            ApiAdapterDefaults.SCHEMA_SNAPSHOT),
+                        default=ApiAdapterDefaults.SCHEMA_SNAPSHOT)
+    parser.add_argument("--get-mode", action="store", dest="get_mode",
+                        choices=GET_MODES,
+                        help="Read GetRequest paths in one transaction (snapshot) or in parallel (default is {})".format(
+                            ApiAdapterDefaults.GET_MODE),
+                        default=ApiAdapterDefaults.GET_MODE)
     parser.add_argument("--cfg", action="store", dest="cfg",
                         help="config file")
     parser.add_argument("--key", action="store", dest="key",
@@ -315,6 +619,60 @@ def parse_args(args, parser = None):
     parser.add_argument("--crt", action="store", dest="crt",
                         help="Path to the server certificate.",
                         default="server.crt")
+    parser.add_argument("--adapter-pool-size", action="store",
+                        dest="adapter_pool_size", type=int,
+                        help="Max. number of pooled (connected) adapters (default is {})".format(
+                            ADAPTER_POOL_SIZE),
+                        default=ADAPTER_POOL_SIZE)
+    parser.add_argument("--adapter-idle-timeout", action="store",
+                        dest="adapter_idle_timeout", type=float,
+                        help="Time (in seconds) after which unused pooled adapter is closed (default is {})".format(
+                            ADAPTER_IDLE_TIMEOUT),
+                        default=ADAPTER_IDLE_TIMEOUT)
+    parser.add_argument("--change-buffer-size", action="store",
+                        dest="change_buffer_size", type=int,
+                        help="Max. number of buffered changes per subscription (default is {})".format(
+                            CHANGE_BUFFER_SIZE),
+                        default=CHANGE_BUFFER_SIZE)
+    parser.add_argument("--change-buffer-overflow", action="store",
+                        dest="change_buffer_overflow",
+                        choices=OVERFLOW_POLICIES,
+                        help="What to do when change buffer of subscription is full (default is {})".format(
+                            CHANGE_BUFFER_OVERFLOW),
+                        default=CHANGE_BUFFER_OVERFLOW)
+    parser.add_argument("--batch-max-latency", action="store",
+                        dest="batch_max_latency", type=float,
+                        help="Max. time (in seconds) subscription changes wait to be sent together (default is {})".format(
+                            BATCH_MAX_LATENCY),
+                        default=BATCH_MAX_LATENCY)
+    parser.add_argument("--batch-max-size", action="store",
+                        dest="batch_max_size", type=int,
+                        help="Max. number of subscription changes sent together (default is {})".format(
+                            BATCH_MAX_SIZE),
+                        default=BATCH_MAX_SIZE)
+    parser.add_argument("--min-sample-interval", action="store",
+                        dest="min_sample_interval", type=float,
+                        help="Min. sample interval (in seconds) of SAMPLE subscriptions (default is {})".format(
+                            MIN_SAMPLE_INTERVAL),
+                        default=MIN_SAMPLE_INTERVAL)
+    parser.add_argument("--max-notification-updates", action="store",
+                        dest="max_notification_updates", type=int,
+                        help="Max. number of updates in a subscription notification, 0 means no limit (default is {})".format(
+                            MAX_NOTIFICATION_UPDATES),
+                        default=MAX_NOTIFICATION_UPDATES)
+    parser.add_argument("--max-notification-bytes", action="store",
+                        dest="max_notification_bytes", type=int,
+                        help="Max. size (in bytes) of one subscription notification, 0 means no limit (default is {})".format(
+                            MAX_NOTIFICATION_BYTES),
+                        default=MAX_NOTIFICATION_BYTES)
+    parser.add_argument("--aio", action="store_true", dest="aio",
+                        help="Use asyncio (grpc.aio) server",
+                        default=False)
+    parser.add_argument("--max-workers", action="store", dest="max_workers",
+                        type=int,
+                        help="Max. number of worker threads (default is {})".format(
+                            MAX_WORKERS),
+                        default=MAX_WORKERS)
     opt = parser.parse_args(args=args)
     log.debug("opt=%s", opt)
     return opt
@@ -325,6 +683,22 @@ if __name__ == '__main__':
     common_optparse_process(opt, log)
     log.debug("opt=%s", opt)
     adapter_type = AdapterType.DEMO
+    ConfDgNMIServicer.set_adapter_pool_size(opt.adapter_pool_size)
+    ConfDgNMIServicer.set_adapter_idle_timeout(opt.adapter_idle_timeout)
+    GnmiServerAdapter.SubscriptionHandler.set_change_buffer_size(
+        opt.change_buffer_size)
+    GnmiServerAdapter.SubscriptionHandler.set_change_buffer_overflow(
+        opt.change_buffer_overflow)
+    GnmiServerAdapter.SubscriptionHandler.set_batch_max_latency(
+        opt.batch_max_latency)
+    GnmiServerAdapter.SubscriptionHandler.set_batch_max_size(
+        opt.batch_max_size)
+    GnmiServerAdapter.SubscriptionHandler.set_min_sample_interval(
+        opt.min_sample_interval)
+    GnmiServerAdapter.SubscriptionHandler.set_max_notification_updates(
+        opt.max_notification_updates)
+    GnmiServerAdapter.SubscriptionHandler.set_max_notification_bytes(
+        opt.max_notification_bytes)
     if opt.type == "api":
         from confd_gnmi_api_adapter import GnmiConfDApiServerAdapter
 
@@ -335,6 +709,13 @@ if __name__ == '__main__':
         GnmiConfDApiServerAdapter.set_external_port(int(opt.external_port))
         GnmiConfDApiServerAdapter.set_monitor_external_changes(
             bool(opt.monitor_external_changes))
+        GnmiConfDApiServerAdapter.set_max_sessions(opt.max_sessions)
+        GnmiConfDApiServerAdapter.set_read_trans_max_staleness(
+            opt.read_trans_max_staleness)
+        GnmiConfDApiServerAdapter.set_bulk_get(bool(opt.bulk_get))
+        GnmiConfDApiServerAdapter.set_schema_cache_size(opt.schema_cache_size)
+        GnmiConfDApiServerAdapter.set_schema_snapshot_path(opt.schema_snapshot)
+        GnmiConfDApiServerAdapter.set_get_mode(opt.get_mode)
     # elif opt.type == "netconf":
     #     adapter_type = AdapterType.NETCONF
     elif opt.type == "demo":
@@ -351,7 +732,8 @@ if __name__ == '__main__':
         log.warning("Unknown server type %s", opt.type)
 
     server = ConfDgNMIServicer.serve(PORT, adapter_type, insecure=opt.insecure,
-                                     key_file=opt.key, crt_file=opt.crt)
+                                     key_file=opt.key, crt_file=opt.crt,
+                                     aio=opt.aio, max_workers=opt.max_workers)
     try:
         server.wait_for_termination()
     except KeyboardInterrupt:
@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import argparse
+import json
 import logging
 import os
 import select
@@ -8,14 +10,14 @@ import threading
 from dataclasses import dataclass
 from enum import Enum
 from random import randint
-from time import sleep
+from time import monotonic, sleep
 
 import _confd
 from _confd import dp, maapi
 
 # Set log level and port to send gNMI Adapter external changes
-# TODO command line options
 EXTERNAL_PORT: int = 5055
+EXTERNAL_HOST = "localhost"
 LOG_LEVEL = logging.INFO
 RUN_FOR_TIME: int = 1000
 
@@ -196,16 +198,70 @@ class RouteProvider:
 
 class ChangeOp(Enum):
     MODIFIED = "mod"
+    DELETED = "del"
 
 
-def generate_changes(stop_fun, route_data: RouteData, sleep_val=2):
+class ExternalChangeClient:
+    """
+    Producer of external changes for gNMI Adapter.
+    Connection is kept open, every batch of changes is sent as one line
+    of newline delimited JSON (see ExternalChangeServer).
+    `send` blocks when the adapter does not keep up (TCP back-pressure).
+    """
+
+    def __init__(self, host=EXTERNAL_HOST, port=EXTERNAL_PORT):
+        self.host = host
+        self.port = port
+        self.sock = None
+
+    @staticmethod
+    def make_change(op: ChangeOp, xpath, val=None):
+        change = {"op": op.value, "path": xpath}
+        if op != ChangeOp.DELETED:
+            change["val"] = val
+        return change
+
+    def connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port))
+            log.info("Connected to the change server")
+
+    def send(self, changes):
+        """
+        Send batch of changes, connect if not connected.
+        :param changes: list of changes (see `make_change`)
+        """
+        line = json.dumps(changes, separators=(",", ":")) + "\n"
+        self.connect()
+        try:
+            self.sock.sendall(line.encode("utf-8"))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def make_leaf1_change(route_data: RouteData, key, val):
+    route_data.routes[key].leaf1 = val
+    xpath = "/route-status/route[id={}]/leaf1".format(key)
+    return ExternalChangeClient.make_change(ChangeOp.MODIFIED, xpath, val)
+
+
+def generate_changes(stop_fun, route_data: RouteData, sleep_val=2,
+                     client=None):
     log.info("==>")
     assert len(route_data.routes)
+    if client is None:
+        client = ExternalChangeClient()
 
     while True:
         sleep(sleep_val)
         changed_keys = set()
-        msgs = []
+        changes = []
         # make up to 3 changes
         for c in range(randint(1, 3)):
             n = randint(0, len(route_data.routes) - 1)
@@ -216,36 +272,111 @@ def generate_changes(stop_fun, route_data: RouteData, sleep_val=2):
             changed_keys.add(key)
             val = randint(1, 10)
             log.debug("changing route leaf1 key=%s val=%i", key, val)
-            route_data.routes[key].leaf1 = val
-            op = ChangeOp.MODIFIED.value
-            xpath = "/route-status/route[id={}]/leaf1".format(key)
-            val_str = "{}".format(val)
-            msg = "{}\n{}\n{}".format(op, xpath, val_str)
-            msgs.append(msg)
-        log.debug("msgs=%s", msgs)
-        with socket.socket() as s:
-            try:
-                s.connect(("localhost", EXTERNAL_PORT))
-                log.info("Connected to the change server")
-                msg = ""
-                for m in msgs:
-                    # log.debug("m=%s", m)
-                    msg += m + '\n'
-                # remove last \n
-                msg = msg[:-1]
-                log.info("msg=%s", msg)
-                s.sendall(msg.encode("utf-8"))
-            except Exception:
-                log.info("Cannot connect to the change server!")
+            changes.append(make_leaf1_change(route_data, key, val))
+        log.info("changes=%s", changes)
+        try:
+            client.send(changes)
+        except OSError:
+            log.info("Cannot connect to the change server!")
         if stop_fun():
             break
+    client.close()
 
     log.info("<==")
 
 
-def main():
-    log.info("==>")
-    route_data = RouteData(num=10)
+def generate_load(route_data: RouteData, duration, batch_size=100,
+                  client=None):
+    """
+    Send changes of leaf1 as fast as the change server accepts them
+    for `duration` seconds.
+    :return: sustained rate (changes per second)
+    """
+    log.info("==> duration=%s batch_size=%s", duration, batch_size)
+    assert len(route_data.routes)
+    if client is None:
+        client = ExternalChangeClient()
+    keys = list(route_data.routes)
+    count = 0
+    val = 0
+    start = monotonic()
+    try:
+        while monotonic() - start < duration:
+            changes = []
+            for i in range(batch_size):
+                val += 1
+                key = keys[val % len(keys)]
+                changes.append(make_leaf1_change(route_data, key, val))
+            client.send(changes)
+            count += len(changes)
+    finally:
+        client.close()
+    elapsed = monotonic() - start
+    rate = count / elapsed if elapsed else 0.0
+    log.info("<== changes=%i time=%.2fs rate=%.0f changes/s", count,
+             elapsed, rate)
+    return rate
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description="Route status data provider and external change "
+                    "producer for ConfD gNMI Adapter")
+    parser.add_argument("--port", action="store", dest="port", type=int,
+                        help="port of gNMI Adapter external change server "
+                             "(default is {})".format(EXTERNAL_PORT),
+                        default=EXTERNAL_PORT)
+    parser.add_argument("--routes", action="store", dest="routes", type=int,
+                        help="number of routes (default is {})".format(10),
+                        default=10)
+    parser.add_argument("--load", action="store_true", dest="load",
+                        help="only send changes as fast as possible "
+                             "(without data provider) and report "
+                             "changes/s")
+    parser.add_argument("--load-producers", action="store",
+                        dest="load_producers", type=int,
+                        help="number of concurrent producers (connections) "
+                             "for --load (default is {})".format(1),
+                        default=1)
+    parser.add_argument("--batch-size", action="store", dest="batch_size",
+                        type=int,
+                        help="number of changes in one batch for --load "
+                             "(default is {})".format(100),
+                        default=100)
+    parser.add_argument("--time", action="store", dest="time", type=int,
+                        help="run time in seconds "
+                             "(default is {})".format(RUN_FOR_TIME),
+                        default=RUN_FOR_TIME)
+    return parser.parse_args(args)
+
+
+def run_load(opt):
+    log.info("==> producers=%s", opt.load_producers)
+    rates = [0.0] * opt.load_producers
+
+    def producer(i):
+        route_data = RouteData(num=opt.routes, random=False)
+        client = ExternalChangeClient(port=opt.port)
+        rates[i] = generate_load(route_data, opt.time, opt.batch_size,
+                                 client)
+
+    threads = [threading.Thread(target=producer, args=(i,))
+               for i in range(opt.load_producers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    log.info("<== total rate=%.0f changes/s", sum(rates))
+
+
+def main(args):
+    opt = parse_args(args)
+    log.info("==> opt=%s", opt)
+    if opt.load:
+        run_load(opt)
+        log.info("<==")
+        return
+    route_data = RouteData(num=opt.routes)
     assert len(route_data.routes)
     RouteProvider.init_dp(route_data)
     confd_thread = change_thread = None
@@ -253,13 +384,15 @@ def main():
     try:
         change_thread = threading.Thread(target=generate_changes,
                                          args=(lambda: stop_thread,
-                                               route_data))
+                                               route_data, 2,
+                                               ExternalChangeClient(
+                                                   port=opt.port)))
         log.debug("** starting change_thread")
         change_thread.start()
         confd_thread = threading.Thread(target=RouteProvider.confd_loop)
         confd_thread.start()
         # stop end and after specific time (adjust as you need)
-        sleep(RUN_FOR_TIME)
+        sleep(opt.time)
     except KeyboardInterrupt:
         log.info(" **** Ctrl-C pressed ***")
     except Exception:
@@ -278,4 +411,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
@@ -1,4 +1,3 @@
-import json
 import subprocess
 import threading
 import xml.etree.cElementTree as ET
@@ -8,9 +7,10 @@ import grpc
 import pytest
 
 import gnmi_pb2
+from confd_gnmi_adapter import GnmiServerAdapter, MIN_SAMPLE_INTERVAL
 from confd_gnmi_client import ConfDgNMIClient
 from confd_gnmi_common import make_gnmi_path, get_data_type, \
-    make_formatted_path
+    make_formatted_path, decode_typed_value
 from confd_gnmi_demo_adapter import GnmiDemoServerAdapter
 from confd_gnmi_server import AdapterType, ConfDgNMIServicer
 from utils.utils import log, nodeid_to_path
@@ -19,6 +19,7 @@ from utils.utils import log, nodeid_to_path
 @pytest.mark.grpc
 @pytest.mark.usefixtures("fix_method")
 class GrpcBase(object):
+    aio = False
 
     @pytest.fixture
     def fix_method(self, request):
@@ -27,7 +28,8 @@ class GrpcBase(object):
         nodeid_path = nodeid_to_path(request.node.nodeid)
         log.debug("request.fixturenames=%s", request.fixturenames)
         self.set_adapter_type()
-        self.server = ConfDgNMIServicer.serve(adapter_type=self.adapter_type, insecure=True)
+        self.server = ConfDgNMIServicer.serve(adapter_type=self.adapter_type, insecure=True,
+                                              aio=self.aio)
         self.client = ConfDgNMIClient(insecure=True)
         log.debug("<== fixture method setup")
         yield
@@ -74,8 +76,8 @@ class GrpcBase(object):
     @staticmethod
     def assert_update(update, path_val):
         assert (update.path == path_val[0])
-        json_value = json.loads(update.val.json_ietf_val)
-        assert json_value == path_val[1]
+        value = decode_typed_value(update.val)
+        assert value == path_val[1]
 
     @staticmethod
     def assert_set_response(response, path_op):
@@ -90,7 +92,7 @@ class GrpcBase(object):
 
     @staticmethod
     def assert_one_in_update(updates, pv):
-        assert any(u.path == pv[0] and json.loads(u.val.json_ietf_val) == pv[1]
+        assert any(u.path == pv[0] and decode_typed_value(u.val) == pv[1]
                    for u in updates)
 
     @staticmethod
@@ -101,6 +103,32 @@ class GrpcBase(object):
             GrpcBase.assert_one_in_update(updates, pv)
         log.debug("<==")
 
+    @staticmethod
+    def make_proto_path_value(path_value):
+        """
+        Expected updates for PROTO encoding - container and list values
+        are sent as updates of every leaf (interface list key is `name`).
+        """
+        def leaf_values(path, value):
+            if not isinstance(value, dict):
+                yield path, value
+                return
+            for name, member in value.items():
+                if isinstance(member, list):
+                    for entry in member:
+                        elem = gnmi_pb2.PathElem(name=name,
+                                                 key={"name": entry["name"]})
+                        yield from leaf_values(
+                            gnmi_pb2.Path(elem=list(path.elem) + [elem]),
+                            entry)
+                else:
+                    elem = gnmi_pb2.PathElem(name=name)
+                    yield from leaf_values(
+                        gnmi_pb2.Path(elem=list(path.elem) + [elem]), member)
+
+        return [pv for path, value in path_value
+                for pv in leaf_values(path, value)]
+
     def verify_get_response_updates(self, prefix, paths, path_value,
                                     datatype, encoding, assert_fun=None):
         if assert_fun is None:
@@ -120,7 +148,8 @@ class GrpcBase(object):
                                         subscription_mode=gnmi_pb2.SubscriptionList.ONCE,
                                         poll_interval=0,
                                         poll_count=0, read_count=-1,
-                                        encoding=gnmi_pb2.Encoding.JSON_IETF):
+                                        encoding=gnmi_pb2.Encoding.JSON_IETF,
+                                        sample_interval=0.0):
         if assert_fun is None:
             assert_fun = GrpcBase.assert_updates
         log.debug("paths=%s path_value=%s", paths, path_value)
@@ -164,7 +193,8 @@ class GrpcBase(object):
             ConfDgNMIClient.make_subscription_list(prefix,
                                                    paths,
                                                    subscription_mode,
-                                                   encoding)
+                                                   encoding,
+                                                   sample_interval=sample_interval)
 
         responses = self.client.subscribe(subscription_list,
                                           read_fun=read_fun,
@@ -181,7 +211,8 @@ class GrpcBase(object):
                             subscription_mode=gnmi_pb2.SubscriptionList.ONCE,
                             poll_interval=0,
                             poll_count=0, read_count=-1,
-                            encoding = gnmi_pb2.Encoding.JSON_IETF):
+                            encoding = gnmi_pb2.Encoding.JSON_IETF,
+                            sample_interval=0.0):
 
         kwargs = {"assert_fun": GrpcBase.assert_updates}
         if_state_str = prefix_state_str = ""
@@ -212,9 +243,18 @@ class GrpcBase(object):
             kwargs["poll_interval"] = poll_interval
             kwargs["poll_count"] = poll_count
             kwargs["read_count"] = read_count
+            kwargs["sample_interval"] = sample_interval
         else:
             verify_response_updates = self.verify_get_response_updates
             kwargs["datatype"] = datatype
+        if encoding == gnmi_pb2.Encoding.PROTO:
+            verify_updates = verify_response_updates
+
+            def verify_response_updates(**kwargs):
+                kwargs["path_value"] = self.make_proto_path_value(
+                    kwargs["path_value"])
+                kwargs["assert_fun"] = GrpcBase.assert_in_updates
+                verify_updates(**kwargs)
 
         kwargs["encoding"] = encoding
         kwargs["paths"] = [leaf_paths[0]]
@@ -305,6 +345,21 @@ class GrpcBase(object):
                                  poll_interval=poll_args[0],
                                  poll_count=poll_args[1])
 
+    @pytest.mark.parametrize("data_type", ["CONFIG", "STATE"])
+    def test_subscribe_stream_sample(self, request, data_type):
+        log.info("testing subscribe_stream_sample")
+        GnmiServerAdapter.SubscriptionHandler.set_min_sample_interval(0.01)
+        try:
+            # initial sample and 2 sampled responses
+            self._test_get_subscribe(is_subscribe=True,
+                                     datatype=get_data_type(data_type),
+                                     subscription_mode=gnmi_pb2.SubscriptionList.STREAM,
+                                     sample_interval=0.1,
+                                     read_count=3)
+        finally:
+            GnmiServerAdapter.SubscriptionHandler.set_min_sample_interval(
+                MIN_SAMPLE_INTERVAL)
+
     def _send_change_list_to_confd_thread(self, prefix_str, changes_list):
         log.info("==>")
         log.debug("prefix_str=%s change_list=%s", prefix_str, changes_list)
@@ -473,6 +528,42 @@ class GrpcBase(object):
         GrpcBase.assert_set_response(response.response[0],
                                      (paths[0], gnmi_pb2.UpdateResult.UPDATE))
 
+    def test_set_replace(self, request):
+        log.info("testing set replace")
+        if_id = 8
+        prefix = make_gnmi_path("/ietf-interfaces:interfaces")
+        paths = [GrpcBase.mk_gnmi_if_path(self.leaf_paths_str[1], "", if_id)]
+        replace = [gnmi_pb2.Update(path=paths[0], val=gnmi_pb2.TypedValue(
+            json_ietf_val=b"\"iana-if-type:fastEther\""))]
+        update = [gnmi_pb2.Update(path=paths[0], val=gnmi_pb2.TypedValue(
+            json_ietf_val=b"\"iana-if-type:gigabitEthernet\""))]
+        set_request = gnmi_pb2.SetRequest(prefix=prefix, replace=replace)
+        response = self.client.stub.Set(set_request,
+                                        metadata=self.client.metadata)
+        assert (response.prefix == prefix)
+        GrpcBase.assert_set_response(response.response[0],
+                                     (paths[0], gnmi_pb2.UpdateResult.REPLACE))
+
+        datatype = gnmi_pb2.GetRequest.DataType.CONFIG
+        encoding = gnmi_pb2.Encoding.JSON_IETF
+        notification = self.client.get(prefix, paths, datatype, encoding)
+        for n in notification:
+            GrpcBase.assert_updates(n.update, [(paths[0], "iana-if-type:fastEther")])
+
+        # replace and update in one request - update is applied last
+        set_request = gnmi_pb2.SetRequest(prefix=prefix, replace=replace,
+                                          update=update)
+        response = self.client.stub.Set(set_request,
+                                        metadata=self.client.metadata)
+        assert len(response.response) == 2
+        GrpcBase.assert_set_response(response.response[0],
+                                     (paths[0], gnmi_pb2.UpdateResult.REPLACE))
+        GrpcBase.assert_set_response(response.response[1],
+                                     (paths[0], gnmi_pb2.UpdateResult.UPDATE))
+        notification = self.client.get(prefix, paths, datatype, encoding)
+        for n in notification:
+            GrpcBase.assert_updates(n.update, [(paths[0], "iana-if-type:gigabitEthernet")])
+
     def test_set_encoding(self, request):
         log.info("testing set_encoding")
         if_id = 8
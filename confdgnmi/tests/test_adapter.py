@@ -0,0 +1,688 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import grpc
+import pytest
+
+import gnmi_pb2
+from confd_gnmi_adapter import AdapterPool, ChangeBuffer, OVERFLOW_POLICIES, \
+    OVERFLOW_DROP_OLDEST, OVERFLOW_RESYNC, OVERFLOW_DISCONNECT, \
+    GnmiServerAdapter, BATCH_MAX_LATENCY, BATCH_MAX_SIZE, \
+    MIN_SAMPLE_INTERVAL, SampleScheduler, \
+    MAX_NOTIFICATION_UPDATES, MAX_NOTIFICATION_BYTES
+from confd_gnmi_common import make_gnmi_path
+from confd_gnmi_demo_adapter import GnmiDemoServerAdapter
+from confd_gnmi_demo_adapter_store import DemoList, DemoStore
+from confd_gnmi_server import AdapterType, ConfDgNMIServicer
+
+
+class PooledAdapter(GnmiDemoServerAdapter):
+
+    def __init__(self, healthy=True):
+        super().__init__()
+        self.healthy = healthy
+        self.closed = False
+
+    def is_healthy(self):
+        return self.healthy
+
+    def close(self):
+        self.closed = True
+
+
+def pool_get(pool, username, address="", password=""):
+    adapter = pool.get(username, address, password, PooledAdapter)
+    pool.release(adapter)
+    return adapter
+
+
+@pytest.mark.unit
+def test_adapter_pool_reuse():
+    pool = AdapterPool(max_size=10, idle_timeout=100)
+    a1 = pool_get(pool, "admin", "127.0.0.1", "admin")
+    assert pool_get(pool, "admin", "127.0.0.1", "admin") is a1
+    a2 = pool_get(pool, "oper", "127.0.0.1", "oper")
+    a3 = pool_get(pool, "admin", "10.0.0.1", "admin")
+    assert len({id(a1), id(a2), id(a3)}) == 3
+    assert len(pool) == 3
+    # different password - adapter is replaced
+    a4 = pool_get(pool, "admin", "127.0.0.1", "other")
+    assert a4 is not a1 and a1.closed
+
+
+@pytest.mark.unit
+def test_adapter_pool_eviction():
+    pool = AdapterPool(max_size=2, idle_timeout=100)
+    a1 = pool_get(pool, "u1")
+    a2 = pool_get(pool, "u2")
+    pool_get(pool, "u1")
+    pool_get(pool, "u3")
+    assert len(pool) == 2
+    # u2 is least recently used
+    assert a2.closed and not a1.closed
+    a1.healthy = False
+    assert pool_get(pool, "u1") is not a1
+    assert a1.closed
+    pool.idle_timeout = 0
+    a5 = pool_get(pool, "u5")
+    assert len(pool) == 1
+    pool.clear()
+    assert a5.closed and len(pool) == 0
+
+
+@pytest.mark.unit
+def test_adapter_pool_leased_subscription():
+    pool = AdapterPool(max_size=1, idle_timeout=100)
+    # adapter is leased for the whole subscription
+    adapter = pool.get("u1", "", "", PooledAdapter)
+    subscription = gnmi_pb2.SubscriptionList(
+        mode=gnmi_pb2.SubscriptionList.STREAM,
+        subscription=[gnmi_pb2.Subscription(
+            path=make_gnmi_path("/interfaces/interface"),
+            mode=gnmi_pb2.SubscriptionMode.ON_CHANGE)])
+    handler = adapter.get_subscription_handler(subscription)
+    responses = handler.read()
+    assert next(responses).update.update
+    assert next(responses).sync_response
+    # other RPCs of the same client reuse the adapter
+    assert pool_get(pool, "u1") is adapter
+    # idle and LRU eviction do not close adapter with live subscription
+    pool.idle_timeout = 0
+    pool_get(pool, "u2")
+    assert len(pool) == 1 and not adapter.closed
+    handler.stop()
+    assert next(responses, None) is None
+    pool.release(adapter)
+    assert adapter.closed
+    # adapters not got from the pool are ignored
+    pool.release(PooledAdapter())
+
+
+@pytest.mark.unit
+def test_adapter_pool_factory_unlocked():
+    pool = AdapterPool(max_size=10, idle_timeout=100)
+    factory_started = threading.Event()
+    factory_continue = threading.Event()
+
+    def slow_factory():
+        factory_started.set()
+        factory_continue.wait(5)
+        return PooledAdapter()
+
+    thread = threading.Thread(
+        target=lambda: pool.get("slow", "", "", slow_factory))
+    thread.start()
+    assert factory_started.wait(5)
+    # slow connect of one client does not block other clients
+    assert pool_get(pool, "fast") is not None
+    assert thread.is_alive()
+    factory_continue.set()
+    thread.join()
+    assert len(pool) == 2
+
+
+@pytest.mark.unit
+def test_change_buffer_coalesce():
+    buffer = ChangeBuffer(max_size=10)
+    buffer.add(("if", "eth0", "type"), "fast")
+    buffer.add(("if", "eth1", "type"), "fast")
+    buffer.add(("if", "eth0", "type"), "gigabit")
+    assert buffer.mark_pending()
+    assert not buffer.mark_pending()
+    assert buffer.drain() == (["fast", "gigabit"], False)
+    assert buffer.coalesced == 1
+    assert not buffer.pending and len(buffer) == 0
+    # delete supersedes changes of the deleted node and its descendants
+    buffer.add(("if", "eth0", "type"), "fast")
+    buffer.add(("if", "eth0", "mtu"), "1500")
+    buffer.add(("if", "eth1", "type"), "fast")
+    buffer.add(("if", "eth0"), "del eth0", delete=True)
+    assert buffer.drain() == (["fast", "del eth0"], False)
+    assert buffer.coalesced == 3
+    assert buffer.dropped == 0
+
+
+@pytest.mark.unit
+def test_change_buffer_index():
+    # compare with coalescing done by scanning all buffered keys
+    rnd = random.Random(0)
+    buffer = ChangeBuffer(max_size=50, overflow_policy=OVERFLOW_DROP_OLDEST)
+    expected = OrderedDict()
+    for i in range(5000):
+        key = tuple(rnd.choice("ab") for _ in range(rnd.randint(0, 4)))
+        delete = rnd.random() < 0.2
+        buffer.add(key, i, delete)
+        if delete:
+            for k in [k for k in expected if k[:len(key)] == key]:
+                del expected[k]
+        else:
+            expected.pop(key, None)
+        expected[key] = i
+        if len(expected) > 50:
+            expected.popitem(last=False)
+        if i % 500 == 0:
+            assert buffer.drain() == (list(expected.values()), False)
+            expected.clear()
+            assert buffer._index == {}
+    assert buffer.drain() == (list(expected.values()), False)
+
+
+@pytest.mark.unit
+def test_change_buffer_deletes():
+    size = 50000
+    buffer = ChangeBuffer(max_size=size)
+    for i in range(size):
+        buffer.add(("if", f"eth{i}", "type"), i)
+    start = time.monotonic()
+    # delete does not scan whole buffer
+    for i in range(size):
+        buffer.add(("if", f"eth{i}"), -i, delete=True)
+    assert time.monotonic() - start < 5
+    assert len(buffer) == size and buffer.coalesced == size
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("policy", OVERFLOW_POLICIES)
+def test_change_buffer_overflow(policy):
+    buffer = ChangeBuffer(max_size=2, overflow_policy=policy)
+    for i in range(4):
+        buffer.add(("if", f"eth{i}"), i)
+    changes, resync = buffer.drain()
+    if policy == OVERFLOW_DROP_OLDEST:
+        assert (changes, resync) == ([2, 3], False)
+        assert buffer.dropped == 2
+    elif policy == OVERFLOW_RESYNC:
+        assert (changes, resync) == ([], True)
+        assert buffer.dropped == 4 and buffer.resyncs == 1
+        # changes are buffered again after drain
+        buffer.add(("if", "eth0"), 0)
+        assert buffer.drain() == ([0], False)
+    else:
+        assert changes == [] and buffer.overflowed
+        assert buffer.dropped == 4
+    assert buffer.coalesced == 0
+
+
+class ChangeHandler(GnmiServerAdapter.SubscriptionHandler):
+    """
+    STREAM subscription handler with changes added by test
+    (change is leaf name).
+    """
+
+    def __init__(self):
+        super().__init__(None, gnmi_pb2.SubscriptionList(
+            mode=gnmi_pb2.SubscriptionList.STREAM))
+
+    def get_sample(self, path, prefix):
+        return []
+
+    def add_path_for_monitoring(self, path, prefix):
+        pass
+
+    def get_monitored_changes(self, changes):
+        return [gnmi_pb2.Update(path=make_gnmi_path(name)) for name in changes]
+
+    def start_monitoring(self):
+        pass
+
+    def stop_monitoring(self):
+        pass
+
+    def add_changes(self, names):
+        for name in names:
+            self.change_buffer.add((name,), name)
+        self.notify_changes()
+
+
+@pytest.mark.unit
+def test_change_buffer_disconnect():
+    handler = ChangeHandler()
+    handler.change_buffer = ChangeBuffer(max_size=2,
+                                         overflow_policy=OVERFLOW_DISCONNECT)
+    reader = handler.read()
+    next(reader)  # sample
+    next(reader)  # sync_response
+    handler.add_changes(["a", "b", "c"])
+    assert list(reader) == []
+    assert handler.is_overflowed()
+    assert handler.counters() == {"buffered": 0, "coalesced": 0,
+                                  "dropped": 3, "resyncs": 0,
+                                  "overflowed": True}
+
+
+@pytest.mark.unit
+def test_subscribe_overflow_status():
+    class Context:
+        code = details = None
+        metadata = ()
+
+        def add_callback(self, callback):
+            pass
+
+        def set_code(self, code):
+            self.code = code
+
+        def set_details(self, details):
+            self.details = details
+
+        def set_trailing_metadata(self, metadata):
+            self.metadata = metadata
+
+    class Adapter:
+        def encodings(self):
+            return [gnmi_pb2.Encoding.JSON_IETF]
+
+        def get_subscription_handler(self, subscription_list):
+            return handler
+
+    handler = ChangeHandler()
+    handler.change_buffer = ChangeBuffer(max_size=1,
+                                         overflow_policy=OVERFLOW_DISCONNECT)
+    adapter = Adapter()
+    servicer = ConfDgNMIServicer(AdapterType.DEMO)
+    servicer.get_connected_adapter = lambda context: adapter
+    requests_done = threading.Event()
+
+    def requests():
+        yield gnmi_pb2.SubscribeRequest(subscribe=gnmi_pb2.SubscriptionList(
+            mode=gnmi_pb2.SubscriptionList.STREAM,
+            encoding=gnmi_pb2.Encoding.JSON_IETF))
+        # stream of requests ends with the RPC
+        requests_done.wait(5)
+
+    context = Context()
+    responses = servicer.Subscribe(requests(), context)
+    next(responses)  # sample
+    next(responses)  # sync_response
+    handler.add_changes(["a", "b"])
+    assert list(responses) == []
+    requests_done.set()
+    assert context.code == grpc.StatusCode.RESOURCE_EXHAUSTED
+    assert ("change-buffer-dropped", "2") in context.metadata
+
+
+@pytest.fixture
+def batch_window():
+    def set_window(latency, size):
+        GnmiServerAdapter.SubscriptionHandler.set_batch_max_latency(latency)
+        GnmiServerAdapter.SubscriptionHandler.set_batch_max_size(size)
+    yield set_window
+    set_window(BATCH_MAX_LATENCY, BATCH_MAX_SIZE)
+
+
+def read_changes(reader):
+    response = next(reader)
+    return [u.path.elem[0].name for u in response.update.update]
+
+
+@pytest.mark.unit
+def test_batch_window_latency(batch_window):
+    batch_window(0.5, 100)
+    handler = ChangeHandler()
+    reader = handler.read()
+    next(reader)  # sample
+    next(reader)  # sync_response
+    handler.add_changes(["a", "b"])
+    timer = threading.Timer(0.1, handler.add_changes, [["c", "a"]])
+    timer.start()
+    start = time.monotonic()
+    assert read_changes(reader) == ["b", "c", "a"]
+    assert time.monotonic() - start >= 0.4
+    timer.join()
+    handler.stop()
+    assert list(reader) == []
+
+
+@pytest.mark.unit
+def test_batch_window_size(batch_window):
+    batch_window(30.0, 3)
+    handler = ChangeHandler()
+    reader = handler.read()
+    next(reader)
+    next(reader)
+    handler.add_changes(["a"])
+    timer = threading.Timer(0.1, handler.add_changes, [["b", "c"]])
+    timer.start()
+    start = time.monotonic()
+    assert read_changes(reader) == ["a", "b", "c"]
+    assert time.monotonic() - start < 10
+    timer.join()
+    # stop is processed even in batching window
+    handler.add_changes(["d"])
+    handler.stop()
+    assert read_changes(reader) == ["d"]
+    assert list(reader) == []
+
+
+class SampleHandler(ChangeHandler):
+    """
+    STREAM subscription handler with SAMPLE subscriptions,
+    sample of path is update of the path.
+    """
+
+    def __init__(self, reads, paths, interval,
+                 encoding=gnmi_pb2.Encoding.JSON):
+        GnmiServerAdapter.SubscriptionHandler.__init__(
+            self, None, gnmi_pb2.SubscriptionList(
+                mode=gnmi_pb2.SubscriptionList.STREAM,
+                encoding=encoding,
+                subscription=[gnmi_pb2.Subscription(
+                    path=make_gnmi_path(p),
+                    mode=gnmi_pb2.SubscriptionMode.SAMPLE,
+                    sample_interval=int(interval * 1e9)) for p in paths]))
+        self.reads = reads
+
+    def get_sample(self, path, prefix):
+        self.reads.append(path.elem[0].name)
+        return [gnmi_pb2.Update(path=path)]
+
+
+@pytest.fixture
+def min_sample_interval():
+    GnmiServerAdapter.SubscriptionHandler.set_min_sample_interval(0.01)
+    yield
+    GnmiServerAdapter.SubscriptionHandler.set_min_sample_interval(
+        MIN_SAMPLE_INTERVAL)
+
+
+@pytest.mark.unit
+def test_sample_subscription(min_sample_interval):
+    reads = []
+    handlers = [SampleHandler(reads, ["a"], 0.2),
+                SampleHandler(reads, ["a"], 0.2),
+                SampleHandler(reads, ["a"], 0.5)]
+    readers = [h.read() for h in handlers]
+    for reader in readers:
+        next(reader)  # initial sample
+        next(reader)  # sync_response
+    scheduler = SampleScheduler.get_scheduler()
+    assert len(scheduler) == 2
+    del reads[:]
+    assert read_changes(readers[0]) == ["a"]
+    assert read_changes(readers[1]) == ["a"]
+    # "a" is read once for both subscriptions with the same interval
+    assert reads == ["a"]
+    assert read_changes(readers[2]) == ["a"]
+    for handler, reader in zip(handlers, readers):
+        handler.stop()
+        # due samples may be waiting before FINISH
+        for response in reader:
+            assert response.update.update
+    assert len(scheduler) == 0
+
+
+class EncodingSampleHandler(SampleHandler):
+    """ Sample value is name of subscription encoding. """
+
+    def get_sample(self, path, prefix):
+        self.reads.append(path.elem[0].name)
+        encoding = gnmi_pb2.Encoding.Name(self.subscription_list.encoding)
+        return [gnmi_pb2.Update(path=path, val=gnmi_pb2.TypedValue(
+            string_val=encoding))]
+
+
+@pytest.mark.unit
+def test_sample_subscription_encodings(min_sample_interval):
+    reads = []
+    handlers = [EncodingSampleHandler(reads, ["a"], 0.2, encoding)
+                for encoding in (gnmi_pb2.Encoding.JSON_IETF,
+                                 gnmi_pb2.Encoding.PROTO)]
+    readers = [h.read() for h in handlers]
+    for reader in readers:
+        next(reader)  # initial sample
+        next(reader)  # sync_response
+    # subscriptions with different encodings do not share samples
+    assert len(SampleScheduler.get_scheduler()) == 2
+    for encoding, reader in zip(["JSON_IETF", "PROTO"], readers):
+        [update] = next(reader).update.update
+        assert update.val.string_val == encoding
+    for handler, reader in zip(handlers, readers):
+        handler.stop()
+        for _response in reader:
+            pass
+
+
+@pytest.mark.unit
+def test_sample_scheduler_intervals():
+    scheduler = SampleScheduler()
+
+    class Listener:
+        def __init__(self):
+            self.ticks = 0
+
+        def sample_due(self, groups):
+            self.ticks += len(groups)
+
+    fast, slow = Listener(), Listener()
+    fast_group = scheduler.subscribe(fast, "a", 0.05)
+    slow_group = scheduler.subscribe(slow, "a", 0.5)
+    time.sleep(1.1)
+    scheduler.unsubscribe(fast, fast_group)
+    scheduler.unsubscribe(slow, slow_group)
+    # first tick is aligned to multiple of interval
+    assert fast.ticks >= 10 and 2 <= slow.ticks <= 3
+
+
+@pytest.mark.unit
+def test_sample_group_slow_read():
+    scheduler = SampleScheduler()
+
+    class Listener:
+        def __init__(self):
+            self.ticks = 0
+
+        def sample_due(self, groups):
+            self.ticks += len(groups)
+
+    slow, other, fast = Listener(), Listener(), Listener()
+    # long interval - both reads are reads of the same tick
+    group = scheduler.subscribe(slow, "slow", 100)
+    scheduler.subscribe(other, "slow", 100)
+    read_started = threading.Event()
+    read_continue = threading.Event()
+    reads = []
+
+    def slow_read():
+        reads.append(1)
+        read_started.set()
+        read_continue.wait(5)
+        return ["sample"]
+
+    samples = []
+    threads = [threading.Thread(
+        target=lambda: samples.append(group.read(slow_read)))
+        for _ in range(2)]
+    threads[0].start()
+    assert read_started.wait(5)
+    threads[1].start()
+    # slow read does not block other groups nor subscribe
+    fast_group = scheduler.subscribe(fast, "fast", 0.05)
+    time.sleep(0.5)
+    assert fast.ticks >= 5
+    read_continue.set()
+    for thread in threads:
+        thread.join()
+    # the second reader waits for the sample of the first one
+    assert samples == [["sample"], ["sample"]] and reads == [1]
+    scheduler.unsubscribe(fast, fast_group)
+    scheduler.unsubscribe(slow, group)
+    scheduler.unsubscribe(other, group)
+
+
+class ValueSampleHandler(SampleHandler):
+    """
+    Sample handler with one subscription (with `suppress_redundant`),
+    sample contains all `values`.
+    """
+
+    def __init__(self, values, interval, heartbeat_interval=0.0):
+        super().__init__([], ["root"], interval)
+        s = self.subscription_list.subscription[0]
+        s.suppress_redundant = True
+        s.heartbeat_interval = int(heartbeat_interval * 1e9)
+        self.values = values
+
+    def get_sample(self, path, prefix):
+        return [gnmi_pb2.Update(path=make_gnmi_path(name),
+                                val=gnmi_pb2.TypedValue(int_val=val))
+                for name, val in self.values.items()]
+
+
+@pytest.mark.unit
+def test_suppress_redundant(min_sample_interval):
+    values = {"a": 1, "b": 1}
+    handler = ValueSampleHandler(values, 0.1)
+    reader = handler.read()
+    assert len(next(reader).update.update) == 2
+    next(reader)  # sync_response
+    values["b"] = 2
+    response = next(reader)
+    assert [u.path.elem[0].name for u in response.update.update] == ["b"]
+    del values["a"]
+    response = next(reader)
+    assert len(response.update.update) == 0
+    assert [p.elem[0].name for p in response.update.delete] == ["a"]
+    handler.stop()
+    assert list(reader) == []
+
+
+@pytest.mark.unit
+def test_heartbeat_interval(min_sample_interval):
+    handler = ValueSampleHandler({"a": 1}, 0.1, heartbeat_interval=0.5)
+    reader = handler.read()
+    next(reader)
+    next(reader)
+    start = time.monotonic()
+    assert read_changes(reader) == ["a"]
+    assert 0.3 < time.monotonic() - start < 0.8
+    handler.stop()
+    list(reader)
+
+
+class PollHandler(ValueSampleHandler):
+    """
+    POLL subscription handler with `updates_only`.
+    """
+
+    def __init__(self, values):
+        super().__init__(values, 0)
+        self.subscription_list.mode = gnmi_pb2.SubscriptionList.POLL
+        self.subscription_list.updates_only = True
+
+
+@pytest.mark.unit
+def test_poll_updates_only():
+    values = {"a": 1, "b": 1}
+    handler = PollHandler(values)
+    reader = handler.read()
+    # initial state is not sent
+    assert next(reader).sync_response
+    handler.poll()
+    response = next(reader)
+    assert len(response.update.update) == 0
+    assert len(response.update.delete) == 0
+    values["b"] = 2
+    values["c"] = 1
+    del values["a"]
+    handler.poll()
+    response = next(reader)
+    assert [u.path.elem[0].name for u in response.update.update] == ["b", "c"]
+    assert [p.elem[0].name for p in response.update.delete] == ["a"]
+    assert len(handler.snapshots[0]) == 2
+    handler.stop()
+    assert list(reader) == []
+
+
+@pytest.fixture
+def max_notification():
+    def set_max(count, size):
+        GnmiServerAdapter.SubscriptionHandler.set_max_notification_updates(
+            count)
+        GnmiServerAdapter.SubscriptionHandler.set_max_notification_bytes(size)
+    yield set_max
+    set_max(MAX_NOTIFICATION_UPDATES, MAX_NOTIFICATION_BYTES)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("count, size_updates, expected", [
+    (0, 0, [10]),
+    (4, 0, [4, 4, 2]),
+    (0, 3, [3, 3, 3, 1]),
+    (2, 3, [2, 2, 2, 2, 2]),
+    (1, 1, [1] * 10),
+])
+def test_sample_split(max_notification, count, size_updates, expected):
+    values = {f"leaf_{i}": i for i in range(10)}
+    # all updates have the same size
+    update_size = gnmi_pb2.Update(
+        path=make_gnmi_path("leaf_0"),
+        val=gnmi_pb2.TypedValue(int_val=0)).ByteSize()
+    max_notification(count, size_updates * update_size)
+    handler = ValueSampleHandler(values, 0)
+    handler.subscription_list.mode = gnmi_pb2.SubscriptionList.POLL
+    reader = handler.read()
+    responses = []
+    response = next(reader)
+    while not response.sync_response:
+        responses.append(response)
+        response = next(reader)
+    assert [len(r.update.update) for r in responses] == expected
+    names = [u.path.elem[0].name for r in responses for u in r.update.update]
+    assert names == list(values)
+    handler.stop()
+    assert list(reader) == []
+
+
+@pytest.mark.unit
+def test_demo_store():
+    store = DemoStore()
+    for i in range(3):
+        store[f"/interfaces/interface[name=eth{i}/1]/name"] = f"eth{i}/1"
+        store[f"/interfaces/interface[name=eth{i}/1]/type"] = "fastEther"
+    assert len(store) == 6
+    assert store["/interfaces/interface[name=eth1/1]/type"] == "fastEther"
+    assert "/interfaces/interface[name=eth5/1]/type" not in store
+    assert "/interfaces/interface[name=eth1/1]" not in store
+    assert list(store)[:2] == ["/interfaces/interface[name=eth0/1]/name",
+                               "/interfaces/interface[name=eth0/1]/type"]
+    assert isinstance(store.get_node("/interfaces/interface"), DemoList)
+    assert store.get_node("/interfaces/interface/name") is None
+    assert list(store.leaves("/interfaces/interface[name=eth2/1]")) == [
+        ("/interfaces/interface[name=eth2/1]/name", "eth2/1"),
+        ("/interfaces/interface[name=eth2/1]/type", "fastEther")]
+    assert DemoStore.to_json(store.get_node("/interfaces")) == {
+        "interface": [{"name": f"eth{i}/1", "type": "fastEther"}
+                      for i in range(3)]}
+    store["/interfaces/interface[name=eth1/1]/type"] = "gigabitEthernet"
+    del store["/interfaces/interface[name=eth0/1]/type"]
+    assert len(store) == 5
+    assert store.get_node("/interfaces/interface[name=eth1/1]") == {
+        "name": "eth1/1", "type": "gigabitEthernet"}
+    with pytest.raises(KeyError):
+        store["/interfaces/interface/name"] = "x"
+
+
+@pytest.mark.unit
+def test_demo_adapter_large_get():
+    adapter = GnmiDemoServerAdapter.__new__(GnmiDemoServerAdapter)
+    adapter.demo_db = DemoStore()
+    count = 100000
+    for i in range(count):
+        adapter.demo_db[f"/interfaces/interface[name=if_{i}]/name"] = f"if_{i}"
+        adapter.demo_db[f"/interfaces/interface[name=if_{i}]/type"] = \
+            "gigabitEthernet"
+    prefix = make_gnmi_path("/ietf-interfaces:interfaces")
+    path = make_gnmi_path("interface[name=if_77777]/type")
+    start = time.monotonic()
+    for _ in range(100):
+        updates = adapter.get_db_updates_for_path(path, prefix,
+                                                  adapter.demo_db)
+    assert time.monotonic() - start < 1.0
+    assert len(updates) == 1
+    assert updates[0].val.json_ietf_val == \
+        b'"iana-if-type:gigabitEthernet"'
+    updates = adapter.get_db_updates_for_path(make_gnmi_path("interface"),
+                                              prefix, adapter.demo_db)
+    assert len(updates) == count
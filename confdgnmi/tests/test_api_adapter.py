@@ -0,0 +1,383 @@
+import dataclasses
+import json
+import socket
+import threading
+
+import pytest
+
+import gnmi_pb2
+from confd_gnmi_adapter import GnmiServerAdapter, MAX_NOTIFICATION_BYTES
+from confd_gnmi_api_adapter import GnmiConfDApiServerAdapter
+from confd_gnmi_api_adapter_changes import ChangeDecoder, ChangeReactor, \
+    CdbSubscriptionHub, ExternalChangeServer
+from confd_gnmi_api_adapter_defaults import ApiAdapterDefaults
+from confd_gnmi_api_adapter_schema import SchemaSnapshot
+from confd_gnmi_common import make_gnmi_path, make_xpath_path, \
+    add_path_prefix, decode_typed_value
+
+IF_PATH = "/if:interfaces/interface{{{}}}"
+IF_TYPE = "ianaift:gigabitEthernet"
+
+
+@pytest.mark.confd
+class TestApiAdapter:
+
+    @pytest.fixture
+    def snapshot_path(self, tmp_path):
+        path = str(tmp_path / "schema.json")
+        GnmiConfDApiServerAdapter.set_schema_snapshot_path(path)
+        GnmiConfDApiServerAdapter._schema_snapshot = None
+        yield path
+        GnmiConfDApiServerAdapter.set_schema_snapshot_path(
+            ApiAdapterDefaults.SCHEMA_SNAPSHOT)
+        GnmiConfDApiServerAdapter._schema_snapshot = None
+
+    @staticmethod
+    def connect_adapter():
+        adapter = GnmiConfDApiServerAdapter.get_adapter()
+        adapter.connect()
+        return adapter
+
+    def test_schema_snapshot(self, snapshot_path):
+        adapter = self.connect_adapter()
+        try:
+            capabilities = adapter.capabilities()
+        finally:
+            adapter.close()
+        snapshot = SchemaSnapshot.load(snapshot_path)
+        assert snapshot is not None
+        assert snapshot.module_set_id != ""
+        assert len(snapshot.modules) == len(capabilities)
+        assert "ietf-interfaces" in [module[-1]
+                                     for module in snapshot.namespaces]
+
+        # next start uses snapshot from the file
+        GnmiConfDApiServerAdapter._schema_snapshot = None
+        adapter = self.connect_adapter()
+        try:
+            assert adapter.schema_snapshot == snapshot
+            assert adapter.capabilities() == capabilities
+            assert adapter.pfx_to_module["if"] == "ietf-interfaces"
+        finally:
+            adapter.close()
+
+    def test_shared_session_pool(self):
+        adapter1 = self.connect_adapter()
+        adapter2 = self.connect_adapter()
+        try:
+            assert adapter1.sessions is adapter2.sessions
+            adapter1.close()
+            # pool stays open for other adapters of the user
+            assert not adapter2.sessions.closed
+            assert adapter2.is_healthy()
+            assert adapter2.capabilities_version() is not None
+        finally:
+            adapter1.close()
+            sessions = adapter2.sessions
+            adapter2.close()
+        assert sessions.closed
+
+    def test_schema_snapshot_update(self):
+        adapter = self.connect_adapter()
+        decoder = ChangeDecoder(adapter)
+        path = make_gnmi_path("/ietf-interfaces:interfaces/interface")
+        try:
+            decoder.check_schema()
+            decoder.modified_nodes["cached"] = None
+            old_schema = adapter.schema
+            # snapshot updated (schemas reloaded) e.g. by other adapter
+            GnmiConfDApiServerAdapter._schema_snapshot = dataclasses.replace(
+                adapter.schema_snapshot)
+            assert adapter.get_schema_node(path) is not None
+            assert adapter.schema_snapshot is \
+                GnmiConfDApiServerAdapter._schema_snapshot
+            assert adapter.schema is not old_schema
+            decoder.check_schema()
+            assert decoder.modified_nodes == {}
+        finally:
+            adapter.close()
+
+    def test_reactor_callback_error(self):
+        reactor = ChangeReactor("test_change_reactor")
+        done = threading.Event()
+        reactor.call_soon(lambda: 1 / 0)
+        reactor.call_soon(done.set)
+        try:
+            # reactor thread survives failed callback
+            assert done.wait(5)
+        finally:
+            reactor.stop()
+
+    def test_external_change_server_resubscribe(self):
+        port = ApiAdapterDefaults.EXTERNAL_PORT + 1
+        server = ExternalChangeServer(port, ChangeReactor.get_reactor(
+            ChangeReactor.EXTERNAL))
+        adapter = GnmiConfDApiServerAdapter.get_adapter()
+        listener1, listener2 = object(), object()
+        server.subscribe(adapter, listener1, 0, None, None)
+        server.unsubscribe(listener1)
+        # immediate resubscribe keeps (does not rebind) the server socket
+        server.subscribe(adapter, listener2, 0, None, None)
+        try:
+            socket.create_connection(("localhost", port)).close()
+        finally:
+            server.unsubscribe(listener2)
+        # changes are decoded with process wide schema adapter
+        assert server.adapter is GnmiConfDApiServerAdapter.get_schema_adapter()
+
+
+class InterfaceTestBase:
+    """ Tests using interface created for every test. """
+    IF_NAME = "gnmi_test_if"
+
+    @pytest.fixture
+    def adapter(self):
+        adapter = GnmiConfDApiServerAdapter.get_adapter()
+        adapter.connect()
+        with adapter.sessions.write_trans() as t:
+            path = IF_PATH.format(self.IF_NAME)
+            t.create(path)
+            t.set_elem(IF_TYPE, f"{path}/type")
+            t.apply()
+        yield adapter
+        with adapter.sessions.write_trans() as t:
+            if t.exists(IF_PATH.format(self.IF_NAME)):
+                t.delete(IF_PATH.format(self.IF_NAME))
+                t.apply()
+        adapter.close()
+
+
+@pytest.mark.confd
+class TestApiAdapterDefaults(InterfaceTestBase):
+    """
+    Default values are returned for every read method (get_elem, get_values,
+    save_config).
+    """
+
+    @pytest.mark.parametrize("path_str, value", [
+        ("interface[name={}]/enabled", True),
+        ("interface[name={}]", {"name": InterfaceTestBase.IF_NAME,
+                                "type": "iana-if-type:gigabitEthernet",
+                                "enabled": True}),
+    ])
+    def test_get_default(self, adapter, path_str, value):
+        prefix = make_gnmi_path("/ietf-interfaces:interfaces")
+        path = make_gnmi_path(path_str.format(self.IF_NAME))
+        [notification] = adapter.get(
+            prefix, [path], gnmi_pb2.GetRequest.DataType.CONFIG, [])
+        [update] = notification.update
+        assert decode_typed_value(update.val) == value
+
+    def test_get_default_save_config(self, adapter):
+        prefix = make_gnmi_path("/ietf-interfaces:interfaces")
+        [notification] = adapter.get(
+            prefix, [make_gnmi_path("interface")],
+            gnmi_pb2.GetRequest.DataType.CONFIG, [])
+        values = [decode_typed_value(u.val) for u in notification.update]
+        [value] = [v for v in values if v.get("name") == self.IF_NAME]
+        assert value["enabled"] is True
+
+
+@pytest.mark.confd
+class TestApiAdapterSubscribe(InterfaceTestBase):
+    """
+    ON_CHANGE subscriptions of leaves and list entries (changes are read
+    relative to the nearest container and filtered).
+    """
+
+    @staticmethod
+    def subscribe(adapter, path_str):
+        subscription_list = gnmi_pb2.SubscriptionList(
+            mode=gnmi_pb2.SubscriptionList.STREAM,
+            encoding=gnmi_pb2.Encoding.JSON_IETF,
+            subscription=[gnmi_pb2.Subscription(
+                path=make_gnmi_path(path_str),
+                mode=gnmi_pb2.SubscriptionMode.ON_CHANGE)])
+        handler = adapter.get_subscription_handler(subscription_list)
+        responses = handler.read()
+        # initial sample and sync
+        assert next(responses).update
+        assert next(responses).sync_response
+        return handler, responses
+
+    def set_type(self, adapter, value):
+        with adapter.sessions.write_trans() as t:
+            t.set_elem(value, f"{IF_PATH.format(self.IF_NAME)}/type")
+            t.apply()
+
+    def delete_interface(self, adapter):
+        with adapter.sessions.write_trans() as t:
+            t.delete(IF_PATH.format(self.IF_NAME))
+            t.apply()
+
+    @staticmethod
+    def full_paths(notification, paths):
+        return [make_xpath_path(add_path_prefix(p, notification.prefix))
+                for p in paths]
+
+    @pytest.mark.parametrize("leaf", [False, True])
+    def test_subscribe_change(self, adapter, leaf):
+        if_path = f"/ietf-interfaces:interfaces/interface[name={self.IF_NAME}]"
+        path = f"{if_path}/type" if leaf else if_path
+        handler, responses = self.subscribe(adapter, path)
+        try:
+            self.set_type(adapter, "ianaift:fastEther")
+            notification = next(responses).update
+            assert self.full_paths(
+                notification, [u.path for u in notification.update]) == \
+                [f"{if_path}/type"]
+            assert decode_typed_value(notification.update[0].val) == \
+                "iana-if-type:fastEther"
+        finally:
+            handler.stop()
+
+    @pytest.mark.parametrize("leaf", [False, True])
+    def test_subscribe_delete(self, adapter, leaf):
+        if_path = f"/ietf-interfaces:interfaces/interface[name={self.IF_NAME}]"
+        path = f"{if_path}/type" if leaf else if_path
+        handler, responses = self.subscribe(adapter, path)
+        try:
+            self.delete_interface(adapter)
+            notification = next(responses).update
+            assert not notification.update
+            assert self.full_paths(notification, notification.delete) == \
+                [if_path]
+        finally:
+            handler.stop()
+
+    def test_subscribe_other_entry(self, adapter):
+        """ Changes of other list entries are not passed. """
+        if_path = f"/ietf-interfaces:interfaces/interface[name={self.IF_NAME}]"
+        handler, responses = self.subscribe(adapter, f"{if_path}/type")
+        try:
+            with adapter.sessions.write_trans() as t:
+                t.set_elem("ianaift:fastEther", f"{IF_PATH.format('if_1')}/type")
+                t.apply()
+            self.set_type(adapter, "ianaift:fastEther")
+            notification = next(responses).update
+            assert self.full_paths(
+                notification, [u.path for u in notification.update]) == \
+                [f"{if_path}/type"]
+        finally:
+            handler.stop()
+            with adapter.sessions.write_trans() as t:
+                t.set_elem(IF_TYPE, f"{IF_PATH.format('if_1')}/type")
+                t.apply()
+
+    def test_hub_decoder_adapter(self, adapter):
+        """ Changes are not decoded with (pooled) subscriber adapter. """
+        if_path = f"/ietf-interfaces:interfaces/interface[name={self.IF_NAME}]"
+        handler, responses = self.subscribe(adapter, if_path)
+        try:
+            hub = CdbSubscriptionHub.get_hub(adapter.addr, adapter.port)
+            assert hub.decoder.adapter is not adapter
+            assert hub.decoder.adapter is \
+                GnmiConfDApiServerAdapter.get_schema_adapter()
+        finally:
+            handler.stop()
+
+
+@pytest.mark.confd
+class TestApiAdapterSample(InterfaceTestBase):
+    """ Samples are split to notifications of limited size. """
+    IF_COUNT = 20
+    MAX_BYTES = 300
+
+    @pytest.fixture
+    def interfaces(self, adapter):
+        names = [f"gnmi_test_if_{i}" for i in range(self.IF_COUNT)]
+        with adapter.sessions.write_trans() as t:
+            for name in names:
+                t.create(IF_PATH.format(name))
+                t.set_elem(IF_TYPE, f"{IF_PATH.format(name)}/type")
+            t.apply()
+        GnmiServerAdapter.SubscriptionHandler.set_max_notification_bytes(
+            self.MAX_BYTES)
+        yield names
+        GnmiServerAdapter.SubscriptionHandler.set_max_notification_bytes(
+            MAX_NOTIFICATION_BYTES)
+        with adapter.sessions.write_trans() as t:
+            for name in names:
+                t.delete(IF_PATH.format(name))
+            t.apply()
+
+    def test_sample_split(self, adapter, interfaces):
+        subscription_list = gnmi_pb2.SubscriptionList(
+            mode=gnmi_pb2.SubscriptionList.ONCE,
+            encoding=gnmi_pb2.Encoding.JSON_IETF,
+            subscription=[gnmi_pb2.Subscription(
+                path=make_gnmi_path("/ietf-interfaces:interfaces"))])
+        handler = adapter.get_subscription_handler(subscription_list)
+        responses = list(handler.read())
+        assert responses[-1].sync_response
+        notifications = [r.update for r in responses[:-1]]
+        assert len(notifications) > 1
+        assert all(n.ByteSize() <= self.MAX_BYTES for n in notifications)
+        names = [u.path.elem[-1].key.get("name")
+                 for n in notifications for u in n.update]
+        assert set(interfaces) <= set(names)
+
+
+@pytest.mark.confd
+class TestApiAdapterSet(InterfaceTestBase):
+    """ Set of JSON_IETF values (loaded with load_config). """
+    IF_NAMES = ["gnmi_test_if", "gnmi_test_if_2"]
+
+    @pytest.fixture
+    def cleanup(self, adapter):
+        yield
+        with adapter.sessions.write_trans() as t:
+            for name in self.IF_NAMES[1:]:
+                if t.exists(IF_PATH.format(name)):
+                    t.delete(IF_PATH.format(name))
+            t.apply()
+
+    @staticmethod
+    def json_update(path_str, value):
+        return gnmi_pb2.Update(
+            path=make_gnmi_path(path_str),
+            val=gnmi_pb2.TypedValue(json_ietf_val=json.dumps(value).encode()))
+
+    def test_set_list_entries(self, adapter, cleanup):
+        value = {"interface": [{"name": name,
+                                "type": "iana-if-type:fastEther"}
+                               for name in self.IF_NAMES]}
+        prefix = make_gnmi_path("/ietf-interfaces:interfaces")
+        adapter.set(make_gnmi_path("/"),
+                    [self.json_update("/ietf-interfaces:interfaces", value)])
+        for name in self.IF_NAMES:
+            [notification] = adapter.get(
+                prefix, [make_gnmi_path(f"interface[name={name}]/type")],
+                gnmi_pb2.GetRequest.DataType.CONFIG, [])
+            [update] = notification.update
+            assert decode_typed_value(update.val) == "iana-if-type:fastEther"
+
+    def test_set_unknown_key(self, adapter):
+        path = "/ietf-interfaces:interfaces/interface[nam=gnmi_test_if]"
+        with pytest.raises(ValueError):
+            adapter.set(make_gnmi_path("/"), [self.json_update(
+                path, {"type": "iana-if-type:fastEther"})])
+
+    @pytest.mark.parametrize("val", [
+        gnmi_pb2.TypedValue(
+            decimal_val=gnmi_pb2.Decimal64(digits=15, precision=1)),
+        gnmi_pb2.TypedValue(double_val=1.5),
+        gnmi_pb2.TypedValue(float_val=1.5),
+    ])
+    def test_set_number(self, adapter, val):
+        path = f"interface[name={self.IF_NAME}]/description"
+        prefix = make_gnmi_path("/ietf-interfaces:interfaces")
+        adapter.set(prefix, [gnmi_pb2.Update(path=make_gnmi_path(path),
+                                             val=val)])
+        [notification] = adapter.get(prefix, [make_gnmi_path(path)],
+                                     gnmi_pb2.GetRequest.DataType.CONFIG, [])
+        [update] = notification.update
+        assert decode_typed_value(update.val) == "1.5"
+
+    def test_set_unsupported_value(self, adapter):
+        path = f"interface[name={self.IF_NAME}]/description"
+        val = gnmi_pb2.TypedValue(leaflist_val=gnmi_pb2.ScalarArray(
+            element=[gnmi_pb2.TypedValue(string_val="a")]))
+        with pytest.raises(NotImplementedError):
+            adapter.set(make_gnmi_path("/ietf-interfaces:interfaces"),
+                        [gnmi_pb2.Update(path=make_gnmi_path(path), val=val)])
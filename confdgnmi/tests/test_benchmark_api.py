@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+import gnmi_pb2
+from confd_gnmi_api_adapter import GnmiConfDApiServerAdapter
+from confd_gnmi_api_adapter_defaults import ApiAdapterDefaults, GET_MODES
+from confd_gnmi_common import make_gnmi_path
+from utils.utils import log
+
+IF_TYPE = "ianaift:gigabitEthernet"
+BENCH_REPEAT = 3
+
+
+@pytest.mark.benchmark
+@pytest.mark.confd
+@pytest.mark.long
+class TestBenchmarkApi:
+    """
+    Latency of Get of list wildcard paths depending on number of list entries
+    (bulk save of common ancestor vs. save of every entry).
+    """
+
+    @pytest.fixture
+    def adapter(self):
+        adapter = GnmiConfDApiServerAdapter.get_adapter()
+        adapter.connect()
+        yield adapter
+        adapter.close()
+
+    @staticmethod
+    def set_interfaces(adapter, count):
+        with adapter.sessions.write_trans() as t:
+            t.delete("/if:interfaces")
+            for i in range(count):
+                path = f"/if:interfaces/interface{{bench_{i}}}"
+                t.create(path)
+                t.set_elem(IF_TYPE, f"{path}/type")
+            t.apply()
+
+    @staticmethod
+    def timed_get(adapter, paths, bulk_get):
+        GnmiConfDApiServerAdapter.set_bulk_get(bulk_get)
+        prefix = make_gnmi_path("")
+        times = []
+        for _ in range(BENCH_REPEAT):
+            start = time.perf_counter()
+            notifications = adapter.get(prefix, paths,
+                                        gnmi_pb2.GetRequest.DataType.CONFIG,
+                                        [])
+            times.append(time.perf_counter() - start)
+        return min(times), notifications
+
+    @pytest.mark.parametrize("count", [10, 100, 1000, 10000])
+    @pytest.mark.parametrize("path_str", [
+        "ietf-interfaces:interfaces/interface",
+        "ietf-interfaces:interfaces/interface/type"])
+    def test_get_list_latency(self, adapter, count, path_str):
+        self.set_interfaces(adapter, count)
+        paths = [make_gnmi_path(path_str)]
+        try:
+            bulk_time, bulk_notif = self.timed_get(adapter, paths, True)
+            single_time, single_notif = self.timed_get(adapter, paths, False)
+        finally:
+            GnmiConfDApiServerAdapter.set_bulk_get(True)
+            self.set_interfaces(adapter, 0)
+        log.warning("Get %s entries=%d bulk=%.4fs per-entry=%.4fs",
+                    path_str, count, bulk_time, single_time)
+        assert len(bulk_notif[0].update) == count
+        assert list(bulk_notif[0].update) == list(single_notif[0].update)
+
+    @pytest.mark.parametrize("path_str", [
+        "ietf-interfaces:interfaces/interface[name=bench_0]/type",
+        "ietf-interfaces:interfaces/interface[name=bench_0]"])
+    def test_get_entry_latency(self, adapter, path_str):
+        self.set_interfaces(adapter, 1)
+        paths = [make_gnmi_path(path_str)]
+        try:
+            get_time, notif = self.timed_get(adapter, paths, True)
+        finally:
+            self.set_interfaces(adapter, 0)
+        log.warning("Get %s time=%.4fs", path_str, get_time)
+        assert len(notif[0].update) == 1
+
+    @pytest.mark.parametrize("get_mode", GET_MODES)
+    def test_get_paths_latency(self, adapter, get_mode):
+        count = 20
+        self.set_interfaces(adapter, count)
+        paths = [make_gnmi_path(f"ietf-interfaces:interfaces/interface[name=bench_{i}]")
+                 for i in range(count)]
+        GnmiConfDApiServerAdapter.set_get_mode(get_mode)
+        try:
+            get_time, notif = self.timed_get(adapter, paths, True)
+        finally:
+            GnmiConfDApiServerAdapter.set_get_mode(ApiAdapterDefaults.GET_MODE)
+            self.set_interfaces(adapter, 0)
+        log.warning("Get paths=%d mode=%s time=%.4fs", count, get_mode,
+                    get_time)
+        assert len(notif[0].update) == count
@@ -1,4 +1,3 @@
-import socket
 import threading
 from time import sleep
 
@@ -9,7 +8,8 @@ from client_server_test_base import GrpcBase
 from confd_gnmi_api_adapter import GnmiConfDApiServerAdapter
 from confd_gnmi_common import make_gnmi_path, make_xpath_path
 from confd_gnmi_server import AdapterType
-from route_status import RouteData, RouteProvider, ChangeOp
+from route_status import RouteData, RouteProvider, ChangeOp, \
+    ExternalChangeClient
 from utils.utils import log
 
 _confd_DEBUG = 1
@@ -28,34 +28,19 @@ class TestGrpcApi(GrpcBase):
         sleep(sleep_val)
         log.info("==> path_value=%s route_data=%s sleep_val=%s", path_value,
                  route_data, sleep_val)
+        # TODO update route_data
+        client = ExternalChangeClient(
+            port=GnmiConfDApiServerAdapter.external_port)
         for pv_chunk in path_value:
             log.debug("pv_chunk=%s", pv_chunk)
-            msgs = []
-            for pv in pv_chunk:
-                op = ChangeOp.MODIFIED.value
-                xpath = make_xpath_path(pv[0])
-                val_str = pv[1]
-                msg = "{}\n{}\n{}".format(op, xpath, val_str)
-                msgs.append(msg)
-            # TODO update route_data
-            # TODO reuse with route status
-            # TODO port number
-            log.debug("msgs=%s", msg)
-            with socket.socket() as s:
-                try:
-                    s.connect(("localhost",
-                               GnmiConfDApiServerAdapter.external_port))
-                    log.debug("Connected to change server")
-                    msg = ""
-                    for m in msgs:
-                        # log.debug("m=%s", m)
-                        msg += m + '\n'
-                    # remove last \n
-                    msg = msg[:-1]
-                    log.debug("msg=%s", msg)
-                    s.sendall(msg.encode("utf-8"))
-                except Exception:
-                    log.debug("Cannot connect to change server!")
+            changes = [ExternalChangeClient.make_change(
+                ChangeOp.MODIFIED, make_xpath_path(pv[0]), pv[1])
+                for pv in pv_chunk]
+            try:
+                client.send(changes)
+            except OSError:
+                log.debug("Cannot connect to change server!")
+        client.close()
 
         log.info("<==")
 
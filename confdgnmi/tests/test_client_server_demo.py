@@ -13,3 +13,10 @@ class TestGrpcDemo(GrpcBase):
 
     def set_adapter_type(self):
         self.adapter_type = AdapterType.DEMO
+
+
+@pytest.mark.grpc
+@pytest.mark.demo
+@pytest.mark.usefixtures("fix_method")
+class TestGrpcDemoAio(TestGrpcDemo):
+    aio = True
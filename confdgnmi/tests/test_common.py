@@ -1,10 +1,19 @@
+from decimal import Decimal
+
+import grpc
 import pytest
 
+import gnmi_pb2
+
+from confd_gnmi_adapter import GnmiServerAdapter, CHANGE_BUFFER_SIZE, \
+    CHANGE_BUFFER_OVERFLOW, BATCH_MAX_LATENCY, BATCH_MAX_SIZE, MIN_SAMPLE_INTERVAL, \
+    MAX_NOTIFICATION_UPDATES, MAX_NOTIFICATION_BYTES
 from confd_gnmi_api_adapter_defaults import ApiAdapterDefaults
 from confd_gnmi_client import parse_args as client_parse_args
 from confd_gnmi_common import make_name_keys, make_gnmi_path, make_xpath_path, \
-    make_formatted_path
-from confd_gnmi_server import parse_args as server_parse_args
+    make_formatted_path, PathTranslator, decode_typed_value
+from confd_gnmi_server import AdapterType, ConfDgNMIServicer, \
+    parse_args as server_parse_args
 
 
 @pytest.mark.unit
@@ -74,7 +83,9 @@ def test_client_argparse():
                    'prefix': '',
                    'paths': [], 'datatype': 'CONFIG', 'vals': [],
                    'submode': 'ONCE', 'pollcount': 5, 'pollinterval': 0.5,
-                   'readcount': 4})
+                   'readcount': 4, 'sampleinterval': 0.0,
+                   'suppressredundant': False, 'heartbeatinterval': 0.0,
+                   'updatesonly': False, 'encoding': 'JSON_IETF'})
 
     check_in_args(client_parse_args(["-t", "CONFIG"]), {"datatype": "CONFIG"})
     check = [{"dest": "operation", "args": ["-o", "--oper"],
@@ -95,6 +106,12 @@ def test_client_argparse():
               "vals": ["1", "10", "100"]},
              {"dest": "pollinterval", "args": ["--poll-interval"],
               "vals": ["0.1", "0.5", "1.0"]},
+             {"dest": "sampleinterval", "args": ["--sample-interval"],
+              "vals": ["0.5", "10.0"]},
+             {"dest": "heartbeatinterval", "args": ["--heartbeat-interval"],
+              "vals": ["1.0", "60.0"]},
+             {"dest": "encoding", "args": ["--encoding"],
+              "vals": ["JSON", "JSON_IETF", "PROTO"]},
              {"dest": "readcount", "args": ["--read-count"],
               "vals": ["1", "10", "100"]},
              {"dest": "logging", "args": ["--logging"],
@@ -112,6 +129,19 @@ def test_server_argparse():
                    "confd_port": ApiAdapterDefaults.CONFD_PORT,
                    "monitor_external_changes": ApiAdapterDefaults.MONITOR_EXTERNAL_CHANGES,
                    "external_port": ApiAdapterDefaults.EXTERNAL_PORT,
+                   "max_sessions": ApiAdapterDefaults.MAX_SESSIONS,
+                   "read_trans_max_staleness": ApiAdapterDefaults.READ_TRANS_MAX_STALENESS,
+                   "bulk_get": ApiAdapterDefaults.BULK_GET,
+                   "schema_cache_size": ApiAdapterDefaults.SCHEMA_CACHE_SIZE,
+                   "schema_snapshot": ApiAdapterDefaults.SCHEMA_SNAPSHOT,
+                   "get_mode": ApiAdapterDefaults.GET_MODE,
+                   "change_buffer_size": CHANGE_BUFFER_SIZE,
+                   "change_buffer_overflow": CHANGE_BUFFER_OVERFLOW,
+                   "batch_max_latency": BATCH_MAX_LATENCY,
+                   "batch_max_size": BATCH_MAX_SIZE,
+                   "min_sample_interval": MIN_SAMPLE_INTERVAL,
+                   "max_notification_updates": MAX_NOTIFICATION_UPDATES,
+                   "max_notification_bytes": MAX_NOTIFICATION_BYTES,
                    "cfg": None})
 
     check = [{"dest": "type", "args": ["-t", "--type"],
@@ -127,7 +157,168 @@ def test_server_argparse():
               "vals": []},
              {"dest": "external_port", "args": ["--external-port"],
               "vals": [str(ApiAdapterDefaults.EXTERNAL_PORT), "1234"]},
+             {"dest": "max_sessions", "args": ["--max-sessions"],
+              "vals": ["1", "16"]},
+             {"dest": "read_trans_max_staleness",
+              "args": ["--read-trans-max-staleness"],
+              "vals": ["0.0", "2.5"]},
+             {"dest": "schema_cache_size", "args": ["--schema-cache-size"],
+              "vals": ["100", "100000"]},
+             {"dest": "schema_snapshot", "args": ["--schema-snapshot"],
+              "vals": ["", "/tmp/schema.json"]},
+             {"dest": "get_mode", "args": ["--get-mode"],
+              "vals": ["snapshot", "parallel"], "invalid": ["serial"]},
+             {"dest": "change_buffer_size", "args": ["--change-buffer-size"],
+              "vals": ["10", "100000"]},
+             {"dest": "change_buffer_overflow",
+              "args": ["--change-buffer-overflow"],
+              "vals": ["drop-oldest", "resync", "disconnect"],
+              "invalid": ["block"]},
+             {"dest": "batch_max_latency", "args": ["--batch-max-latency"],
+              "vals": ["0.0", "0.5"]},
+             {"dest": "batch_max_size", "args": ["--batch-max-size"],
+              "vals": ["1", "5000"]},
+             {"dest": "min_sample_interval", "args": ["--min-sample-interval"],
+              "vals": ["0.1", "10.0"]},
+             {"dest": "max_notification_updates",
+              "args": ["--max-notification-updates"], "vals": ["0", "100"]},
+             {"dest": "max_notification_bytes",
+              "args": ["--max-notification-bytes"], "vals": ["0", "65536"]},
              {"dest": "logging", "args": ["--logging"],
               "vals": ["error", "warning", "info", "debug"]}, ]
     check_args(check, server_parse_args)
     # TODO more args tests
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("peer, address", [
+    ("ipv4:127.0.0.1:45678", "127.0.0.1"),
+    ("ipv6:[::1]:45678", "[::1]"),
+    ("unix:/tmp/sock", "/tmp/sock"),
+])
+def test_extract_peer_address(peer, address):
+    class Context:
+        def peer(self):
+            return peer
+    assert ConfDgNMIServicer.extract_peer_address(Context()) == address
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("path, translated", [
+    ("/ietf-interfaces:interfaces/interface", "/if:interfaces/interface"),
+    ("/ietf-interfaces:interfaces/interface{eth0}/ietf-ip:ipv4",
+     "/if:interfaces/interface{eth0}/ip:ipv4"),
+    ("ietf-interfaces:interfaces", "if:interfaces"),
+    ("iana-if-type:gigabitEthernet", "ianaift:gigabitEthernet"),
+    ("/unknown:interfaces", "/unknown:interfaces"),
+    ("/x-ietf-interfaces:interfaces", "/x-ietf-interfaces:interfaces"),
+    ("/interface[name=ietf-ip:1]", "/interface[name=ietf-ip:1]"),
+    ("/same:node", "/same:node"),
+])
+def test_path_translator(path, translated):
+    module_to_pfx = {"ietf-interfaces": "if", "ietf-ip": "ip",
+                     "iana-if-type": "ianaift", "same": "same"}
+    translator = PathTranslator(module_to_pfx)
+    assert translator.translate(path) == translated
+    pfx_to_module = {pfx: module for module, pfx in module_to_pfx.items()}
+    if path != translated:
+        assert PathTranslator(pfx_to_module).translate(translated) == path
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("val, value", [
+    (gnmi_pb2.TypedValue(json_ietf_val=b'{"name": "if_1"}'), {"name": "if_1"}),
+    (gnmi_pb2.TypedValue(json_val=b'[1, 2]'), [1, 2]),
+    (gnmi_pb2.TypedValue(string_val="if_1"), "if_1"),
+    (gnmi_pb2.TypedValue(string_val=""), ""),
+    (gnmi_pb2.TypedValue(int_val=-5), -5),
+    (gnmi_pb2.TypedValue(uint_val=2 ** 64 - 1), 2 ** 64 - 1),
+    (gnmi_pb2.TypedValue(bool_val=False), False),
+    (gnmi_pb2.TypedValue(double_val=0.5), 0.5),
+    (gnmi_pb2.TypedValue(decimal_val=gnmi_pb2.Decimal64(digits=-150,
+                                                        precision=2)),
+     Decimal("-1.50")),
+    (gnmi_pb2.TypedValue(leaflist_val=gnmi_pb2.ScalarArray(element=[
+        gnmi_pb2.TypedValue(uint_val=1), gnmi_pb2.TypedValue(string_val="a")])),
+     [1, "a"]),
+    (gnmi_pb2.TypedValue(), None),
+])
+def test_decode_typed_value(val, value):
+    assert decode_typed_value(val) == value
+
+
+@pytest.mark.unit
+def test_capabilities_cached():
+    class Adapter:
+        version = 1
+        calls = 0
+
+        def capabilities_version(self):
+            return self.version
+
+        def capabilities(self):
+            self.calls += 1
+            return [GnmiServerAdapter.CapabilityModel(
+                name="m", organization="", version=str(self.version))]
+
+        def encodings(self):
+            return [gnmi_pb2.Encoding.JSON_IETF]
+
+    adapter = Adapter()
+    servicer = ConfDgNMIServicer(AdapterType.DEMO)
+    servicer.get_connected_adapter = lambda context: adapter
+    request = gnmi_pb2.CapabilityRequest()
+    response = servicer.Capabilities(request, None)
+    assert servicer.Capabilities(request, None) is response
+    assert adapter.calls == 1
+    adapter.version = 2
+    response = servicer.Capabilities(request, None)
+    assert adapter.calls == 2
+    assert response.supported_models[0].version == "2"
+    adapter.version = None
+    servicer.Capabilities(request, None)
+    servicer.Capabilities(request, None)
+    assert adapter.calls == 4
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("val, encoding", [
+    (gnmi_pb2.TypedValue(string_val="a"), gnmi_pb2.Encoding.PROTO),
+    (gnmi_pb2.TypedValue(decimal_val=gnmi_pb2.Decimal64(digits=15,
+                                                        precision=1)),
+     gnmi_pb2.Encoding.PROTO),
+    (gnmi_pb2.TypedValue(double_val=1.5), gnmi_pb2.Encoding.PROTO),
+    (gnmi_pb2.TypedValue(json_ietf_val=b'"a"'), gnmi_pb2.Encoding.JSON_IETF),
+])
+def test_get_val_encoding(val, encoding):
+    assert ConfDgNMIServicer.get_val_encoding(val) == encoding
+
+
+@pytest.mark.unit
+def test_set_unimplemented():
+    class Adapter:
+        def encodings(self):
+            return [gnmi_pb2.Encoding.PROTO]
+
+        def set_request(self, prefix, delete, replace, update):
+            raise NotImplementedError("unsupported value")
+
+    class Context:
+        code = details = None
+
+        def set_code(self, code):
+            self.code = code
+
+        def set_details(self, details):
+            self.details = details
+
+    servicer = ConfDgNMIServicer(AdapterType.DEMO)
+    servicer.get_connected_adapter = lambda context: Adapter()
+    context = Context()
+    request = gnmi_pb2.SetRequest(update=[gnmi_pb2.Update(
+        path=make_gnmi_path("/a"), val=gnmi_pb2.TypedValue(
+            leaflist_val=gnmi_pb2.ScalarArray(
+                element=[gnmi_pb2.TypedValue(string_val="a")])))])
+    with pytest.raises(NotImplementedError):
+        servicer.Set(request, context)
+    assert context.code == grpc.StatusCode.UNIMPLEMENTED